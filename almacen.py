@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Almacén en disco de volúmenes y mallas, compartido entre los procesos del
+servidor (por ejemplo, los workers de gunicorn) y persistente entre
+despliegues.
+
+Los volúmenes se guardan en una base SQLite y cada malla en dos archivos
+.npy (los ejes y los valores de z), con el nombre derivado de un hash de la
+expresión canónica, el dominio y la resolución. Las mallas se leen con
+np.load(mmap_mode='r'): no se copian a memoria y todos los procesos
+comparten las páginas del sistema operativo. Cuando las mallas superan el
+presupuesto en bytes se borran las usadas hace más tiempo.
+
+ResultCache (cache.py) lo usa como segundo nivel detrás de su caché en
+memoria. Para precalcular los ejemplos de la interfaz web y de ejemplos.py:
+
+    python almacen.py warm-up /var/cache/calculadora
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from html.parser import HTMLParser
+
+import numpy as np
+
+
+# Volúmenes que se guardan como máximo (cada fila ocupa unos cien bytes)
+MAX_VOLUMES = 100_000
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS volumes (
+    key TEXT PRIMARY KEY, volume REAL, error REAL, method TEXT, used REAL);
+CREATE TABLE IF NOT EXISTS grids (
+    key TEXT PRIMARY KEY, nbytes INTEGER, used REAL);
+CREATE INDEX IF NOT EXISTS grids_used ON grids (used);
+CREATE INDEX IF NOT EXISTS volumes_used ON volumes (used);
+"""
+
+
+def _hash(clave):
+    """
+    Hash de una clave de ResultCache: (expresión, a, b, c, d) o
+    (expresión, a, b, c, d, resolución). El dominio se normaliza a float
+    para que -2 y -2.0 den el mismo hash.
+    """
+    expresion, dominio, resto = clave[0], clave[1:5], clave[5:]
+    texto = repr((expresion,) + tuple(float(v) for v in dominio) + tuple(int(v) for v in resto))
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+class DiskStore:
+    """
+    Volúmenes en SQLite y mallas en archivos .npy dentro de un directorio.
+    Es seguro entre hilos y entre procesos; los errores de disco se tratan
+    como fallos de la caché y nunca interrumpen un cálculo.
+    """
+
+    def __init__(self, directorio, max_bytes=512 * 2**20, max_volumes=MAX_VOLUMES):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_volumes = max_volumes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._mallas = os.path.join(directorio, 'grids')
+        os.makedirs(self._mallas, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._pid = None
+
+    def _db(self):
+        """Conexión a la base, abierta de nuevo en cada proceso hijo."""
+        if self._pid != os.getpid():
+            self._conexion = sqlite3.connect(os.path.join(self.directorio, 'volumes.sqlite'),
+                                             timeout=30, check_same_thread=False,
+                                             isolation_level=None)
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.executescript(_ESQUEMA)
+            self._pid = os.getpid()
+        return self._conexion
+
+    def _archivos(self, nombre):
+        base = os.path.join(self._mallas, nombre)
+        return base + '.xy.npy', base + '.z.npy'
+
+    def get_volume(self, clave):
+        """(volumen, error, método) guardado para la clave, o None."""
+        nombre = _hash(clave)
+        try:
+            with self._lock:
+                db = self._db()
+                fila = db.execute('SELECT volume, error, method FROM volumes WHERE key = ?',
+                                  (nombre,)).fetchone()
+                if fila is not None:
+                    db.execute('UPDATE volumes SET used = ? WHERE key = ?', (time.time(), nombre))
+        except sqlite3.Error:
+            fila = None
+        self._contar(fila is not None)
+        return fila
+
+    def put_volume(self, clave, volumen):
+        """Guarda (volumen, error, método), descartando los más antiguos si
+        se supera max_volumes."""
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute('INSERT OR REPLACE INTO volumes VALUES (?, ?, ?, ?, ?)',
+                           (_hash(clave), float(volumen[0]), float(volumen[1]), volumen[2],
+                            time.time()))
+                sobrantes = db.execute('SELECT COUNT(*) FROM volumes').fetchone()[0] - self.max_volumes
+                if sobrantes > 0:
+                    db.execute('DELETE FROM volumes WHERE key IN '
+                               '(SELECT key FROM volumes ORDER BY used LIMIT ?)', (sobrantes,))
+                    self.evictions += sobrantes
+        except sqlite3.Error:
+            pass
+
+    def get_grid(self, clave):
+        """
+        Malla guardada para la clave, mapeada en memoria y de solo lectura.
+
+        Returns:
+            tuple: (x, y, Z), o None si no está guardada
+        """
+        nombre = _hash(clave)
+        malla = None
+        try:
+            with self._lock:
+                db = self._db()
+                if db.execute('SELECT 1 FROM grids WHERE key = ?', (nombre,)).fetchone():
+                    db.execute('UPDATE grids SET used = ? WHERE key = ?', (time.time(), nombre))
+                    ruta_ejes, ruta_z = self._archivos(nombre)
+                    try:
+                        ejes = np.load(ruta_ejes, mmap_mode='r')
+                        Z = np.load(ruta_z, mmap_mode='r')
+                        # Vistas ndarray (no np.memmap) de los mismos datos
+                        malla = np.asarray(ejes[0]), np.asarray(ejes[1]), np.asarray(Z)
+                    except (OSError, ValueError):
+                        # Archivos borrados por otro proceso o incompletos
+                        db.execute('DELETE FROM grids WHERE key = ?', (nombre,))
+        except sqlite3.Error:
+            malla = None
+        self._contar(malla is not None)
+        return malla
+
+    def put_grid(self, clave, x, y, Z):
+        """Guarda la malla y borra las usadas hace más tiempo si se supera
+        max_bytes."""
+        nombre = _hash(clave)
+        nbytes = 2 * x.nbytes + Z.nbytes
+        if nbytes > self.max_bytes or len(x) != len(y):
+            return
+        try:
+            # Escritura atómica: un archivo temporal que luego se renombra
+            for ruta, array in zip(self._archivos(nombre), (np.stack([x, y]), Z)):
+                temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(temporal, 'wb') as archivo:
+                    np.save(archivo, np.ascontiguousarray(array))
+                os.replace(temporal, ruta)
+            with self._lock:
+                db = self._db()
+                db.execute('INSERT OR REPLACE INTO grids VALUES (?, ?, ?)',
+                           (nombre, nbytes, time.time()))
+                self._expulsar(db)
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _expulsar(self, db):
+        total = db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM grids').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for nombre, nbytes in db.execute('SELECT key, nbytes FROM grids ORDER BY used').fetchall():
+            db.execute('DELETE FROM grids WHERE key = ?', (nombre,))
+            for ruta in self._archivos(nombre):
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+            self.evictions += 1
+            total -= nbytes
+            if total <= self.max_bytes:
+                break
+
+    def _contar(self, acierto):
+        with self._lock:
+            if acierto:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            for (nombre,) in db.execute('SELECT key FROM grids').fetchall():
+                for ruta in self._archivos(nombre):
+                    try:
+                        os.remove(ruta)
+                    except FileNotFoundError:
+                        pass
+            db.execute('DELETE FROM grids')
+            db.execute('DELETE FROM volumes')
+
+    def stats(self):
+        """Volúmenes y mallas guardados, bytes en disco y contadores de este proceso."""
+        with self._lock:
+            db = self._db()
+            volumenes = db.execute('SELECT COUNT(*) FROM volumes').fetchone()[0]
+            mallas, nbytes = db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM grids').fetchone()
+            return {
+                'volumes': volumenes,
+                'grids': mallas,
+                'bytes': nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def store_from_env():
+    """
+    Crea el almacén de las aplicaciones web según variables de entorno:
+
+    - CALCULADORA_STORE_DIR: directorio del almacén (sin definir, no se
+      usa almacén en disco)
+    - CALCULADORA_STORE_MB: presupuesto para las mallas en MB (por
+      defecto 512)
+
+    Returns:
+        DiskStore, o None si no está configurado
+    """
+    directorio = os.environ.get('CALCULADORA_STORE_DIR')
+    if not directorio:
+        return None
+    return DiskStore(directorio, max_bytes=int(os.environ.get('CALCULADORA_STORE_MB', 512)) * 2**20)
+
+
+class _BotonesEjemplo(HTMLParser):
+    """Atributos data-* de los botones class="btn-example" de una plantilla."""
+
+    def __init__(self):
+        super().__init__()
+        self.botones = []
+
+    def handle_starttag(self, tag, attrs):
+        atributos = dict(attrs)
+        if 'btn-example' in (atributos.get('class') or '').split():
+            self.botones.append(atributos)
+
+
+def presets():
+    """
+    Ejemplos de la interfaz web (botones btn-example de
+    webapp/templates/index.html) y de ejemplos.py, sin repetir.
+
+    Returns:
+        list de (función, (a, b, c, d))
+    """
+    from ejemplos import EJEMPLOS
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    lector = _BotonesEjemplo()
+    with open(os.path.join(raiz, 'webapp', 'templates', 'index.html'), encoding='utf-8') as archivo:
+        lector.feed(archivo.read())
+
+    encontrados = [(boton['data-func'], tuple(float(boton[f'data-{k}']) for k in 'abcd'))
+                   for boton in lector.botones]
+    encontrados += [(ejemplo['func'], tuple(float(v) for v in ejemplo['dominio']))
+                    for ejemplo in EJEMPLOS]
+    return list(dict.fromkeys(encontrados))
+
+
+def warm_up(store, resolutions=(50,), levels=range(4)):
+    """
+    Precalcula en el almacén el volumen, las mallas de las resoluciones
+    dadas y los niveles de la pirámide de cada ejemplo (ver presets).
+
+    Returns:
+        list de (función, dominio, volumen, método)
+    """
+    from cache import ResultCache
+    from nucleo import parse_function
+
+    cache = ResultCache(store=store)
+    resultados = []
+    for func_str, (a, b, c, d) in presets():
+        func = parse_function(func_str)
+        volume, _, volume_method = cache.volume(func, a, b, c, d)
+        for resolucion in resolutions:
+            cache.surface(func, a, b, c, d, resolucion)
+        for nivel in levels:
+            cache.level(func, a, b, c, d, nivel)
+        resultados.append((func_str, (a, b, c, d), volume, volume_method))
+    return resultados
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Almacén en disco de la calculadora 3D')
+    parser.add_argument('comando', choices=['warm-up', 'stats', 'clear'])
+    parser.add_argument('directorio', nargs='?', default=os.environ.get('CALCULADORA_STORE_DIR'),
+                        help='directorio del almacén (por defecto, CALCULADORA_STORE_DIR)')
+    parser.add_argument('--resolution', type=int, action='append',
+                        help='resolución de las mallas a precalcular (por defecto 50)')
+    argumentos = parser.parse_args()
+    if not argumentos.directorio:
+        parser.error('indique el directorio o defina CALCULADORA_STORE_DIR')
+
+    store = DiskStore(argumentos.directorio,
+                      max_bytes=int(os.environ.get('CALCULADORA_STORE_MB', 512)) * 2**20)
+    if argumentos.comando == 'warm-up':
+        for func_str, (a, b, c, d), volume, volume_method in warm_up(
+                store, resolutions=argumentos.resolution or (50,)):
+            dominio = f"[{a:g}, {b:g}] x [{c:g}, {d:g}]"
+            print(f"{func_str:<24} {dominio:<32} {volume:>14.8f} ({volume_method})")
+    elif argumentos.comando == 'clear':
+        store.clear()
+    print(store.stats())
+
+
+if __name__ == '__main__':
+    main()
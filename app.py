@@ -1,18 +1,58 @@
 #!/usr/bin/env python3
 """
 Aplicación web Flask para el Visualizador 3D y Calculadora de Volumen.
-Expone la funcionalidad de calculadora_3d.py a través de una interfaz web.
+Expone la funcionalidad de calculadora_3d.py (núcleo numérico en nucleo.py)
+a través de una interfaz web.
 """
 
-from flask import Flask, render_template, request, jsonify
+import os
+
+import json
+from contextlib import contextmanager
+
+from flask import Flask, Response, render_template, request, jsonify
 import numpy as np
-from calculadora_3d import parse_function, calculate_volume
+from nucleo import level_points, max_level, parse_function, validate_job
+from cache import ResultCache
+from almacen import store_from_env
+from ejecutor import JobCancelledError, JobTimeoutError, PoolFullError, cancellable, pool_from_env
+from serializacion import encode_grid, encode_mesh, encode_stream_record
+from mallado import adaptive_mesh
+from teselas import TileCache
+import tiempos
 
 app = Flask(__name__)
 
 # Límite máximo de resolución para evitar payloads enormes
 MAX_RESOLUTION = 150
 
+# Formatos de la malla en la respuesta de /calculate
+RESPONSE_FORMATS = ('json', 'base64', 'ndjson', 'mesh')
+
+# Con format='ndjson' la malla se envía por bandas y no se guarda completa
+# en memoria, por lo que admite una resolución mayor
+MAX_STREAM_RESOLUTION = 1000
+
+# Nivel más fino de la pirámide de resoluciones (parámetro level de
+# /calculate) dentro de MAX_RESOLUTION
+MAX_LEVEL = max_level(MAX_RESOLUTION)
+
+# Máximo de trabajos por request en /calculate/batch
+MAX_BATCH_JOBS = 100
+
+# Caché de resultados (presupuesto de memoria para mallas en MB), con el
+# almacén en disco compartido entre procesos si está configurado (ver
+# almacen.store_from_env)
+CACHE_MB = int(os.environ.get('CALCULADORA_CACHE_MB', 64))
+result_cache = ResultCache(grid_bytes=CACHE_MB * 2**20, store=store_from_env())
+
+# Caché de teselas para /calculate/tiles (presupuesto en MB)
+TILE_CACHE_MB = int(os.environ.get('CALCULADORA_TILE_CACHE_MB', 16))
+tile_cache = TileCache(max_bytes=TILE_CACHE_MB * 2**20)
+
+# Pool de procesos para los cálculos (ver ejecutor.pool_from_env)
+calculation_pool = pool_from_env()
+
 
 @app.route('/')
 def index():
@@ -23,6 +63,7 @@ def index():
 
 
 @app.route('/calculate', methods=['POST'])
+@tiempos.timed_view
 def calculate():
     """
     Ruta POST que recibe datos del formulario, calcula el volumen
@@ -32,83 +73,339 @@ def calculate():
     - function: string con la función z = f(x,y)
     - a, b, c, d: floats con los límites del dominio
     - resolution: int con el número de puntos para el gráfico
+    - level (opcional, reemplaza a resolution): nivel de la pirámide de
+      resoluciones, de 0 (17 puntos) a MAX_LEVEL; cada nivel duplica la
+      resolución del anterior reutilizando sus puntos ya evaluados
+    - format (opcional): 'json' (por defecto), 'base64', 'ndjson' o 'mesh'
+    - debug_timings (opcional): si es true, la respuesta incluye los
+      tiempos por etapa (todas salvo 'json') y los contadores de
+      evaluaciones; el encabezado Server-Timing los incluye siempre
     
     Retorna JSON con:
     - volume: volumen calculado
     - error: error estimado
-    - x, y, z: arrays para el gráfico 3D (listas)
+    - volume_method: 'symbolic' si el volumen se obtuvo en forma cerrada,
+      'grid' si se obtuvo de la propia malla, 'separable' si se obtuvo
+      con integrales de una variable, o el método de integración usado
+      como respaldo
+    - x, y, z: arrays para el gráfico 3D. Con format='json' son listas
+      anidadas de resolution x resolution; con format='base64' x e y son
+      los ejes 1-D y z es un objeto {dtype, shape, data} con los valores
+      float32 codificados en base64 (ver serializacion.py)
+    - format: formato usado para x, y, z
+    - level, max_level: nivel devuelto y nivel más fino disponible (solo
+      si se pidió level)
     - success: bool indicando éxito
     - message: mensaje de error en caso de fallo
+    
+    Con format='ndjson' (hasta MAX_STREAM_RESOLUTION) la respuesta es un
+    stream NDJSON que se escribe a medida que se evalúa la malla:
+    - {type: 'grid', x, y}: ejes 1-D
+    - {type: 'band', row, z}: filas row, row + 1, ... de z en base64
+    - {type: 'volume', success, volume, error, volume_method, message}
+    - {type: 'error', success: false, message} si el cálculo falla a mitad
+    
+    Con format='mesh' la superficie se muestrea de forma adaptativa (ver
+    mallado.py), evaluando a lo sumo resolution x resolution puntos, y en
+    lugar de x, y, z se devuelve mesh: vértices x, y, z (float32) y caras
+    (índices int32 n x 3), en base64, para un gráfico mesh3d.
     """
     try:
-        # Obtener datos del request
-        data = request.get_json()
-        
-        # Validar que se recibieron todos los campos
-        required_fields = ['function', 'a', 'b', 'c', 'd', 'resolution']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'message': f'Falta el campo requerido: {field}'
-                }), 400
-        
-        # Extraer y validar parámetros
-        func_str = data['function'].strip()
-        if not func_str:
-            return jsonify({
-                'success': False,
-                'message': 'La función no puede estar vacía'
-            }), 400
-        
         try:
-            a = float(data['a'])
-            b = float(data['b'])
-            c = float(data['c'])
-            d = float(data['d'])
-            resolution = int(data['resolution'])
-        except (ValueError, TypeError) as e:
+            data = request.get_json()
+            params = parse_calculate_request(data)
+            if params['format'] == 'ndjson':
+                return Response(stream_surface_ndjson(params['func'], *params['domain'],
+                                                      params['resolution']),
+                                mimetype='application/x-ndjson')
+            resultado = compute_calculation(params)
+            if data.get('debug_timings'):
+                resultado['debug_timings'] = tiempos.current().as_dict()
+            with tiempos.stage('json'):
+                return jsonify(resultado)
+        except CalculateError as e:
             return jsonify({
                 'success': False,
-                'message': f'Error en los parámetros numéricos: {str(e)}'
-            }), 400
+                'message': e.message
+            }), e.status, e.headers
         
-        # Validar dominio
-        if a >= b:
-            return jsonify({
-                'success': False,
-                'message': 'Debe cumplirse a < b'
-            }), 400
-        
-        if c >= d:
-            return jsonify({
-                'success': False,
-                'message': 'Debe cumplirse c < d'
-            }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error inesperado: {str(e)}'
+        }), 500
+
+
+class CalculateError(Exception):
+    """
+    Error de /calculate con el mensaje para el cliente, el código HTTP y
+    los encabezados adicionales de la respuesta.
+    """
+    
+    def __init__(self, message, status=400, headers=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.headers = headers or {}
+
+
+def parse_calculate_request(data):
+    """
+    Valida el cuerpo JSON de /calculate, parsea la función y la evalúa en
+    un punto de prueba.
+    
+    Returns:
+        dict con 'func', 'domain' (a, b, c, d), 'resolution', 'level' (o
+        None) y 'format'
+    
+    Raises:
+        CalculateError: con el motivo (código 400) si el request no es válido
+    """
+    if not isinstance(data, dict):
+        raise CalculateError('Se espera un objeto JSON')
+    
+    # Validar que se recibieron todos los campos
+    required_fields = ['function', 'a', 'b', 'c', 'd']
+    if data.get('level') is None:
+        required_fields.append('resolution')
+    for field in required_fields:
+        if field not in data:
+            raise CalculateError(f'Falta el campo requerido: {field}')
+    
+    # Extraer y validar parámetros
+    func_str = data['function'].strip()
+    if not func_str:
+        raise CalculateError('La función no puede estar vacía')
+    
+    try:
+        a = float(data['a'])
+        b = float(data['b'])
+        c = float(data['c'])
+        d = float(data['d'])
+        level = int(data['level']) if data.get('level') is not None else None
+        resolution = int(data['resolution']) if level is None else None
+    except (ValueError, TypeError) as e:
+        raise CalculateError(f'Error en los parámetros numéricos: {str(e)}')
+    
+    # Validar dominio
+    if a >= b:
+        raise CalculateError('Debe cumplirse a < b')
+    if c >= d:
+        raise CalculateError('Debe cumplirse c < d')
+    
+    # Validar formato de la respuesta
+    response_format = data.get('format', 'json')
+    if response_format not in RESPONSE_FORMATS:
+        raise CalculateError(f'Formato no soportado: {response_format}')
+    
+    # Validar nivel de la pirámide, que determina la resolución
+    if level is not None:
+        if response_format == 'ndjson':
+            raise CalculateError('El parámetro level no se admite con format=ndjson')
+        if not 0 <= level <= MAX_LEVEL:
+            raise CalculateError(f'El nivel debe estar entre 0 y {MAX_LEVEL}')
+        resolution = level_points(level)
+    
+    # Validar resolución
+    if resolution < 10:
+        raise CalculateError('La resolución debe ser al menos 10')
+    
+    max_resolution = MAX_STREAM_RESOLUTION if response_format == 'ndjson' else MAX_RESOLUTION
+    if resolution > max_resolution:
+        raise CalculateError(f'La resolución máxima permitida es {max_resolution}')
+    
+    # Parsear la función
+    try:
+        with tiempos.stage('parse'):
+            func = parse_function(func_str)
+    except Exception as e:
+        raise CalculateError(f'Error al parsear la función: {str(e)}')
+    
+    # Validar función con un punto de prueba
+    try:
+        with tiempos.stage('probe'):
+            test_val = func((a + b) / 2, (c + d) / 2)
+    except Exception as e:
+        raise CalculateError(f'Error al evaluar la función: {str(e)}')
+    if not np.isfinite(test_val):
+        raise CalculateError('La función produce valores no finitos en el dominio')
+    
+    return {'func': func, 'domain': (a, b, c, d), 'resolution': resolution,
+            'level': level, 'format': response_format}
+
+
+def compute_calculation(params, cancel=None):
+    """
+    Calcula la respuesta de /calculate (salvo format='ndjson', ver
+    stream_surface_ndjson) para los parámetros de parse_calculate_request.
+    
+    Args:
+        params: dict de parse_calculate_request
+        cancel: threading.Event opcional; al activarlo se terminan los
+            trabajos en curso en el pool de procesos (ver
+            ejecutor.cancellable). Lo que se calcula en el propio hilo no
+            se interrumpe
+    
+    Returns:
+        dict con el cuerpo JSON de la respuesta exitosa
+    
+    Raises:
+        CalculateError: 503 si el pool está lleno, 504 si el cálculo excede
+        el tiempo límite, 500 si falla y 400 si hay valores no finitos
+        JobCancelledError: si se activó cancel durante un trabajo del pool
+    """
+    func, (a, b, c, d) = params['func'], params['domain']
+    resolution, level = params['resolution'], params['level']
+    response_format = params['format']
+    
+    if response_format == 'mesh':
+        with cancellable(cancel), _calculation_errors():
+            with tiempos.stage('grid'):
+                malla = adaptive_mesh(func, a, b, c, d, max_points=resolution**2)
+            tiempos.count('points', len(malla['z']))
+            volume, error, volume_method = result_cache.volume(func, a, b, c, d,
+                                                               pool=calculation_pool)
         
-        # Validar resolución
-        if resolution < 10:
-            return jsonify({
-                'success': False,
-                'message': 'La resolución debe ser al menos 10'
-            }), 400
+        if not np.all(np.isfinite(malla['z'])):
+            raise CalculateError('La función produce valores no finitos (infinito o NaN) en el dominio')
         
-        if resolution > MAX_RESOLUTION:
+        with tiempos.stage('serialization'):
+            mesh = encode_mesh(malla['x'], malla['y'], malla['z'], malla['faces'])
+        return {
+            'success': True,
+            'volume': float(volume),
+            'error': float(error),
+            'mesh': mesh,
+            'format': response_format,
+            'volume_method': volume_method,
+            'message': 'Cálculo completado exitosamente'
+        }
+    
+    # Generar la malla del gráfico y calcular el volumen sobre ella
+    # (la función se evalúa una sola vez y solo se recurre a la
+    # integración adaptativa si la estimación no es suficiente). Los
+    # resultados se reutilizan desde la caché cuando es posible; los
+    # niveles de la pirámide se refinan a partir del nivel anterior.
+    with cancellable(cancel), _calculation_errors():
+        if level is not None:
+            superficie = result_cache.level(func, a, b, c, d, level,
+                                            pool=calculation_pool)
+        else:
+            superficie = result_cache.surface(func, a, b, c, d, resolution,
+                                              pool=calculation_pool)
+    
+    volume, error = superficie['volume'], superficie['error']
+    
+    # Verificar que no haya valores infinitos o NaN
+    if not np.all(np.isfinite(superficie['z'])):
+        raise CalculateError('La función produce valores no finitos (infinito o NaN) en el dominio')
+    
+    # Serializar la malla: ejes 1-D + buffer binario, o listas anidadas
+    try:
+        with tiempos.stage('serialization'):
+            if response_format == 'base64':
+                grid = encode_grid(superficie['x'], superficie['y'], superficie['z'])
+            else:
+                X, Y = np.meshgrid(superficie['x'], superficie['y'], copy=False)
+                grid = {
+                    'x': X.tolist(),
+                    'y': Y.tolist(),
+                    'z': superficie['z'].tolist()
+                }
+    except Exception as e:
+        raise CalculateError(f'Error al generar datos del gráfico: {str(e)}', 500)
+    
+    return {
+        'success': True,
+        'volume': float(volume),
+        'error': float(error),
+        **grid,
+        'format': response_format,
+        **({'level': level, 'max_level': MAX_LEVEL} if level is not None else {}),
+        'volume_method': superficie['volume_method'],
+        'message': 'Cálculo completado exitosamente'
+    }
+
+
+@contextmanager
+def _calculation_errors():
+    """Convierte los errores del cálculo en CalculateError (503, 504 o 500)."""
+    try:
+        yield
+    except PoolFullError:
+        raise CalculateError('El servidor está ocupado, intente de nuevo en unos segundos',
+                             503, {'Retry-After': '5'})
+    except JobTimeoutError as e:
+        raise CalculateError(str(e), 504)
+    except (CalculateError, JobCancelledError):
+        raise
+    except Exception as e:
+        raise CalculateError(f'Error al calcular el volumen: {str(e)}', 500)
+
+
+def stream_surface_ndjson(func, a, b, c, d, resolution):
+    """
+    Genera las líneas NDJSON de /calculate con format='ndjson': la malla
+    por bandas a medida que se evalúa y el volumen en el último registro.
+    """
+    try:
+        for registro in result_cache.stream_surface(func, a, b, c, d, resolution,
+                                                    pool=calculation_pool):
+            if registro['type'] == 'band' and not np.all(np.isfinite(registro['z'])):
+                yield encode_stream_record({
+                    'type': 'error',
+                    'success': False,
+                    'message': 'La función produce valores no finitos (infinito o NaN) en el dominio'
+                })
+                return
+            if registro['type'] == 'volume':
+                registro.update(success=True, message='Cálculo completado exitosamente')
+            yield encode_stream_record(registro)
+    except Exception as e:
+        yield encode_stream_record({
+            'type': 'error',
+            'success': False,
+            'message': f'Error al calcular el volumen: {str(e)}'
+        })
+
+
+@app.route('/calculate/tiles', methods=['POST'])
+def calculate_tiles():
+    """
+    Ruta POST para acercar o desplazar la vista: calcula la malla y el
+    volumen a partir de la caché de teselas (ver teselas.py), de modo que
+    los dominios que se solapan con otros ya pedidos solo calculan las
+    teselas nuevas.
+    
+    Espera JSON con:
+    - function: string con la función z = f(x,y)
+    - a, b, c, d: floats con los límites del dominio
+    
+    Retorna JSON con:
+    - volume, error: volumen (suma de las integrales de las teselas) y error
+    - x, y, z: ejes 1-D de los nodos de la retícula dentro del dominio y
+      z en base64 (como con format='base64' en /calculate)
+    - volume_method: 'tiles'
+    - tiles: teselas usadas ('total', 'cached', 'computed', 'composed',
+      'refined') y trozos de borde ('partial', 'partial_cached')
+    - success, message: como en /calculate
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
             return jsonify({
                 'success': False,
-                'message': f'La resolución máxima permitida es {MAX_RESOLUTION}'
+                'message': 'Se espera un objeto JSON'
             }), 400
-        
-        # Parsear la función
         try:
-            func = parse_function(func_str)
-        except Exception as e:
+            expresion, (a, b, c, d) = validate_job(data)
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'message': f'Error al parsear la función: {str(e)}'
+                'message': str(e)
             }), 400
         
-        # Validar función con un punto de prueba
+        func = parse_function(expresion)
         try:
             test_val = func((a + b) / 2, (c + d) / 2)
             if not np.isfinite(test_val):
@@ -122,48 +419,27 @@ def calculate():
                 'message': f'Error al evaluar la función: {str(e)}'
             }), 400
         
-        # Calcular volumen
         try:
-            volume, error = calculate_volume(func, a, b, c, d)
-        except Exception as e:
-            return jsonify({
-                'success': False,
-                'message': f'Error al calcular el volumen: {str(e)}'
-            }), 500
-        
-        # Generar datos para el gráfico 3D
-        try:
-            x = np.linspace(a, b, resolution)
-            y = np.linspace(c, d, resolution)
-            X, Y = np.meshgrid(x, y)
-            Z = func(X, Y)
-            
-            # Verificar que no haya valores infinitos o NaN
-            if not np.all(np.isfinite(Z)):
-                return jsonify({
-                    'success': False,
-                    'message': 'La función produce valores no finitos (infinito o NaN) en el dominio'
-                }), 400
-            
-            # Convertir a listas para serialización JSON
-            x_list = X.tolist()
-            y_list = Y.tolist()
-            z_list = Z.tolist()
-            
-        except Exception as e:
+            with _calculation_errors():
+                try:
+                    superficie = tile_cache.surface(func, a, b, c, d, pool=calculation_pool)
+                except ValueError as e:
+                    # Valores no finitos o dominio fuera de la retícula de teselas
+                    raise CalculateError(str(e))
+        except CalculateError as e:
             return jsonify({
                 'success': False,
-                'message': f'Error al generar datos del gráfico: {str(e)}'
-            }), 500
+                'message': e.message
+            }), e.status, e.headers
         
-        # Retornar resultados
         return jsonify({
             'success': True,
-            'volume': float(volume),
-            'error': float(error),
-            'x': x_list,
-            'y': y_list,
-            'z': z_list,
+            'volume': superficie['volume'],
+            'error': superficie['error'],
+            **encode_grid(superficie['x'], superficie['y'], superficie['z']),
+            'format': 'base64',
+            'volume_method': superficie['volume_method'],
+            'tiles': superficie['tiles'],
             'message': 'Cálculo completado exitosamente'
         })
         
@@ -174,5 +450,62 @@ def calculate():
         }), 500
 
 
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_batch():
+    """
+    Ruta POST que calcula el volumen de varias combinaciones de función y
+    dominio en un solo request (sin mallas).
+    
+    Espera JSON con:
+    - jobs: lista de objetos con function, a, b, c, d
+    
+    Retorna un stream NDJSON (una línea JSON por trabajo, en el orden en
+    que terminan) con:
+    - index: posición del trabajo en la lista
+    - success: bool indicando éxito de ese trabajo
+    - volume, error, volume_method, cached: en caso de éxito
+    - message: mensaje de error en caso de fallo
+    
+    Las expresiones repetidas se compilan una sola vez y los trabajos se
+    reparten entre los procesos del pool; el error de un trabajo no afecta
+    a los demás.
+    """
+    data = request.get_json(silent=True)
+    jobs = data.get('jobs') if isinstance(data, dict) else None
+    if not isinstance(jobs, list):
+        return jsonify({
+            'success': False,
+            'message': 'Se espera un objeto JSON con la lista de trabajos en "jobs"'
+        }), 400
+    
+    if len(jobs) > MAX_BATCH_JOBS:
+        return jsonify({
+            'success': False,
+            'message': f'El máximo de trabajos por request es {MAX_BATCH_JOBS}'
+        }), 400
+    
+    if calculation_pool is not None:
+        resultados = result_cache.volume_batch(jobs, executor=calculation_pool,
+                                               max_workers=calculation_pool.processes)
+    else:
+        resultados = result_cache.volume_batch(jobs, max_workers=1)
+    
+    def generar():
+        for resultado in resultados:
+            yield json.dumps(resultado) + '\n'
+    
+    return Response(generar(), mimetype='application/x-ndjson')
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    """
+    Ruta GET con los contadores de la caché de resultados
+    (aciertos, fallos, expulsiones y memoria usada) y de los cálculos
+    compartidos entre requests simultáneos.
+    """
+    return jsonify({**result_cache.stats(), 'tiles': tile_cache.stats()})
+
+
 if __name__ == '__main__':
     app.run(debug=True)
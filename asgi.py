@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Punto de entrada ASGI (asyncio) con el mismo contrato de /calculate que
+app.py, para servidores como uvicorn o hypercorn:
+
+    uvicorn asgi:app --workers 4
+
+La validación y el cálculo son los de app.py (parse_calculate_request,
+compute_calculation y stream_surface_ndjson) y comparten sus cachés y su
+pool de procesos. Lo que cambia es cómo se atienden los requests:
+
+- El parseo, la integración y la evaluación de la malla se ejecutan en un
+  pool de hilos, sin bloquear el event loop.
+- Los requests idénticos que llegan mientras otro igual está en curso
+  (misma expresión normalizada, dominio, resolución o nivel y formato)
+  esperan ese mismo cálculo en lugar de repetirlo.
+- Si el cliente se desconecta, se deja de esperar su cálculo, que se
+  cancela si nadie más lo espera: si todavía no empezó, no se ejecuta, y
+  si ya empezó se terminan sus trabajos en el pool de procesos (ver
+  ejecutor.cancellable). Lo que un hilo calcula por sí mismo (sin pool)
+  no se puede interrumpir: termina y su resultado se descarta. Con
+  format='ndjson' se deja de evaluar en la siguiente banda.
+
+Como en app.py, las respuestas de /calculate llevan el encabezado
+Server-Timing y, con debug_timings, los tiempos en el cuerpo (ver
+tiempos.py). Un request que comparte un cálculo en curso suma a los suyos
+los tiempos de ese cálculo.
+
+Solo usa la biblioteca estándar; no depende de ningún framework ASGI.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import app as modulo_app
+import tiempos
+from app import CalculateError, compute_calculation, parse_calculate_request
+from ejecutor import JobCancelledError
+
+
+# Hilos para los cálculos (por defecto, uno por CPU)
+THREADS = int(os.environ.get('CALCULADORA_ASGI_THREADS', os.cpu_count() or 1))
+
+# Tamaño máximo del cuerpo de un request en bytes
+MAX_BODY_BYTES = 1 << 20
+
+executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='calculadora-asgi')
+
+
+class InFlight:
+    """
+    Cálculos en curso por clave: el primer request de una clave lanza el
+    cálculo y los siguientes esperan el mismo resultado. El cálculo se
+    cancela cuando dejan de esperarlo todos los requests; `cancelled`
+    cuenta solo los que efectivamente se detuvieron (sin empezar, o con su
+    trabajo del pool terminado).
+    """
+
+    def __init__(self):
+        self._en_curso = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def run(self, clave, fabrica):
+        """
+        Resultado del cálculo `fabrica(evento)`, compartido con los requests
+        de la misma clave que estén en curso. fabrica devuelve un
+        concurrent.futures.Future; `evento` (threading.Event) se activa
+        cuando nadie espera ya el resultado. Se usa siempre desde el event
+        loop.
+        """
+        self.requests += 1
+        entrada = self._en_curso.get(clave)
+        if entrada is None:
+            evento = threading.Event()
+            trabajo = fabrica(evento)
+            entrada = self._en_curso[clave] = [asyncio.wrap_future(trabajo), 0, trabajo, evento]
+            entrada[0].add_done_callback(lambda _: self._terminado(clave, entrada))
+        else:
+            self.coalesced += 1
+        entrada[1] += 1
+        try:
+            return await asyncio.shield(entrada[0])
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0 and not entrada[0].done():
+                self._quitar(clave, entrada)
+                entrada[3].set()
+                entrada[2].cancel()
+
+    def _terminado(self, clave, entrada):
+        self._quitar(clave, entrada)
+        futuro = entrada[0]
+        # Leer la excepción también evita el aviso de excepción no recuperada
+        if futuro.cancelled() or isinstance(futuro.exception(), JobCancelledError):
+            self.cancelled += 1
+
+    def _quitar(self, clave, entrada):
+        if self._en_curso.get(clave) is entrada:
+            del self._en_curso[clave]
+
+    def stats(self):
+        """Contadores de requests, requests que reutilizaron un cálculo en
+        curso y cálculos cancelados."""
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'cancelled': self.cancelled,
+            'in_flight': len(self._en_curso),
+            'coalescing_ratio': self.coalesced / self.requests if self.requests else 0.0,
+        }
+
+
+in_flight = InFlight()
+
+
+async def app(scope, receive, send):
+    """Aplicación ASGI: POST /calculate y GET /cache/stats."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    ruta, metodo = scope['path'], scope['method']
+    if ruta == '/cache/stats' and metodo == 'GET':
+        await _responder(send, 200, {**modulo_app.result_cache.stats(),
+                                     'tiles': modulo_app.tile_cache.stats(),
+                                     'in_flight': in_flight.stats()})
+    elif ruta == '/calculate' and metodo == 'POST':
+        await calculate(receive, send)
+    elif ruta in ('/calculate', '/cache/stats'):
+        await _responder(send, 405, {'success': False, 'message': 'Método no permitido'})
+    else:
+        await _responder(send, 404, {'success': False, 'message': 'Ruta no encontrada'})
+
+
+async def calculate(receive, send):
+    """
+    POST /calculate: mismo cuerpo JSON, respuestas, códigos de estado y
+    tiempos por etapa que la ruta de app.py.
+    """
+    loop = asyncio.get_running_loop()
+    with tiempos.recording() as registro:
+        try:
+            try:
+                cuerpo = await _leer_cuerpo(receive)
+                if cuerpo is None:
+                    return
+                try:
+                    datos = json.loads(cuerpo)
+                except ValueError:
+                    raise CalculateError('Se espera un objeto JSON')
+
+                # Cálculo en el pool de hilos; se deja de esperar si el cliente se va
+                desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+                try:
+                    # El parseo se registra en los tiempos de este request
+                    params = await _mientras_conectado(
+                        loop.run_in_executor(executor, contextvars.copy_context().run,
+                                             parse_calculate_request, datos), desconexion)
+                    if params is None:
+                        return
+                    if params['format'] == 'ndjson':
+                        await _enviar_ndjson(params, send, desconexion, registro)
+                        return
+                    # Con debug_timings el resultado se comparte sin codificar,
+                    # para agregar a cada respuesta sus propios tiempos
+                    debug = bool(datos.get('debug_timings'))
+                    clave = (params['func'].expresion, params['domain'], params['resolution'],
+                             params['level'], params['format'], debug)
+                    calculo = await _mientras_conectado(
+                        in_flight.run(clave, lambda evento: executor.submit(
+                            _calcular_json, params, evento, debug)), desconexion)
+                    if calculo is None:
+                        return
+                finally:
+                    desconexion.cancel()
+
+                resultado, etapas = calculo
+                tiempos.absorb(etapas)
+                if debug:
+                    resultado = {**resultado, 'debug_timings': registro.as_dict()}
+                    with tiempos.stage('json'):
+                        resultado = json.dumps(resultado).encode()
+            except CalculateError as e:
+                await _responder(send, e.status, {'success': False, 'message': e.message},
+                                 {**e.headers, 'Server-Timing': registro.header()})
+                return
+            await _enviar(send, 200, resultado, {'Server-Timing': registro.header()})
+
+        except Exception as e:
+            await _responder(send, 500, {'success': False, 'message': f'Error inesperado: {str(e)}'},
+                             {'Server-Timing': registro.header()})
+
+
+def _calcular_json(params, cancelacion, debug=False):
+    """
+    compute_calculation con la respuesta ya codificada, para que los
+    requests que comparten el cálculo no repitan la serialización (salvo
+    con debug, que la deja como dict).
+
+    Returns:
+        tuple: (respuesta, tiempos del cálculo exportados con
+        StageTimings.export, para sumarlos a los de cada request)
+    """
+    with tiempos.recording() as registro:
+        resultado = compute_calculation(params, cancel=cancelacion)
+        if not debug:
+            with tiempos.stage('json'):
+                resultado = json.dumps(resultado).encode()
+    return resultado, registro.export()
+
+
+async def _mientras_conectado(espera, desconexion):
+    """Resultado de la espera, o None (y la espera cancelada) si antes se
+    desconecta el cliente."""
+    espera = asyncio.ensure_future(espera)
+    await asyncio.wait((espera, desconexion), return_when=asyncio.FIRST_COMPLETED)
+    if not espera.done():
+        espera.cancel()
+        return None
+    return espera.result()
+
+
+async def _enviar_ndjson(params, send, desconexion, registro):
+    """format='ndjson': una banda por mensaje, evaluando la siguiente solo
+    mientras el cliente siga conectado. Server-Timing lleva los tiempos
+    hasta el comienzo de la respuesta."""
+    loop = asyncio.get_running_loop()
+    lineas = modulo_app.stream_surface_ndjson(params['func'], *params['domain'],
+                                              params['resolution'])
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson'),
+                            (b'server-timing', registro.header().encode())]})
+    try:
+        while not desconexion.done():
+            linea = await loop.run_in_executor(executor, next, lineas, None)
+            if linea is None:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                return
+            await send({'type': 'http.response.body', 'body': linea.encode(), 'more_body': True})
+    finally:
+        try:
+            lineas.close()
+        except ValueError:
+            # La banda en curso sigue evaluándose en su hilo
+            pass
+
+
+async def _leer_cuerpo(receive):
+    """Cuerpo completo del request, o None si el cliente se desconecta."""
+    partes, total = [], 0
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            return None
+        partes.append(mensaje.get('body', b''))
+        total += len(partes[-1])
+        if total > MAX_BODY_BYTES:
+            raise CalculateError('El cuerpo del request es demasiado grande', 413)
+        if not mensaje.get('more_body', False):
+            return b''.join(partes)
+
+
+async def _esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _responder(send, status, cuerpo, headers=None):
+    await _enviar(send, status, json.dumps(cuerpo).encode(), headers)
+
+
+async def _enviar(send, status, cuerpo, headers=None):
+    encabezados = [(b'content-type', b'application/json'),
+                   (b'content-length', str(len(cuerpo)).encode())]
+    encabezados += [(k.lower().encode(), str(v).encode()) for k, v in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': encabezados})
+    await send({'type': 'http.response.body', 'body': cuerpo})
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Compara el costo de los métodos de integración de calculate_volume
+(evaluaciones de la función y tiempo) sobre las mismas entradas.
+
+Uso:
+    python benchmarks/bench_cubatura.py
+"""
+
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculadora_3d import parse_function, calculate_volume
+
+
+CASOS = [
+    ("x**2 + y**2", (-2, 2, -2, 2)),
+    ("sin(x) * cos(y)", (0, 2 * np.pi, 0, 2 * np.pi)),
+    ("exp(-(x**2 + y**2))", (-2, 2, -2, 2)),
+    ("exp(-100*(x**2 + y**2))", (-1, 1, -1, 1)),
+    ("exp(-50*(x**2 + y**2))", (-2, 2, -2, 2)),
+    ("1 / (1 + x**2 + y**2)", (-5, 5, -5, 5)),
+]
+
+METODOS = ('dblquad', 'gauss', 'adaptive')
+
+
+def main():
+    print(f"{'Expresión':<26} {'método':<9} {'volumen':>14} {'error':>9} {'neval':>8} {'ms':>8}")
+    print("-" * 80)
+    for expr, dominio in CASOS:
+        func = parse_function(expr)
+        for method in METODOS:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                inicio = time.perf_counter()
+                volume, error, info = calculate_volume(func, *dominio, method=method,
+                                                       full_output=True, symbolic=False,
+                                                       separable=False)
+                ms = (time.perf_counter() - inicio) * 1000
+            print(f"{expr:<26} {method:<9} {volume:>14.8f} {error:>9.1e} "
+                  f"{info['neval']:>8} {ms:>8.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
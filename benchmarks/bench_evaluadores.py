@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Compara los motores de evaluación disponibles (ver evaluadores.py) al
+evaluar la malla con evaluate_grid, por bloques de filas (como en la
+aplicación) y de una sola vez, para varias resoluciones. Los motores que
+no están instalados (numexpr, numba) se omiten.
+
+Uso:
+    python benchmarks/bench_evaluadores.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculadora_3d import available_backends, evaluate_grid, parse_function
+
+
+EXPRESIONES = [
+    "sin(x) * cos(y)",
+    "exp(-(x**2+y**2)) * sqrt(x**2+y**2) + pi/2",
+    "cos(2*pi*x) * cos(2*pi*y) * exp(-(x**2 + y**2)/4)",
+]
+
+RESOLUCIONES = (100, 500, 1000, 2000)
+
+
+def mejor_tiempo(funcion, numero):
+    """Mejor tiempo por llamada en milisegundos."""
+    return min(timeit.repeat(funcion, repeat=3, number=numero)) / numero * 1000
+
+
+def main():
+    motores = available_backends()
+    print(f"Motores disponibles: {', '.join(motores)}\n")
+    for expr in EXPRESIONES:
+        print(expr)
+        print(f"{'puntos':>8} {'motor':<8} {'por bloques (ms)':>17} {'completa (ms)':>14}")
+        print("-" * 50)
+        for n in RESOLUCIONES:
+            numero = max(1, 200_000 // (n * n))
+            for motor in motores:
+                func = parse_function(expr, backend=motor)
+                Z = np.empty((n, n))
+                evaluate_grid(func, -2, 2, -2, 2, n, out=Z)
+                bloques = mejor_tiempo(lambda: evaluate_grid(func, -2, 2, -2, 2, n, out=Z), numero)
+                completa = mejor_tiempo(lambda: evaluate_grid(func, -2, 2, -2, 2, n, out=Z,
+                                                              tile_values=n * n), numero)
+                print(f"{n:>8} {func.backend:<8} {bloques:>17.2f} {completa:>14.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
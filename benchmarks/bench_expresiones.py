@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Compara la evaluación de las funciones de parse_function (constantes
+plegadas, subexpresiones comunes, potencias enteras como productos y ufuncs
+en sitio) con la compilación directa del AST validado, sin optimizar, sobre
+un corpus de expresiones tomadas de los ejemplos de la documentación y de
+la aplicación web.
+
+Uso:
+    python benchmarks/bench_expresiones.py
+"""
+
+import ast
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculadora_3d import parse_function
+from expresiones import CONSTANTES, FUNCIONES, analizar_expresion
+
+
+# README.md, ejemplos.py, botones de ejemplo de webapp/templates/index.html
+# y expresiones típicas de los usuarios
+EXPRESIONES = [
+    "x**2 + y**2",
+    "x**2 - y**2",
+    "sin(x) * cos(y)",
+    "sin(sqrt(x**2 + y**2))",
+    "exp(-(x**2 + y**2))",
+    "exp(-(x**2 + y**2)/2)",
+    "1 / (1 + x**2 + y**2)",
+    "sqrt(abs(x * y))",
+    "exp(-(x**2+y**2)) * sqrt(x**2+y**2) + pi/2",
+    "sin(x**2 + y**2) / (x**2 + y**2 + 1)",
+    "x**3 - 3*x*y**2",
+    "(1 - x)**2 + 100*(y - x**2)**2",
+    "cos(2*pi*x) * cos(2*pi*y) * exp(-(x**2 + y**2)/4)",
+]
+
+# Puntos por eje de las mallas (x como fila, y como columna)
+RESOLUCIONES = (200, 1000)
+
+
+def compilar_sin_optimizar(func_str):
+    """Compilación directa del AST validado (implementación anterior)."""
+    arbol = analizar_expresion(func_str)
+    argumentos = ast.arguments(posonlyargs=[], args=[ast.arg(arg='x'), ast.arg(arg='y')],
+                               kwonlyargs=[], kw_defaults=[], defaults=[])
+    funcion = ast.fix_missing_locations(
+        ast.Expression(body=ast.Lambda(args=argumentos, body=arbol.body)))
+    namespace = {'__builtins__': {}, **FUNCIONES, **CONSTANTES}
+    evaluar = eval(compile(funcion, '<f(x, y)>', 'eval'), namespace)
+
+    def f(x, y):
+        try:
+            return evaluar(x, y)
+        except Exception as e:
+            raise ValueError(f"Error al evaluar la función: {e}")
+
+    return f
+
+
+def medir(func, x, y, numero=5):
+    """Mejor tiempo (ms) y pico de memoria (en mallas) de func(x, y)."""
+    func(x, y)
+    tracemalloc.start()
+    func(x, y)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ms = min(timeit.repeat(lambda: func(x, y), repeat=3, number=numero)) / numero * 1000
+    return ms, pico / (np.broadcast(x, y).size * 8)
+
+
+def main():
+    for n in RESOLUCIONES:
+        x = np.linspace(-2, 2, n)[None, :]
+        y = np.linspace(-2, 2, n)[:, None]
+        print(f"Malla {n}x{n}")
+        print(f"{'Expresión':<52} {'antes (ms)':>10} {'ahora (ms)':>10} "
+              f"{'mallas antes':>12} {'ahora':>6}")
+        print("-" * 96)
+        total_antes = total_ahora = 0.0
+        with np.errstate(all='ignore'):
+            for expr in EXPRESIONES:
+                ms_antes, mem_antes = medir(compilar_sin_optimizar(expr), x, y)
+                ms_ahora, mem_ahora = medir(parse_function(expr), x, y)
+                total_antes += ms_antes
+                total_ahora += ms_ahora
+                print(f"{expr:<52} {ms_antes:>10.2f} {ms_ahora:>10.2f} "
+                      f"{mem_antes:>12.1f} {mem_ahora:>6.1f}")
+        print(f"{'Total':<52} {total_antes:>10.2f} {total_ahora:>10.2f}\n")
+
+    print(f"{'Expresión':<52} {'antes (µs)':>10} {'ahora (µs)':>10}   (escalares)")
+    print("-" * 76)
+    for expr in EXPRESIONES:
+        tiempos = []
+        for func in (compilar_sin_optimizar(expr), parse_function(expr)):
+            mejor = min(timeit.repeat(lambda: func(0.3, -0.7), repeat=5, number=20000))
+            tiempos.append(mejor / 20000 * 1e6)
+        print(f"{expr:<52} {tiempos[0]:>10.2f} {tiempos[1]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
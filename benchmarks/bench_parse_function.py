@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del costo por llamada de las funciones generadas por
+parse_function, comparado con la implementación anterior basada en
+eval() de la cadena en cada llamada.
+
+Uso:
+    python benchmarks/bench_parse_function.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculadora_3d import parse_function
+
+
+# Expresiones usadas en ejemplos.py
+EXPRESIONES = [
+    "x**2 + y**2",
+    "exp(-(x**2 + y**2))",
+    "sin(x) * cos(y)",
+    "x**2 - y**2",
+]
+
+
+def parse_function_eval(func_str):
+    """Implementación anterior: eval() de la cadena en cada llamada."""
+    safe_dict = {
+        'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'exp': np.exp,
+        'log': np.log, 'sqrt': np.sqrt, 'abs': np.abs,
+        'pi': np.pi, 'e': np.e,
+    }
+
+    def f(x, y):
+        safe_dict['x'] = x
+        safe_dict['y'] = y
+        try:
+            return eval(func_str, {"__builtins__": {}}, safe_dict)
+        except Exception as e:
+            raise ValueError(f"Error al evaluar la función: {e}")
+
+    return f
+
+
+def tiempo_por_llamada(func, repeticiones=5, numero=20000):
+    """Mejor tiempo por llamada (en microsegundos) con argumentos escalares."""
+    tiempos = timeit.repeat(lambda: func(0.3, -0.7), repeat=repeticiones, number=numero)
+    return min(tiempos) / numero * 1e6
+
+
+def main():
+    print(f"{'Expresión':<24} {'eval (µs)':>10} {'compilada (µs)':>15} {'aceleración':>12}")
+    print("-" * 64)
+    for expr in EXPRESIONES:
+        anterior = tiempo_por_llamada(parse_function_eval(expr))
+        actual = tiempo_por_llamada(parse_function(expr))
+        print(f"{expr:<24} {anterior:>10.2f} {actual:>15.2f} {anterior / actual:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
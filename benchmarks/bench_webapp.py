@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compara la latencia por request y el tamaño de la respuesta de
+webapp/app.py entre el gráfico renderizado en el servidor (output='html')
+y la respuesta solo con datos (output='data', en base64 y en json).
+
+Uso:
+    python benchmarks/bench_webapp.py
+"""
+
+import os
+import statistics
+import sys
+import time
+
+# Agregar el directorio raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webapp.app import app, result_cache
+
+
+VARIANTES = [
+    ('html', {'output': 'html'}),
+    ('data/base64', {'output': 'data', 'encoding': 'base64'}),
+    ('data/json', {'output': 'data', 'encoding': 'json'}),
+]
+
+RESOLUCIONES = (50, 100, 200)
+
+
+def medir(cliente, datos, repeticiones=10):
+    """Mediana de la latencia (ms) y tamaño de la respuesta (bytes)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/calculate', data=datos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert respuesta.status_code == 200, respuesta.get_json()
+    return statistics.median(tiempos), len(respuesta.data)
+
+
+def main():
+    cliente = app.test_client()
+    base = {'function': 'sin(x) * cos(y)', 'a': 0, 'b': 6.28, 'c': 0, 'd': 3.14}
+
+    print(f"{'resolución':>10} {'variante':<12} {'mediana (ms)':>13} {'tamaño (KB)':>12}")
+    print("-" * 52)
+    for num_points in RESOLUCIONES:
+        for nombre, extra in VARIANTES:
+            # Calentar la caché para medir solo la preparación de la respuesta
+            result_cache.clear()
+            datos = {**base, 'num_points': num_points, **extra}
+            cliente.post('/calculate', data=datos)
+            ms, nbytes = medir(cliente, datos)
+            print(f"{num_points:>10} {nombre:<12} {ms:>13.2f} {nbytes / 1024:>12.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Conjunto de benchmarks con resultados en JSON, para comparar corridas de
+forma automática y detectar regresiones de rendimiento:
+
+- parse: costo de parse_function y de cada llamada (escalares y arrays)
+- volume: calculate_volume sobre un corpus de funciones suaves, oscilantes,
+  con picos y casi singulares, por el camino por defecto y con cada método
+  numérico
+- grid: evaluate_grid con resoluciones de 50 a 2000
+- web: latencia de /calculate (sin caché y con caché) y tamaño de la
+  respuesta en app.py y webapp/app.py, con el cliente de pruebas de Flask
+
+Cada resultado tiene 'suite', 'name' y 'ms' (el mejor tiempo, o la
+mediana para los requests), más datos propios de cada suite.
+
+Uso:
+    python benchmarks/suite.py -o actual.json
+    python benchmarks/suite.py -o actual.json --baseline anterior.json
+    python benchmarks/suite.py --results actual.json --baseline anterior.json
+
+Con --baseline se comparan los tiempos con los de otra corrida y el código
+de salida es 1 si alguno empeoró más que --threshold (por defecto 1.25x).
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Agregar el directorio raíz del proyecto al path
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from calculadora_3d import calculate_volume, evaluate_grid, parse_function
+from bench_evaluadores import EXPRESIONES as EXPRESIONES_MALLA
+from bench_expresiones import EXPRESIONES
+
+
+# Corpus de calculate_volume: (categoría, expresión, dominio)
+CORPUS = [
+    ("suave", "x**2 + y**2", (-2, 2, -2, 2)),
+    ("suave", "exp(-(x**2 + y**2))", (-2, 2, -2, 2)),
+    ("suave", "1 / (1 + x**2 + y**2)", (-5, 5, -5, 5)),
+    ("suave", "x*y + cos(x + y)", (0, 1, 0, 2)),
+    ("oscilante", "sin(x) * cos(y)", (0, 2 * np.pi, 0, 2 * np.pi)),
+    ("oscilante", "sin(10*x) * cos(10*y)", (0, np.pi, 0, np.pi)),
+    ("oscilante", "cos(20*x*y)", (0, 1, 0, 1)),
+    ("oscilante", "sin(x**2 + y**2)", (-3, 3, -3, 3)),
+    ("pico", "exp(-100*(x**2 + y**2))", (-1, 1, -1, 1)),
+    ("pico", "exp(-50*(x**2 + y**2))", (-2, 2, -2, 2)),
+    ("pico", "1 / (0.01 + x**2 + y**2)", (-1, 1, -1, 1)),
+    ("casi singular", "log(x**2 + y**2 + 1e-6)", (-1, 1, -1, 1)),
+    ("casi singular", "1 / sqrt(x**2 + y**2 + 1e-4)", (-1, 1, -1, 1)),
+    ("casi singular", "sqrt(abs(x * y))", (-1, 1, -1, 1)),
+]
+
+METODOS = ('dblquad', 'gauss', 'adaptive')
+
+RESOLUCIONES = (50, 100, 200, 500, 1000, 2000)
+
+# Requests de /calculate: (aplicación, variante, datos)
+FUNCION_WEB = {'function': 'exp(-(x**2 + y**2)) * cos(x*y)', 'a': -2, 'b': 2, 'c': -2, 'd': 2}
+REQUESTS = [
+    ('app', f'{formato}/{n}', {**FUNCION_WEB, 'resolution': n, 'format': formato})
+    for formato in ('json', 'base64') for n in (50, 150)
+] + [
+    ('webapp', f'{salida}/{n}', {**FUNCION_WEB, 'num_points': n, **extra})
+    for salida, extra in (('data', {'output': 'data'}), ('html', {'output': 'html'}))
+    for n in (50, 200)
+]
+
+SUITES = ('parse', 'volume', 'grid', 'web')
+
+
+def mejor_ms(funcion, numero, repeticiones=3):
+    """Mejor tiempo por llamada en milisegundos."""
+    return min(timeit.repeat(funcion, repeat=repeticiones, number=numero)) / numero * 1000
+
+
+def _limpiar_caches():
+    """Vacía las cachés por expresión, para medir el costo de una expresión nueva."""
+    from expresiones import compilar_separable
+    from simbolico import antiderivative
+    compilar_separable.cache_clear()
+    antiderivative.cache_clear()
+
+
+def suite_parse(rapido):
+    resultados = []
+    x = np.linspace(-2, 2, 200)[None, :]
+    y = np.linspace(-2, 2, 200)[:, None]
+    numero = 200 if rapido else 2000
+    for expr in EXPRESIONES:
+        func = parse_function(expr)
+        with np.errstate(all='ignore'):
+            resultados.append({
+                'suite': 'parse', 'name': expr,
+                'ms': mejor_ms(lambda: parse_function(expr), numero // 10),
+                'call_scalar_us': mejor_ms(lambda: func(0.3, -0.7), numero * 10) * 1000,
+                'call_array_ms': mejor_ms(lambda: func(x, y), 10),
+            })
+    return resultados
+
+
+def suite_volume(rapido):
+    resultados = []
+    variantes = [('auto', {})] + [(m, {'method': m, 'symbolic': False, 'separable': False})
+                                   for m in METODOS]
+    for categoria, expr, dominio in CORPUS:
+        func = parse_function(expr)
+        for nombre, opciones in variantes:
+            tiempos = []
+            for _ in range(1 if rapido else 3):
+                _limpiar_caches()
+                with warnings.catch_warnings(), np.errstate(all='ignore'):
+                    warnings.simplefilter("ignore")
+                    inicio = time.perf_counter()
+                    volume, error, info = calculate_volume(func, *dominio, full_output=True,
+                                                           **opciones)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+            resultados.append({
+                'suite': 'volume', 'name': f'{expr} [{nombre}]', 'category': categoria,
+                'domain': [float(v) for v in dominio], 'method': nombre,
+                'ms': min(tiempos), 'volume': float(volume), 'error': float(error),
+                'neval': int(info['neval']), 'path': info['path'],
+            })
+    return resultados
+
+
+def suite_grid(rapido):
+    resultados = []
+    resoluciones = [n for n in RESOLUCIONES if not rapido or n <= 500]
+    for expr in EXPRESIONES_MALLA:
+        func = parse_function(expr)
+        for n in resoluciones:
+            Z = np.empty((n, n))
+            numero = max(1, 200_000 // (n * n))
+            resultados.append({
+                'suite': 'grid', 'name': f'{expr} [{n}]', 'points': n,
+                'ms': mejor_ms(lambda: evaluate_grid(func, -2, 2, -2, 2, n, out=Z), numero),
+            })
+    return resultados
+
+
+def suite_web(rapido):
+    import app as modulo_app
+    import webapp.app as modulo_webapp
+
+    # Cálculos en el propio proceso, sin la latencia del pool
+    modulos = {'app': modulo_app, 'webapp': modulo_webapp}
+    for modulo in modulos.values():
+        modulo.calculation_pool = None
+
+    resultados = []
+    repeticiones = 3 if rapido else 10
+    for nombre_app, variante, datos in REQUESTS:
+        modulo = modulos[nombre_app]
+        cliente = modulo.app.test_client()
+
+        def enviar():
+            if nombre_app == 'app':
+                return cliente.post('/calculate', json=datos)
+            return cliente.post('/calculate', data=datos)
+
+        enviar()
+        frio, caliente = [], []
+        for _ in range(repeticiones):
+            modulo.result_cache.clear()
+            _limpiar_caches()
+            inicio = time.perf_counter()
+            enviar()
+            frio.append((time.perf_counter() - inicio) * 1000)
+            inicio = time.perf_counter()
+            respuesta = enviar()
+            caliente.append((time.perf_counter() - inicio) * 1000)
+            assert respuesta.status_code == 200, respuesta.get_json()
+        resultados.append({
+            'suite': 'web', 'name': f'{nombre_app} {variante}', 'app': nombre_app,
+            'ms': statistics.median(frio), 'cached_ms': statistics.median(caliente),
+            'bytes': len(respuesta.data),
+        })
+    return resultados
+
+
+def metadatos():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def comparar(actual, anterior, umbral):
+    """
+    Imprime la razón de tiempos actual / anterior de los resultados con el
+    mismo suite y name.
+
+    Returns:
+        list de los nombres de los resultados que empeoraron más que el umbral
+    """
+    previos = {(r['suite'], r['name']): r for r in anterior['results']}
+    regresiones = []
+    print(f"{'suite':<7} {'nombre':<56} {'antes (ms)':>11} {'ahora (ms)':>11} {'razón':>7}")
+    print("-" * 96)
+    for r in actual['results']:
+        previo = previos.get((r['suite'], r['name']))
+        if previo is None or previo['ms'] <= 0:
+            continue
+        razon = r['ms'] / previo['ms']
+        marca = ''
+        if razon > umbral:
+            regresiones.append(f"{r['suite']}: {r['name']}")
+            marca = '  ✗'
+        print(f"{r['suite']:<7} {r['name'][:56]:<56} {previo['ms']:>11.3f} {r['ms']:>11.3f} "
+              f"{razon:>6.2f}x{marca}")
+    return regresiones
+
+
+def imprimir(resultados):
+    print(f"{'suite':<7} {'nombre':<56} {'ms':>11}  detalle")
+    print("-" * 96)
+    for r in resultados:
+        detalle = ''
+        if r['suite'] == 'volume':
+            detalle = f"neval={r['neval']} {r['path']}"
+        elif r['suite'] == 'web':
+            detalle = f"caché={r['cached_ms']:.2f} ms {r['bytes'] / 1024:.1f} KB"
+        elif r['suite'] == 'parse':
+            detalle = f"llamada={r['call_scalar_us']:.2f} µs"
+        print(f"{r['suite']:<7} {r['name'][:56]:<56} {r['ms']:>11.3f}  {detalle}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-o', '--output', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--results', help='resultados ya guardados (no se vuelve a medir)')
+    parser.add_argument('--baseline', help='resultados de otra corrida para comparar')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='razón de tiempos a partir de la cual hay regresión')
+    parser.add_argument('--suites', default=','.join(SUITES),
+                        help=f'suites a ejecutar, separadas por comas ({",".join(SUITES)})')
+    parser.add_argument('--quick', action='store_true', help='menos repeticiones y resoluciones')
+    argumentos = parser.parse_args()
+
+    if argumentos.results:
+        with open(argumentos.results, encoding='utf-8') as archivo:
+            actual = json.load(archivo)
+    else:
+        suites = {'parse': suite_parse, 'volume': suite_volume, 'grid': suite_grid,
+                  'web': suite_web}
+        resultados = []
+        for nombre in argumentos.suites.split(','):
+            if nombre not in suites:
+                parser.error(f'suite desconocida: {nombre}')
+            resultados += suites[nombre](argumentos.quick)
+        actual = {'meta': metadatos(), 'results': resultados}
+        imprimir(resultados)
+        if argumentos.output:
+            with open(argumentos.output, 'w', encoding='utf-8') as archivo:
+                json.dump(actual, archivo, indent=1)
+            print(f"\nResultados guardados en {argumentos.output}")
+
+    if argumentos.baseline:
+        with open(argumentos.baseline, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+        print()
+        regresiones = comparar(actual, anterior, argumentos.threshold)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones (> {argumentos.threshold:.2f}x)")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Caché de resultados en memoria para las aplicaciones web.
+Guarda por separado los volúmenes y las mallas evaluadas, con expulsión
+LRU y un presupuesto de memoria en bytes, de modo que cambiar solo la
+resolución reutiliza el volumen ya calculado. Los requests idénticos
+simultáneos comparten un mismo cálculo (ver SingleFlight).
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from ejecutor import _INTERVALO_CANCELACION, _cancelacion, JobCancelledError, JobTimeoutError
+from nucleo import (_via, calculate_batch, calculate_volume, compute_surface_job,
+                    compute_volumes_job, evaluate_grid, level_points, refine_grid, stream_surface,
+                    symbolic_volume, validate_job, volume_from_grid)
+
+
+class LRUCache:
+    """
+    Diccionario acotado por bytes con expulsión del elemento usado hace
+    más tiempo. Es seguro entre hilos.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        """Devuelve el valor guardado o None, y lo marca como usado."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def put(self, clave, valor, nbytes):
+        """Guarda un valor que ocupa `nbytes` bytes, expulsando los más antiguos."""
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._datos[clave] = (valor, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, liberado) = self._datos.popitem(last=False)
+                self.bytes -= liberado
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Contadores de aciertos, fallos y expulsiones, y uso de memoria."""
+        with self._lock:
+            return {
+                'entries': len(self._datos),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class _Vuelo:
+    """Cálculo en curso de SingleFlight."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa los cálculos simultáneos con la misma clave: el primer hilo que
+    pide una clave la calcula y los que la piden mientras tanto esperan ese
+    mismo resultado (o la misma excepción, salvo JobCancelledError) en
+    lugar de repetirlo. Es seguro entre hilos.
+
+    Quien espera deja de hacerlo como lo haría el que calcula: con
+    JobCancelledError si se cancela su request (ver ejecutor.cancellable) y
+    con JobTimeoutError si se cumple el tiempo máximo indicado.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._en_curso = {}
+        self._lock = threading.Lock()
+
+    def run(self, clave, funcion, *args, timeout=None):
+        """
+        Resultado de funcion(*args), compartido con los hilos que piden la
+        misma clave mientras se calcula.
+
+        Args:
+            timeout: Segundos máximos de espera de un cálculo en curso
+                (None para esperar sin límite)
+        """
+        with self._lock:
+            self.calls += 1
+            vuelo = self._en_curso.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_curso[clave] = _Vuelo()
+            else:
+                self.coalesced += 1
+
+        if not lider:
+            _esperar_vuelo(vuelo, timeout)
+            if isinstance(vuelo.error, JobCancelledError):
+                # Lo canceló quien lo calculaba, no quien espera: se repite
+                return self.run(clave, funcion, *args, timeout=timeout)
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion(*args)
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            vuelo.listo.set()
+
+    def stats(self):
+        """Llamadas, llamadas que esperaron un cálculo en curso y su proporción."""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._en_curso),
+                'coalescing_ratio': self.coalesced / self.calls if self.calls else 0.0,
+            }
+
+
+def _esperar_vuelo(vuelo, limite):
+    """vuelo.listo.wait() en intervalos cortos, interrumpida con
+    JobCancelledError si se cancela el request actual o con JobTimeoutError
+    tras `limite` segundos (None para no tener límite)."""
+    cancelacion = _cancelacion.get()
+    fin = None if limite is None else time.monotonic() + limite
+    while not vuelo.listo.wait(_INTERVALO_CANCELACION):
+        if cancelacion is not None and cancelacion.is_set():
+            raise JobCancelledError("El cálculo se canceló")
+        if fin is not None and time.monotonic() >= fin:
+            raise JobTimeoutError(f"El cálculo excedió el tiempo máximo de {limite:g} s")
+
+
+# Tamaño aproximado de una entrada de volumen (tupla con dos floats y un str)
+_BYTES_VOLUMEN = 256
+
+
+def _solo_lectura(array):
+    """
+    Marca como de solo lectura un array recién calculado, sin copiarlo:
+    la caché es su único dueño y lo comparte entre requests.
+    """
+    array.flags.writeable = False
+    return array
+
+
+def _tiempo_maximo(pool):
+    """Espera máxima de un cálculo en curso: el tiempo máximo por trabajo
+    del pool, o sin límite si se calcula en el hilo actual."""
+    return None if pool is None else pool.timeout
+
+
+def _respaldo_en_pool(func, pool):
+    """
+    Cálculo de respaldo del volumen (ver volume_from_grid) ejecutado en el
+    pool, o None para calcularlo en el hilo actual si no hay pool.
+    """
+    if pool is None:
+        return None
+
+    def fallback(a, b, c, d):
+        valor = pool.run(compute_volumes_job, func.expresion, [(a, b, c, d)])[0]
+        if isinstance(valor, str):
+            raise ValueError(valor)
+        return valor
+    return fallback
+
+
+class ResultCache:
+    """
+    Caché de volúmenes y mallas para /calculate.
+
+    Las claves usan la forma canónica de la expresión (normalizada desde
+    su AST, ver expresiones.py), el dominio (a, b, c, d) y, para las
+    mallas, la resolución. Con las mismas claves, las llamadas simultáneas
+    a surface, volume y level que no encuentran el resultado guardado
+    esperan al primer cálculo en lugar de repetirlo.
+
+    Con un almacén en disco (almacen.DiskStore) los resultados que no están
+    en memoria se buscan ahí antes de calcularlos, y todo lo calculado se
+    guarda también en el almacén.
+    """
+
+    def __init__(self, grid_bytes=64 * 2**20, volume_bytes=2**20, store=None):
+        self.volumes = LRUCache(volume_bytes)
+        self.grids = LRUCache(grid_bytes)
+        self.flights = SingleFlight()
+        self.store = store
+
+    def surface(self, func, a, b, c, d, num_points, pool=None):
+        """
+        Equivalente a calculate_surface, pero reutiliza los resultados
+        guardados y solo calcula la parte que falta.
+
+        Args:
+            func: Función obtenida con parse_function
+            a, b, c, d: Límites del dominio
+            num_points: Número de puntos por eje de la malla
+            pool: CalculationPool opcional (ver ejecutor.py) donde ejecutar
+                los cálculos; si es None se calculan en el hilo actual
+
+        Returns:
+            dict con las mismas claves que calculate_surface y
+            'cached': lista de partes que se obtuvieron de la caché
+        """
+        return self.flights.run(('surface', func.expresion, a, b, c, d, num_points),
+                                self._surface, func, a, b, c, d, num_points, pool,
+                                timeout=_tiempo_maximo(pool))
+
+    def _surface(self, func, a, b, c, d, num_points, pool):
+        clave_volumen = (func.expresion, a, b, c, d)
+        clave_malla = clave_volumen + (num_points,)
+        volumen = self._volumen(clave_volumen)
+        malla = self._malla(clave_malla)
+        cached = []
+
+        if pool is not None and (malla is None or volumen is None):
+            # El proceso recalcula la malla si falta el volumen: evaluarla
+            # cuesta mucho menos que enviarla al proceso
+            resultado = pool.run(compute_surface_job, func.expresion, a, b, c, d,
+                                 num_points, volumen is None)
+            if volumen is None:
+                volumen = (resultado['volume'], resultado['error'], resultado['volume_method'])
+                self._guardar_volumen(clave_volumen, volumen)
+            else:
+                cached.append('volume')
+            if malla is None:
+                malla = self._guardar_malla(clave_malla, resultado['x'], resultado['y'],
+                                            resultado['z'])
+            else:
+                cached.append('grid')
+        else:
+            if malla is None:
+                malla = self._guardar_malla(clave_malla, *evaluate_grid(func, a, b, c, d, num_points))
+            else:
+                cached.append('grid')
+            if volumen is None:
+                volumen = volume_from_grid(func, *malla)
+                self._guardar_volumen(clave_volumen, volumen)
+            else:
+                cached.append('volume')
+
+        x, y, Z = malla
+        volume, error, volume_method = volumen
+        return {'x': x, 'y': y, 'z': Z, 'volume': volume, 'error': error,
+                'volume_method': volume_method, 'cached': cached}
+
+    def volume(self, func, a, b, c, d, pool=None):
+        """
+        Volumen sobre [a, b] x [c, d] en forma cerrada si es posible o con
+        calculate_volume (en el pool si se indica), reutilizando el guardado
+        para la misma expresión y dominio.
+
+        Returns:
+            tuple: (volumen, error, método usado)
+        """
+        return self.flights.run(('volume', func.expresion, a, b, c, d),
+                                self._volume, func, a, b, c, d, pool,
+                                timeout=_tiempo_maximo(pool))
+
+    def _volume(self, func, a, b, c, d, pool):
+        clave_volumen = (func.expresion, a, b, c, d)
+        volumen = self._volumen(clave_volumen)
+        if volumen is None:
+            cerrada = symbolic_volume(func, a, b, c, d)
+            if cerrada is not None:
+                volumen = (cerrada[0], cerrada[1], 'symbolic')
+            elif pool is not None:
+                volumen = tuple(_respaldo_en_pool(func, pool)(a, b, c, d))
+            else:
+                volume, error, info = calculate_volume(func, a, b, c, d, symbolic=False,
+                                                       full_output=True)
+                volumen = (volume, error, _via(info, 'dblquad'))
+            self._guardar_volumen(clave_volumen, volumen)
+        return volumen
+
+    def level(self, func, a, b, c, d, level, pool=None):
+        """
+        Malla del nivel `level` de la pirámide de resoluciones (ver
+        nucleo.level_points) y el volumen.
+
+        Los niveles se guardan como mallas normales, con la resolución
+        level_points(level). Si falta el nivel pedido se parte del nivel
+        guardado más fino por debajo de él (o del nivel 0) y se refina de a
+        un nivel, evaluando solo los puntos nuevos y guardando cada nivel
+        intermedio. El refinado se hace en el hilo actual (cada nivel
+        evalúa 3/4 de sus puntos, muchos menos que enviar la malla a otro
+        proceso); solo el respaldo del volumen se envía al pool.
+
+        Returns:
+            dict con las mismas claves que surface y 'level'
+        """
+        return self.flights.run(('level', func.expresion, a, b, c, d, level),
+                                self._level, func, a, b, c, d, level, pool,
+                                timeout=_tiempo_maximo(pool))
+
+    def _level(self, func, a, b, c, d, level, pool):
+        clave_volumen = (func.expresion, a, b, c, d)
+        cached = []
+
+        base = level
+        malla = self._malla(clave_volumen + (level_points(level),))
+        if malla is not None:
+            cached.append('grid')
+        else:
+            while base > 0 and malla is None:
+                base -= 1
+                malla = self._malla(clave_volumen + (level_points(base),))
+            if malla is None:
+                malla = self._guardar_malla(clave_volumen + (level_points(0),),
+                                            *evaluate_grid(func, a, b, c, d, level_points(0)))
+            for nivel in range(base + 1, level + 1):
+                malla = self._guardar_malla(clave_volumen + (level_points(nivel),),
+                                            *refine_grid(func, *malla))
+
+        volumen = self._volumen(clave_volumen)
+        if volumen is None:
+            volumen = volume_from_grid(func, *malla, fallback=_respaldo_en_pool(func, pool))
+            self._guardar_volumen(clave_volumen, volumen)
+        else:
+            cached.append('volume')
+
+        x, y, Z = malla
+        volume, error, volume_method = volumen
+        return {'x': x, 'y': y, 'z': Z, 'volume': volume, 'error': error,
+                'volume_method': volume_method, 'cached': cached, 'level': level}
+
+    def stream_surface(self, func, a, b, c, d, num_points, pool=None):
+        """
+        Equivalente a nucleo.stream_surface, reutilizando y guardando el
+        volumen. La malla se produce por bandas en el hilo actual y no se
+        guarda; solo el cálculo de respaldo del volumen se envía al pool.
+
+        Yields:
+            Los mismos dicts que nucleo.stream_surface; el del volumen
+            incluye 'cached'
+        """
+        clave_volumen = (func.expresion, a, b, c, d)
+        volumen = self._volumen(clave_volumen)
+
+        for registro in stream_surface(func, a, b, c, d, num_points, volume=volumen,
+                                       fallback=_respaldo_en_pool(func, pool)):
+            if registro['type'] == 'volume':
+                registro['cached'] = volumen is not None
+                if volumen is None:
+                    self._guardar_volumen(clave_volumen, (registro['volume'], registro['error'],
+                                                          registro['volume_method']))
+            yield registro
+
+    def volume_batch(self, jobs, executor=None, max_workers=None):
+        """
+        Equivalente a calculate_batch, pero responde de inmediato los
+        volúmenes guardados y solo calcula (y guarda) los que faltan.
+
+        Yields:
+            Los mismos dicts que calculate_batch; los exitosos incluyen
+            'cached' indicando si el volumen salió de la caché
+        """
+        pendientes, indices, claves = [], [], []
+        for indice, job in enumerate(jobs):
+            try:
+                expresion, dominio = validate_job(job)
+            except ValueError as e:
+                yield {'index': indice, 'success': False, 'message': str(e)}
+                continue
+            clave = (expresion,) + dominio
+            volumen = self._volumen(clave)
+            if volumen is not None:
+                yield {'index': indice, 'success': True, 'volume': volumen[0],
+                       'error': volumen[1], 'volume_method': volumen[2], 'cached': True}
+                continue
+            a, b, c, d = dominio
+            pendientes.append({'function': expresion, 'a': a, 'b': b, 'c': c, 'd': d})
+            indices.append(indice)
+            claves.append(clave)
+
+        for resultado in calculate_batch(pendientes, executor=executor,
+                                         max_workers=max_workers):
+            posicion = resultado['index']
+            resultado['index'] = indices[posicion]
+            if resultado['success']:
+                self._guardar_volumen(claves[posicion], (resultado['volume'], resultado['error'],
+                                                         resultado['volume_method']))
+                resultado['cached'] = False
+            yield resultado
+
+    def _volumen(self, clave):
+        volumen = self.volumes.get(clave)
+        if volumen is None and self.store is not None:
+            volumen = self.store.get_volume(clave)
+            if volumen is not None:
+                self.volumes.put(clave, volumen, _BYTES_VOLUMEN + sys.getsizeof(volumen[2]))
+        return volumen
+
+    def _malla(self, clave):
+        malla = self.grids.get(clave)
+        if malla is None and self.store is not None:
+            malla = self.store.get_grid(clave)
+            if malla is not None:
+                self.grids.put(clave, malla, sum(array.nbytes for array in malla))
+        return malla
+
+    def _guardar_malla(self, clave, x, y, Z):
+        x, y, Z = _solo_lectura(x), _solo_lectura(y), _solo_lectura(Z)
+        self.grids.put(clave, (x, y, Z), x.nbytes + y.nbytes + Z.nbytes)
+        if self.store is not None:
+            self.store.put_grid(clave, x, y, Z)
+        return x, y, Z
+
+    def _guardar_volumen(self, clave, volumen):
+        self.volumes.put(clave, volumen, _BYTES_VOLUMEN + sys.getsizeof(volumen[2]))
+        if self.store is not None:
+            self.store.put_volume(clave, volumen)
+
+    def clear(self):
+        self.volumes.clear()
+        self.grids.clear()
+
+    def stats(self):
+        return {'volumes': self.volumes.stats(), 'grids': self.grids.stats(),
+                'single_flight': self.flights.stats(),
+                **({'disk': self.store.stats()} if self.store is not None else {})}
@@ -3,51 +3,28 @@
 Visualizador 3D y Calculadora de Volumen
 Aplicación que acepta una función z = f(x, y), genera un gráfico 3D
 y calcula el volumen bajo la superficie usando integración numérica.
+
+Las funciones numéricas viven en nucleo.py y se reexportan aquí; matplotlib
+solo se importa al graficar.
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from scipy import integrate
 import sys
 
-
-def parse_function(func_str):
-    """
-    Convierte una cadena de texto en una función evaluable.
-    
-    Args:
-        func_str: String con la expresión matemática (ej: "x**2 + y**2")
-    
-    Returns:
-        Función que puede ser evaluada con valores x, y
-    
-    Nota de seguridad: Esta función usa eval() con un namespace restringido
-    que solo incluye funciones matemáticas seguras. Para uso en producción,
-    considere usar bibliotecas como sympy para parsing más robusto.
-    """
-    # Crear un namespace seguro con funciones matemáticas comunes
-    safe_dict = {
-        'sin': np.sin,
-        'cos': np.cos,
-        'tan': np.tan,
-        'exp': np.exp,
-        'log': np.log,
-        'sqrt': np.sqrt,
-        'abs': np.abs,
-        'pi': np.pi,
-        'e': np.e,
-    }
-    
-    def f(x, y):
-        safe_dict['x'] = x
-        safe_dict['y'] = y
-        try:
-            return eval(func_str, {"__builtins__": {}}, safe_dict)
-        except Exception as e:
-            raise ValueError(f"Error al evaluar la función: {e}")
-    
-    return f
+from nucleo import (
+    parse_function,
+    calculate_volume,
+    evaluate_grid,
+    refine_grid,
+    level_points,
+    grid_volume,
+    volume_from_grid,
+    calculate_surface,
+    stream_surface,
+    calculate_batch,
+)
+from evaluadores import available_backends
+from mallado import adaptive_mesh
 
 
 def plot_surface_3d(func, a, b, c, d, num_points=100):
@@ -60,20 +37,21 @@ def plot_surface_3d(func, a, b, c, d, num_points=100):
         c, d: Límites del dominio en y [c, d]
         num_points: Número de puntos para el mallado
     """
-    # Crear malla de puntos
-    x = np.linspace(a, b, num_points)
-    y = np.linspace(c, d, num_points)
-    X, Y = np.meshgrid(x, y)
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # registra la proyección '3d'
     
-    # Evaluar la función en la malla
+    # Evaluar la función en la malla (sin construir X e Y completos)
     try:
-        Z = func(X, Y)
+        x, y, Z = evaluate_grid(func, a, b, c, d, num_points)
         # Verificar que no haya valores infinitos o NaN
         if not np.all(np.isfinite(Z)):
             raise ValueError("La función produce valores no finitos (infinito o NaN) en el dominio")
     except Exception as e:
         raise ValueError(f"Error al evaluar la función en el dominio: {e}")
     
+    # Vistas de solo lectura de los ejes con la forma de Z, sin copiarlos
+    X, Y = np.meshgrid(x, y, copy=False)
+    
     # Crear figura 3D
     fig = plt.figure(figsize=(12, 8))
     ax = fig.add_subplot(111, projection='3d')
@@ -97,33 +75,43 @@ def plot_surface_3d(func, a, b, c, d, num_points=100):
     return fig
 
 
-def calculate_volume(func, a, b, c, d):
+def plot_adaptive_surface_3d(func, a, b, c, d, max_points=10000, tol=1e-3):
     """
-    Calcula el volumen bajo la superficie z = f(x, y) usando integración numérica doble.
+    Genera un gráfico 3D de la superficie con muestreo adaptativo (ver
+    mallado.adaptive_mesh): más puntos donde la superficie se curva y
+    menos en las zonas planas.
     
     Args:
-        func: Función z = f(x, y)
+        func: Función a graficar
         a, b: Límites del dominio en x [a, b]
         c, d: Límites del dominio en y [c, d]
-    
-    Returns:
-        Volumen calculado y error estimado
+        max_points: Máximo de puntos a evaluar
+        tol: Tolerancia relativa al rango de z
     """
-    # Usar scipy.integrate.dblquad para integración doble
-    # dblquad(func, a, b, gfun, hfun) integra: ∫ₐᵇ ∫_{gfun(x)}^{hfun(x)} func(y, x) dy dx
-    # Para límites constantes en y, usamos funciones lambda que retornan c y d
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # registra la proyección '3d'
     
-    def integrand(y, x):
-        return func(x, y)
+    try:
+        malla = adaptive_mesh(func, a, b, c, d, max_points, tol=tol)
+        if not np.all(np.isfinite(malla['z'])):
+            raise ValueError("La función produce valores no finitos (infinito o NaN) en el dominio")
+    except Exception as e:
+        raise ValueError(f"Error al evaluar la función en el dominio: {e}")
     
-    volume, error = integrate.dblquad(
-        integrand,
-        a, b,      # límites de x
-        lambda x: c,  # límite inferior de y (constante)
-        lambda x: d   # límite superior de y (constante)
-    )
+    fig = plt.figure(figsize=(12, 8))
+    ax = fig.add_subplot(111, projection='3d')
+    surf = ax.plot_trisurf(malla['x'], malla['y'], malla['z'], triangles=malla['faces'],
+                           cmap='viridis', alpha=0.8, edgecolor='none', antialiased=True)
     
-    return volume, error
+    ax.set_xlabel('X', fontsize=12)
+    ax.set_ylabel('Y', fontsize=12)
+    ax.set_zlabel('Z', fontsize=12)
+    ax.set_title(f'Superficie z = f(x, y) ({len(malla["z"])} puntos adaptativos)',
+                 fontsize=14, fontweight='bold')
+    fig.colorbar(surf, ax=ax, shrink=0.5, aspect=5)
+    ax.view_init(elev=30, azim=45)
+    
+    return fig
 
 
 def get_user_input():
@@ -173,6 +161,8 @@ def main():
     """
     Función principal de la aplicación.
     """
+    import matplotlib.pyplot as plt
+    
     try:
         # Obtener entrada del usuario
         func_str, a, b, c, d = get_user_input()
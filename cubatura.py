@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Reglas de cubatura vectorizadas para integrales dobles sobre rectángulos.
+A diferencia de scipy.integrate.dblquad, que llama a la función punto por
+punto, aquí la función se evalúa de una sola vez sobre toda la malla de
+nodos, aprovechando que las funciones parseadas aceptan arrays de NumPy.
+"""
+
+import functools
+import heapq
+import itertools
+import math
+import warnings
+
+import numpy as np
+from scipy.integrate import IntegrationWarning
+
+
+def evaluate_on_nodes(func, X, Y):
+    """
+    Evalúa func sobre arrays de nodos y devuelve un array float con la
+    forma resultante del broadcasting de X e Y (las funciones constantes
+    o que dependen de una sola variable devuelven formas reducidas).
+    """
+    Z = np.asarray(func(X, Y), dtype=float)
+    forma = np.broadcast_shapes(np.shape(X), np.shape(Y))
+    if Z.shape != forma:
+        Z = np.broadcast_to(Z, forma)
+    return Z
+
+
+@functools.lru_cache(maxsize=None)
+def _gauss_legendre(n):
+    """Nodos y pesos de Gauss-Legendre de orden n en [-1, 1]."""
+    return np.polynomial.legendre.leggauss(n)
+
+
+def _regla_producto(func, a, b, c, d, n):
+    """
+    Regla producto tensorial de Gauss-Legendre n x n sobre [a, b] x [c, d].
+    Evalúa func una sola vez sobre los n² nodos.
+    """
+    t, w = _gauss_legendre(n)
+    hx, hy = (b - a) / 2, (d - c) / 2
+    x = (a + b) / 2 + hx * t
+    y = (c + d) / 2 + hy * t
+    Z = evaluate_on_nodes(func, x[np.newaxis, :], y[:, np.newaxis])
+    _verificar_finitos(Z)
+    return float(hx * hy * (w @ Z @ w))
+
+
+def _verificar_finitos(Z):
+    if not np.all(np.isfinite(Z)):
+        raise ValueError("La función produce valores no finitos (infinito o NaN) en el dominio")
+
+
+def gauss_legendre_2d(func, a, b, c, d, epsabs=1.49e-8, epsrel=1.49e-8,
+                      orden_inicial=8, orden_max=256, full_output=False):
+    """
+    Integra func sobre [a, b] x [c, d] con reglas producto de
+    Gauss-Legendre de orden creciente (8, 16, 32, ...).
+
+    En cada nivel la función se evalúa una vez sobre la malla de nodos
+    completa; el error se estima como la diferencia entre los resultados
+    de dos órdenes consecutivos.
+
+    Args:
+        func: Función z = f(x, y) que acepta arrays
+        a, b: Límites del dominio en x [a, b]
+        c, d: Límites del dominio en y [c, d]
+        epsabs, epsrel: Tolerancias absoluta y relativa
+        orden_inicial: Orden de la primera regla
+        orden_max: Orden máximo antes de abandonar el refinamiento
+        full_output: Si es True, devuelve además un diccionario con
+            el número de evaluaciones ('neval') y el orden final ('orden')
+
+    Returns:
+        Volumen calculado y error estimado (y la información adicional
+        si full_output es True)
+    """
+    n = orden_inicial
+    anterior = _regla_producto(func, a, b, c, d, n)
+    neval = n * n
+    while True:
+        n *= 2
+        valor = _regla_producto(func, a, b, c, d, n)
+        neval += n * n
+        error = abs(valor - anterior)
+        convergio = error <= max(epsabs, epsrel * abs(valor))
+        if convergio or 2 * n > orden_max:
+            break
+        anterior = valor
+
+    if not convergio:
+        warnings.warn(
+            f"No se alcanzó la tolerancia con orden {n} (error estimado {error:.2e})",
+            IntegrationWarning
+        )
+    if full_output:
+        return valor, error, {'neval': neval, 'orden': n, 'converged': convergio}
+    return valor, error
+
+
+# Regla de Gauss-Kronrod de 15 puntos con la regla de Gauss de 7 puntos
+# embebida (constantes de QUADPACK, qk15). Los nodos de Gauss ocupan las
+# posiciones impares de los 15 nodos de Kronrod.
+_XGK = np.array([
+    0.991455371120812639206854697526329,
+    0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926,
+    0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013,
+    0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245,
+])
+_WGK = np.array([
+    0.022935322010529224963732008058970,
+    0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518,
+    0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550,
+    0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649,
+])
+_WGK_CENTRO = 0.209482141084727828012999174891714
+_WG = np.array([
+    0.129484966168869693270611432679082,
+    0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975,
+    0.417959183673469387755102040816327,
+    0.381830050505118944950369775488975,
+    0.279705391489276667901467771423780,
+    0.129484966168869693270611432679082,
+])
+
+_T15 = np.concatenate([-_XGK, [0.0], _XGK[::-1]])
+_W15 = np.concatenate([_WGK, [_WGK_CENTRO], _WGK[::-1]])
+
+# Evaluaciones de la función por rectángulo
+_NODOS_POR_RECTANGULO = _T15.size ** 2
+
+
+def _kronrod_rectangulos(func, cx, cy, hx, hy):
+    """
+    Aplica la regla producto Gauss-Kronrod 15x15 a un lote de
+    rectángulos (centros cx, cy y semianchos hx, hy) con una sola
+    evaluación vectorizada de func.
+
+    Returns:
+        Arrays con la integral de Kronrod y el error estimado
+        |Kronrod - Gauss| de cada rectángulo
+    """
+    X = cx[:, None, None] + hx[:, None, None] * _T15[None, None, :]
+    Y = cy[:, None, None] + hy[:, None, None] * _T15[None, :, None]
+    Z = evaluate_on_nodes(func, X, Y)
+    _verificar_finitos(Z)
+
+    area = hx * hy
+    kronrod = area * np.einsum('j,mji,i->m', _W15, Z, _W15)
+    gauss = area * np.einsum('j,mji,i->m', _WG, Z[:, 1::2, 1::2], _WG)
+    return kronrod, np.abs(kronrod - gauss)
+
+
+def adaptive_cubature(func, a, b, c, d, epsabs=1.49e-8, epsrel=1.49e-8,
+                      max_evals=500_000, lote=32, full_output=False):
+    """
+    Integra func sobre [a, b] x [c, d] con cubatura adaptativa vectorizada.
+
+    Mantiene una cola de prioridad de rectángulos ordenada por su error
+    local estimado (regla producto Gauss-Kronrod 7-15). En cada paso toma
+    los rectángulos con mayor error, los divide en cuatro y evalúa los
+    nodos de todos los hijos en una sola llamada a func. Termina al
+    alcanzar la tolerancia o el límite de evaluaciones.
+
+    Args:
+        func: Función z = f(x, y) que acepta arrays
+        a, b: Límites del dominio en x [a, b]
+        c, d: Límites del dominio en y [c, d]
+        epsabs, epsrel: Tolerancias absoluta y relativa
+        max_evals: Límite de evaluaciones de la función
+        lote: Máximo de rectángulos subdivididos por paso
+        full_output: Si es True, devuelve además un diccionario con el
+            número de evaluaciones ('neval'), de subdivisiones
+            ('subdivisions') y de rectángulos finales ('rectangles')
+
+    Returns:
+        Volumen calculado y error estimado (y la información adicional
+        si full_output es True)
+    """
+    contador = itertools.count()
+    cx, cy = np.array([(a + b) / 2]), np.array([(c + d) / 2])
+    hx, hy = np.array([(b - a) / 2]), np.array([(d - c) / 2])
+    valores, errores = _kronrod_rectangulos(func, cx, cy, hx, hy)
+    neval = _NODOS_POR_RECTANGULO
+    subdivisiones = 0
+
+    # Cola de prioridad: (-error, desempate, valor, cx, cy, hx, hy)
+    cola = [(-errores[0], next(contador), valores[0], cx[0], cy[0], hx[0], hy[0])]
+
+    while True:
+        volumen = math.fsum(r[2] for r in cola)
+        error = -math.fsum(r[0] for r in cola)
+        tolerancia = max(epsabs, epsrel * abs(volumen))
+        if error <= tolerancia:
+            convergio = True
+            break
+
+        # Cada rectángulo subdividido cuesta cuatro evaluaciones de la regla
+        disponibles = (max_evals - neval) // (4 * _NODOS_POR_RECTANGULO)
+        if disponibles < 1:
+            convergio = False
+            break
+
+        # Tomar los peores rectángulos; después del primero, solo los que
+        # superan su parte proporcional de la tolerancia
+        umbral = tolerancia / len(cola)
+        elegidos = [heapq.heappop(cola)]
+        while cola and len(elegidos) < min(lote, disponibles) and -cola[0][0] > umbral:
+            elegidos.append(heapq.heappop(cola))
+
+        padres = np.array([r[3:] for r in elegidos])
+        hx = np.repeat(padres[:, 2] / 2, 4)
+        hy = np.repeat(padres[:, 3] / 2, 4)
+        cx = np.repeat(padres[:, 0], 4) + hx * np.tile([-1, 1, -1, 1], len(elegidos))
+        cy = np.repeat(padres[:, 1], 4) + hy * np.tile([-1, -1, 1, 1], len(elegidos))
+        valores, errores = _kronrod_rectangulos(func, cx, cy, hx, hy)
+        neval += cx.size * _NODOS_POR_RECTANGULO
+        subdivisiones += len(elegidos)
+
+        for i in range(cx.size):
+            heapq.heappush(cola, (-errores[i], next(contador), valores[i],
+                                  cx[i], cy[i], hx[i], hy[i]))
+
+    if not convergio:
+        warnings.warn(
+            f"Se alcanzó el límite de {max_evals} evaluaciones sin llegar a la "
+            f"tolerancia (error estimado {error:.2e})",
+            IntegrationWarning
+        )
+    if full_output:
+        return volumen, error, {
+            'neval': neval,
+            'subdivisions': subdivisiones,
+            'rectangles': len(cola),
+            'converged': convergio,
+        }
+    return volumen, error
+
+
+def _kronrod_intervalos(func, centros, semianchos):
+    """
+    Aplica la regla Gauss-Kronrod 7-15 a un lote de intervalos con una
+    sola evaluación vectorizada de func (función de una variable).
+
+    Returns:
+        Arrays con la integral de Kronrod y el error estimado
+        |Kronrod - Gauss| de cada intervalo
+    """
+    t = centros[:, None] + semianchos[:, None] * _T15[None, :]
+    valores = np.broadcast_to(np.asarray(func(t), dtype=float), t.shape)
+    _verificar_finitos(valores)
+
+    kronrod = semianchos * (valores @ _W15)
+    gauss = semianchos * (valores[:, 1::2] @ _WG)
+    return kronrod, np.abs(kronrod - gauss)
+
+
+def adaptive_quadrature(func, a, b, epsabs=1e-13, epsrel=1e-11,
+                        max_evals=100_000, lote=32, full_output=False):
+    """
+    Integra una función de una variable sobre [a, b] con cuadratura
+    adaptativa Gauss-Kronrod 7-15 vectorizada: en cada paso se bisecan los
+    intervalos con mayor error y se evalúan los nodos de todos los hijos en
+    una sola llamada a func (ver adaptive_cubature).
+
+    Args:
+        func: Función g(t) que acepta arrays
+        a, b: Límites de integración
+        epsabs, epsrel: Tolerancias absoluta y relativa
+        max_evals: Límite de evaluaciones de la función
+        lote: Máximo de intervalos subdivididos por paso
+        full_output: Si es True, devuelve además un diccionario con el
+            número de evaluaciones ('neval'), de intervalos finales
+            ('intervals') y si se alcanzó la tolerancia ('converged')
+
+    Returns:
+        Integral calculada y error estimado (y la información adicional si
+        full_output es True)
+
+    Raises:
+        ValueError: si la función produce valores no finitos
+    """
+    centros, semianchos = np.array([(a + b) / 2]), np.array([(b - a) / 2])
+    valores, errores = _kronrod_intervalos(func, centros, semianchos)
+    neval = _T15.size
+
+    while True:
+        integral = math.fsum(valores)
+        error = math.fsum(errores)
+        tolerancia = max(epsabs, epsrel * abs(integral))
+        if error <= tolerancia:
+            convergio = True
+            break
+        disponibles = (max_evals - neval) // (2 * _T15.size)
+        if disponibles < 1:
+            convergio = False
+            break
+
+        # Bisecar los peores intervalos (como en adaptive_cubature, después
+        # del primero solo los que superan su parte de la tolerancia)
+        orden = np.argsort(errores)[::-1][:min(lote, disponibles)]
+        orden = orden[(errores[orden] > tolerancia / len(errores))
+                      | (np.arange(len(orden)) == 0)]
+        hijos = np.repeat(semianchos[orden] / 2, 2)
+        medios = np.repeat(centros[orden], 2) + hijos * np.tile([-1, 1], len(orden))
+        nuevos, errores_nuevos = _kronrod_intervalos(func, medios, hijos)
+        neval += medios.size * _T15.size
+
+        quedan = np.ones(len(centros), dtype=bool)
+        quedan[orden] = False
+        centros = np.concatenate([centros[quedan], medios])
+        semianchos = np.concatenate([semianchos[quedan], hijos])
+        valores = np.concatenate([valores[quedan], nuevos])
+        errores = np.concatenate([errores[quedan], errores_nuevos])
+
+    if full_output:
+        return integral, error, {'neval': neval, 'intervals': len(centros),
+                                 'converged': convergio}
+    return integral, error
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Pool de procesos para ejecutar los cálculos de las aplicaciones web fuera
+del hilo que atiende el request.
+
+Cada trabajo tiene un tiempo máximo de ejecución: si lo excede, el proceso
+que lo ejecuta se termina y se reemplaza por uno nuevo, de modo que una
+integración descontrolada no bloquea al servidor. La cantidad de trabajos
+pendientes está acotada (los que no caben se rechazan de inmediato) y cada
+proceso se recicla después de un número fijo de trabajos. El tiempo de
+arranque de un proceso nuevo (incluida la importación de los módulos de
+cálculo) no cuenta para el tiempo máximo del trabajo.
+
+Dentro de cancellable(evento), los trabajos del hilo actual se terminan
+(junto con su proceso) en cuanto se activa el evento, por ejemplo cuando
+el cliente que espera el resultado se desconecta.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import importlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tiempos
+
+
+class PoolFullError(RuntimeError):
+    """No hay lugar en la cola del pool para un trabajo más."""
+
+
+class JobTimeoutError(TimeoutError):
+    """El trabajo excedió su tiempo máximo y su proceso fue terminado."""
+
+
+class JobCancelledError(RuntimeError):
+    """El trabajo se canceló (ver cancellable) y su proceso fue terminado."""
+
+
+# Cada cuánto se comprueba la cancelación mientras se espera un trabajo
+_INTERVALO_CANCELACION = 0.05
+
+_cancelacion = contextvars.ContextVar('calculadora_cancelacion', default=None)
+
+
+@contextlib.contextmanager
+def cancellable(evento):
+    """
+    Los trabajos que se ejecuten en el pool dentro del bloque (en este hilo
+    o tarea) se terminan con JobCancelledError cuando se activa `evento`
+    (threading.Event). Con evento None no hace nada.
+    """
+    if evento is None:
+        yield
+        return
+    token = _cancelacion.set(evento)
+    try:
+        yield
+    finally:
+        _cancelacion.reset(token)
+
+
+def _esperar(conexion, limite, cancelacion):
+    """conexion.poll(limite) que además se interrumpe con JobCancelledError
+    si se activa la cancelación."""
+    if cancelacion is None:
+        return conexion.poll(limite)
+    fin = time.monotonic() + limite
+    while not conexion.poll(min(_INTERVALO_CANCELACION, max(0.0, fin - time.monotonic()))):
+        if cancelacion.is_set():
+            raise JobCancelledError("El cálculo se canceló")
+        if time.monotonic() >= fin:
+            return False
+    return True
+
+
+def _bucle_worker(conexion, modulos):
+    """Bucle de cada proceso: importa los módulos, avisa que está listo,
+    recibe (función, argumentos) y envía el resultado con los tiempos de
+    sus etapas (ver tiempos.py)."""
+    for modulo in modulos:
+        importlib.import_module(modulo)
+    conexion.send('listo')
+    while True:
+        try:
+            tarea = conexion.recv()
+        except EOFError:
+            break
+        if tarea is None:
+            break
+
+        funcion, argumentos = tarea
+        with tiempos.recording() as registro:
+            try:
+                respuesta = (True, funcion(*argumentos))
+            except Exception as e:
+                respuesta = (False, e)
+        try:
+            conexion.send(respuesta + (registro.export(),))
+        except Exception as e:
+            # Resultado o excepción que no se puede serializar
+            conexion.send((False, RuntimeError(str(e)), registro.export()))
+
+
+class _Worker:
+    """Proceso de cálculo con su extremo de la tubería de comunicación."""
+
+    def __init__(self, contexto, modulos):
+        self.conexion, extremo_hijo = contexto.Pipe()
+        self.proceso = contexto.Process(target=_bucle_worker, args=(extremo_hijo, modulos),
+                                        daemon=True)
+        self.proceso.start()
+        extremo_hijo.close()
+        self.trabajos = 0
+
+    def terminar(self, forzar=False):
+        try:
+            if forzar:
+                self.proceso.kill()
+            else:
+                self.conexion.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proceso.join(timeout=1)
+        if self.proceso.is_alive():
+            self.proceso.kill()
+            self.proceso.join()
+        self.conexion.close()
+
+
+class CalculationPool:
+    """
+    Pool de procesos con tiempo máximo por trabajo, cola acotada y
+    reciclado de procesos.
+
+    Los procesos se crean a demanda (hasta `processes`) con el método
+    'spawn', por lo que las funciones que se ejecutan deben poder
+    importarse desde un módulo.
+    """
+
+    def __init__(self, processes=None, max_queue=None, timeout=30.0,
+                 max_jobs_per_worker=100, preload=('nucleo',), startup_timeout=60.0):
+        """
+        Args:
+            processes: Número máximo de procesos (por defecto, los núcleos)
+            max_queue: Trabajos que pueden esperar a un proceso libre,
+                además de los que se están ejecutando (por defecto 2 por proceso)
+            timeout: Tiempo máximo de ejecución de cada trabajo en segundos
+            max_jobs_per_worker: Trabajos tras los cuales se recicla un proceso
+            preload: Módulos que cada proceso importa al iniciarse, antes de
+                aceptar trabajos
+            startup_timeout: Tiempo máximo en segundos para que un proceso
+                nuevo termine de iniciarse
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.max_queue = 2 * self.processes if max_queue is None else max_queue
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.preload = tuple(preload)
+        self.startup_timeout = startup_timeout
+
+        self._contexto = multiprocessing.get_context('spawn')
+        self._lugares = threading.BoundedSemaphore(self.processes + self.max_queue)
+        # Procesos libres. None representa un lugar vacío donde crear un
+        # proceso nuevo; al ser una pila, se prefieren los ya iniciados.
+        self._libres = queue.LifoQueue()
+        for _ in range(self.processes):
+            self._libres.put(None)
+        self._cerrado = False
+        self._hilos = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _obtener_worker(self, cancelacion=None):
+        """
+        Toma un proceso libre (o crea uno en un lugar vacío), esperando si no
+        hay. Un proceso nuevo se devuelve recién cuando avisa que está listo.
+        """
+        worker = self._libres.get()
+        if worker is not None:
+            return worker
+        nuevo = None
+        try:
+            nuevo = _Worker(self._contexto, self.preload)
+            try:
+                listo = _esperar(nuevo.conexion, self.startup_timeout, cancelacion)
+                if listo:
+                    nuevo.conexion.recv()
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"El proceso de cálculo terminó al iniciarse: {e}")
+            if not listo:
+                raise RuntimeError("El proceso de cálculo no terminó de iniciarse a tiempo")
+        except BaseException:
+            if nuevo is not None:
+                nuevo.terminar(forzar=True)
+            self._libres.put(None)
+            raise
+        return nuevo
+
+    def _descartar(self, worker, forzar):
+        """Termina un proceso y deja su lugar libre para uno nuevo."""
+        worker.terminar(forzar=forzar)
+        self._libres.put(None)
+
+    def run(self, funcion, *argumentos, timeout=None):
+        """
+        Ejecuta funcion(*argumentos) en un proceso del pool y devuelve su
+        resultado. Las excepciones de la función se relanzan aquí.
+
+        Raises:
+            PoolFullError: si la cola de trabajos está llena
+            JobTimeoutError: si el trabajo excede el tiempo máximo
+            JobCancelledError: si se cancela (ver cancellable)
+        """
+        if self._cerrado:
+            raise RuntimeError("El pool de cálculo está cerrado")
+        cancelacion = _cancelacion.get()
+        if cancelacion is not None and cancelacion.is_set():
+            raise JobCancelledError("El cálculo se canceló")
+        if not self._lugares.acquire(blocking=False):
+            raise PoolFullError("Hay demasiados cálculos en curso")
+
+        limite = self.timeout if timeout is None else timeout
+        # El tiempo de espera y comunicación con el proceso queda en 'pool';
+        # el del propio cálculo, en las etapas que devuelve el proceso
+        with tiempos.stage('pool'):
+            try:
+                worker = self._obtener_worker(cancelacion)
+                try:
+                    worker.conexion.send((funcion, argumentos))
+                    terminado = _esperar(worker.conexion, limite, cancelacion)
+                    if terminado:
+                        exito, valor, etapas = worker.conexion.recv()
+                        tiempos.absorb(etapas)
+                except (EOFError, OSError) as e:
+                    self._descartar(worker, forzar=True)
+                    raise RuntimeError(f"El proceso de cálculo terminó inesperadamente: {e}")
+                except BaseException:
+                    self._descartar(worker, forzar=True)
+                    raise
+
+                if not terminado:
+                    self._descartar(worker, forzar=True)
+                    raise JobTimeoutError(f"El cálculo excedió el tiempo máximo de {limite:g} s")
+
+                worker.trabajos += 1
+                if worker.trabajos >= self.max_jobs_per_worker:
+                    self._descartar(worker, forzar=False)
+                else:
+                    self._libres.put(worker)
+            finally:
+                self._lugares.release()
+
+        if exito:
+            return valor
+        raise valor
+
+    def submit(self, funcion, *argumentos, timeout=None):
+        """
+        Versión asíncrona de run con la interfaz de concurrent.futures:
+        devuelve un Future con el resultado o la excepción del trabajo.
+
+        Los trabajos enviados así se despachan desde a lo sumo `processes`
+        hilos, de modo que un lote grande espera su turno en lugar de
+        llenar la cola del pool; solo fallan con PoolFullError si otros
+        requests la ocupan.
+        """
+        with self._lock:
+            if self._hilos is None:
+                self._hilos = ThreadPoolExecutor(max_workers=self.processes,
+                                                 thread_name_prefix='calculo')
+        return self._hilos.submit(self.run, funcion, *argumentos, timeout=timeout)
+
+    def close(self):
+        """Termina todos los procesos libres."""
+        self._cerrado = True
+        if self._hilos is not None:
+            self._hilos.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                worker = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.terminar()
+
+
+def pool_from_env():
+    """
+    Crea el pool de las aplicaciones web según variables de entorno:
+
+    - CALCULADORA_POOL_PROCESSES: número de procesos (0 desactiva el pool
+      y los cálculos se ejecutan en el propio hilo del request)
+    - CALCULADORA_POOL_QUEUE: trabajos que pueden esperar un proceso libre
+    - CALCULADORA_JOB_TIMEOUT: tiempo máximo por trabajo en segundos
+    - CALCULADORA_JOBS_PER_WORKER: trabajos antes de reciclar un proceso
+
+    Returns:
+        CalculationPool, o None si el pool está desactivado
+    """
+    processes = int(os.environ.get('CALCULADORA_POOL_PROCESSES', os.cpu_count() or 1))
+    if processes <= 0:
+        return None
+    max_queue = os.environ.get('CALCULADORA_POOL_QUEUE')
+    return CalculationPool(
+        processes=processes,
+        max_queue=int(max_queue) if max_queue is not None else None,
+        timeout=float(os.environ.get('CALCULADORA_JOB_TIMEOUT', 30)),
+        max_jobs_per_worker=int(os.environ.get('CALCULADORA_JOBS_PER_WORKER', 100)),
+    )
@@ -12,71 +12,31 @@ import numpy as np
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from calculadora_3d import parse_function, calculate_volume, plot_surface_3d
-import matplotlib.pyplot as plt
 
 
-def demo_paraboloid():
-    """Ejemplo: Paraboloide z = x² + y²"""
-    print("\n" + "="*60)
-    print("EJEMPLO 1: PARABOLOIDE")
-    print("="*60)
-    
-    func_str = "x**2 + y**2"
-    a, b, c, d = -2, 2, -2, 2
-    
-    print(f"Función: z = {func_str}")
-    print(f"Dominio: [{a}, {b}] x [{c}, {d}]")
-    
-    func = parse_function(func_str)
-    volume, error = calculate_volume(func, a, b, c, d)
-    
-    print(f"\nVolumen calculado: {volume:.6f}")
-    print(f"Error estimado: {error:.2e}")
-    
-    fig = plot_surface_3d(func, a, b, c, d)
-    plt.figtext(0.5, 0.02, f'Volumen = {volume:.6f}', 
-               ha='center', fontsize=12, bbox=dict(boxstyle='round', 
-               facecolor='wheat', alpha=0.5))
-    plt.savefig('ejemplo_paraboloide.png', dpi=150, bbox_inches='tight')
-    print("Gráfico guardado como: ejemplo_paraboloide.png")
-    plt.close()
+# Ejemplos: título, función, dominio (a, b, c, d) y archivo del gráfico
+EJEMPLOS = [
+    {'titulo': 'PARABOLOIDE', 'func': "x**2 + y**2", 'dominio': (-2, 2, -2, 2),
+     'archivo': 'ejemplo_paraboloide.png'},
+    {'titulo': 'CAMPANA GAUSSIANA', 'func': "exp(-(x**2 + y**2))", 'dominio': (-2, 2, -2, 2),
+     'archivo': 'ejemplo_gaussiana.png'},
+    {'titulo': 'ONDAS SINUSOIDALES', 'func': "sin(x) * cos(y)",
+     'dominio': (0, 2*np.pi, 0, 2*np.pi), 'archivo': 'ejemplo_ondas.png'},
+    {'titulo': 'SILLA DE MONTAR (SADDLE)', 'func': "x**2 - y**2", 'dominio': (-2, 2, -2, 2),
+     'archivo': 'ejemplo_saddle.png'},
+]
 
 
-def demo_gaussian():
-    """Ejemplo: Campana gaussiana z = exp(-(x² + y²))"""
-    print("\n" + "="*60)
-    print("EJEMPLO 2: CAMPANA GAUSSIANA")
-    print("="*60)
-    
-    func_str = "exp(-(x**2 + y**2))"
-    a, b, c, d = -2, 2, -2, 2
-    
-    print(f"Función: z = {func_str}")
-    print(f"Dominio: [{a}, {b}] x [{c}, {d}]")
-    
-    func = parse_function(func_str)
-    volume, error = calculate_volume(func, a, b, c, d)
-    
-    print(f"\nVolumen calculado: {volume:.6f}")
-    print(f"Error estimado: {error:.2e}")
+def demo(numero, ejemplo):
+    """Calcula el volumen de un ejemplo y guarda su gráfico."""
+    import matplotlib.pyplot as plt
     
-    fig = plot_surface_3d(func, a, b, c, d)
-    plt.figtext(0.5, 0.02, f'Volumen = {volume:.6f}', 
-               ha='center', fontsize=12, bbox=dict(boxstyle='round', 
-               facecolor='wheat', alpha=0.5))
-    plt.savefig('ejemplo_gaussiana.png', dpi=150, bbox_inches='tight')
-    print("Gráfico guardado como: ejemplo_gaussiana.png")
-    plt.close()
-
-
-def demo_sine_waves():
-    """Ejemplo: Ondas sinusoidales z = sin(x) * cos(y)"""
     print("\n" + "="*60)
-    print("EJEMPLO 3: ONDAS SINUSOIDALES")
+    print(f"EJEMPLO {numero}: {ejemplo['titulo']}")
     print("="*60)
     
-    func_str = "sin(x) * cos(y)"
-    a, b, c, d = 0, 2*np.pi, 0, 2*np.pi
+    func_str = ejemplo['func']
+    a, b, c, d = ejemplo['dominio']
     
     print(f"Función: z = {func_str}")
     print(f"Dominio: [{a:.2f}, {b:.2f}] x [{c:.2f}, {d:.2f}]")
@@ -91,35 +51,8 @@ def demo_sine_waves():
     plt.figtext(0.5, 0.02, f'Volumen = {volume:.6f}', 
                ha='center', fontsize=12, bbox=dict(boxstyle='round', 
                facecolor='wheat', alpha=0.5))
-    plt.savefig('ejemplo_ondas.png', dpi=150, bbox_inches='tight')
-    print("Gráfico guardado como: ejemplo_ondas.png")
-    plt.close()
-
-
-def demo_saddle():
-    """Ejemplo: Silla de montar z = x² - y²"""
-    print("\n" + "="*60)
-    print("EJEMPLO 4: SILLA DE MONTAR (SADDLE)")
-    print("="*60)
-    
-    func_str = "x**2 - y**2"
-    a, b, c, d = -2, 2, -2, 2
-    
-    print(f"Función: z = {func_str}")
-    print(f"Dominio: [{a}, {b}] x [{c}, {d}]")
-    
-    func = parse_function(func_str)
-    volume, error = calculate_volume(func, a, b, c, d)
-    
-    print(f"\nVolumen calculado: {volume:.6f}")
-    print(f"Error estimado: {error:.2e}")
-    
-    fig = plot_surface_3d(func, a, b, c, d)
-    plt.figtext(0.5, 0.02, f'Volumen = {volume:.6f}', 
-               ha='center', fontsize=12, bbox=dict(boxstyle='round', 
-               facecolor='wheat', alpha=0.5))
-    plt.savefig('ejemplo_saddle.png', dpi=150, bbox_inches='tight')
-    print("Gráfico guardado como: ejemplo_saddle.png")
+    plt.savefig(ejemplo['archivo'], dpi=150, bbox_inches='tight')
+    print(f"Gráfico guardado como: {ejemplo['archivo']}")
     plt.close()
 
 
@@ -131,19 +64,15 @@ def main():
     print("\nGenerando ejemplos y guardando gráficos...")
     
     try:
-        demo_paraboloid()
-        demo_gaussian()
-        demo_sine_waves()
-        demo_saddle()
+        for numero, ejemplo in enumerate(EJEMPLOS, start=1):
+            demo(numero, ejemplo)
         
         print("\n" + "="*60)
         print("TODOS LOS EJEMPLOS COMPLETADOS")
         print("="*60)
         print("\nSe han generado los siguientes archivos:")
-        print("  - ejemplo_paraboloide.png")
-        print("  - ejemplo_gaussiana.png")
-        print("  - ejemplo_ondas.png")
-        print("  - ejemplo_saddle.png")
+        for ejemplo in EJEMPLOS:
+            print(f"  - {ejemplo['archivo']}")
         print("\nPuede ver estos archivos para observar los resultados.")
         
     except Exception as e:
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Motores de evaluación de las funciones z = f(x, y) sobre mallas grandes.
+
+parse_function compila siempre la expresión a código de Python sobre
+ufuncs de NumPy (ver expresiones.py), que es el motor 'numpy'. Si están
+instalados, la misma expresión validada y optimizada puede traducirse a:
+
+- 'numexpr': la expresión se evalúa por bloques que caben en la caché y
+  en varios hilos, sin temporales del tamaño de la malla.
+- 'numba': la expresión se compila a una ufunc de código máquina que
+  recorre la malla una sola vez.
+
+Ninguno de los dos es una dependencia del proyecto: se importan solo al
+elegirlos. Con escalares o arrays pequeños (por ejemplo, dentro de
+dblquad) siempre se usa la versión de NumPy, que no tiene el costo fijo
+de los otros motores.
+"""
+
+import ast
+import functools
+import importlib.util
+
+import numpy as np
+
+from expresiones import (analizar_expresion, compilar_expresion, namespace_evaluacion,
+                         optimizar_expresion)
+
+
+# Motores en orden de preferencia para backend='auto'
+BACKENDS = ('numexpr', 'numba', 'numpy')
+
+# Valores a partir de los cuales se usa el motor elegido en lugar de NumPy
+MIN_VALUES = 4096
+
+
+def available_backends():
+    """Motores instalados, en orden de preferencia ('numpy' siempre está)."""
+    return [nombre for nombre in BACKENDS
+            if nombre == 'numpy' or importlib.util.find_spec(nombre) is not None]
+
+
+def _numexpr(asignaciones, cuerpo):
+    """
+    Evaluador con numexpr: cada temporal común y el cuerpo se evalúan con
+    numexpr.evaluate, o None si la expresión usa operaciones que numexpr
+    no soporta o que evalúa distinto que Python (división entera y resto,
+    que en numexpr sigue el signo del dividendo).
+    """
+    import numexpr
+
+    pasos = asignaciones + [(None, cuerpo)]
+    if any(isinstance(n, ast.BinOp) and isinstance(n.op, (ast.FloorDiv, ast.Mod))
+           for _, sub in pasos for n in ast.walk(sub)):
+        return None
+    textos = [(nombre, ast.unparse(sub)) for nombre, sub in pasos]
+
+    def evaluar(x, y):
+        variables = {'x': np.asarray(x, dtype=np.float64), 'y': np.asarray(y, dtype=np.float64)}
+        for nombre, texto in textos:
+            valor = numexpr.evaluate(texto, local_dict=variables)
+            if nombre is not None:
+                variables[nombre] = valor
+        return valor
+
+    return evaluar
+
+
+@functools.lru_cache(maxsize=64)
+def _ufunc_numba(expresion):
+    """Ufunc de numba (float64, float64) -> float64 de la expresión; la
+    compilación es costosa, así que se guarda por expresión."""
+    import numba
+
+    asignaciones, cuerpo = optimizar_expresion(analizar_expresion(expresion))
+    lineas = ['def _evaluar(x, y):']
+    lineas += [f'    {nombre} = {ast.unparse(sub)}' for nombre, sub in asignaciones]
+    lineas.append(f'    return {ast.unparse(cuerpo)}')
+    namespace = namespace_evaluacion()
+    exec(compile('\n'.join(lineas), '<f(x, y)>', 'exec'), namespace)
+    return numba.vectorize(['float64(float64, float64)'], nopython=True)(namespace['_evaluar'])
+
+
+def _numba(expresion):
+    ufunc = _ufunc_numba(expresion)
+
+    def evaluar(x, y):
+        return ufunc(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+
+    return evaluar
+
+
+def compile_function(func_str, backend='numpy'):
+    """
+    Compila la expresión con el motor de evaluación indicado.
+
+    Args:
+        func_str: String con la expresión matemática
+        backend: 'numpy' (por defecto), 'numexpr', 'numba' o 'auto' (el
+            primero disponible de BACKENDS)
+
+    Returns:
+        Función f(x, y) como la de parse_function, con el atributo
+        adicional `backend`: el motor usado con arrays grandes ('numpy' si
+        el motor pedido no soporta la expresión)
+
+    Raises:
+        ValueError: si la expresión no es válida, o el motor es
+        desconocido o no está instalado
+    """
+    disponibles = available_backends()
+    if backend == 'auto':
+        backend = disponibles[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"Motor de evaluación desconocido: {backend}")
+    if backend not in disponibles:
+        raise ValueError(f"Motor de evaluación no disponible: {backend} (no está instalado)")
+
+    f = compilar_expresion(func_str)
+    f.backend = 'numpy'
+    if backend == 'numpy':
+        return f
+
+    if backend == 'numexpr':
+        evaluar_arrays = _numexpr(*optimizar_expresion(f.arbol))
+    else:
+        evaluar_arrays = _numba(f.expresion)
+    if evaluar_arrays is None:
+        return f
+
+    def g(x, y):
+        if ((type(x) is not np.ndarray and type(y) is not np.ndarray)
+                or np.broadcast(x, y).size < MIN_VALUES):
+            return f(x, y)
+        try:
+            return evaluar_arrays(x, y)
+        except Exception as e:
+            raise ValueError(f"Error al evaluar la función: {e}")
+
+    g.expresion = f.expresion
+    g.arbol = f.arbol
+    g.codigo = f.codigo
+    g.backend = backend
+    return g
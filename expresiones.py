@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+Motor de expresiones para funciones z = f(x, y).
+Analiza la expresión una sola vez en un árbol sintáctico (AST), verifica
+que solo use operaciones y nombres permitidos, y la compila a una función
+de Python cuyo costo por llamada es únicamente la aritmética.
+"""
+
+import ast
+import functools
+from types import MappingProxyType
+
+import numpy as np
+
+
+# Funciones matemáticas permitidas (aceptan escalares y arrays de NumPy).
+# Son de solo lectura: se comparten entre todas las funciones compiladas.
+FUNCIONES = MappingProxyType({
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'exp': np.exp,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+})
+
+# Constantes con nombre
+CONSTANTES = MappingProxyType({
+    'pi': np.pi,
+    'e': np.e,
+})
+
+# Variables independientes de la función
+VARIABLES = ('x', 'y')
+
+# Operadores aritméticos permitidos
+_OPERADORES_BINARIOS = (ast.Add, ast.Sub, ast.Mult, ast.Div,
+                        ast.FloorDiv, ast.Mod, ast.Pow)
+_OPERADORES_UNARIOS = (ast.UAdd, ast.USub)
+
+
+def _validar_nodo(nodo):
+    """
+    Recorre recursivamente el AST y lanza ValueError ante cualquier
+    elemento que no sea aritmética sobre x, y, constantes y funciones
+    permitidas.
+    """
+    if isinstance(nodo, ast.Constant):
+        valor = nodo.value
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+            raise ValueError(f"Constante no permitida: {valor!r}")
+    elif isinstance(nodo, ast.Name):
+        if nodo.id not in VARIABLES and nodo.id not in CONSTANTES:
+            raise ValueError(f"Nombre no permitido: '{nodo.id}'")
+    elif isinstance(nodo, ast.BinOp):
+        if not isinstance(nodo.op, _OPERADORES_BINARIOS):
+            raise ValueError(f"Operador no permitido: {type(nodo.op).__name__}")
+        _validar_nodo(nodo.left)
+        _validar_nodo(nodo.right)
+    elif isinstance(nodo, ast.UnaryOp):
+        if not isinstance(nodo.op, _OPERADORES_UNARIOS):
+            raise ValueError(f"Operador no permitido: {type(nodo.op).__name__}")
+        _validar_nodo(nodo.operand)
+    elif isinstance(nodo, ast.Call):
+        if not isinstance(nodo.func, ast.Name) or nodo.func.id not in FUNCIONES:
+            nombre = getattr(nodo.func, 'id', type(nodo.func).__name__)
+            raise ValueError(f"Función no permitida: '{nombre}'")
+        if nodo.keywords or len(nodo.args) != 1:
+            raise ValueError(f"La función '{nodo.func.id}' recibe exactamente un argumento")
+        _validar_nodo(nodo.args[0])
+    else:
+        raise ValueError(f"Elemento no permitido en la función: {type(nodo).__name__}")
+
+
+def namespace_evaluacion():
+    """Namespace de evaluación con las funciones y constantes permitidas."""
+    namespace = {'__builtins__': {}}
+    namespace.update(FUNCIONES)
+    namespace.update(CONSTANTES)
+    return namespace
+
+
+def analizar_expresion(func_str):
+    """
+    Convierte la cadena en un AST y valida su contenido.
+
+    Args:
+        func_str: String con la expresión matemática (ej: "x**2 + y**2")
+
+    Returns:
+        ast.Expression validado
+
+    Raises:
+        ValueError: si la sintaxis es inválida o usa elementos no permitidos
+    """
+    try:
+        arbol = ast.parse(func_str.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Sintaxis inválida en la función: {e.msg}")
+
+    _validar_nodo(arbol.body)
+    return arbol
+
+
+def normalizar_expresion(func_str):
+    """
+    Devuelve la forma canónica de la expresión, generada a partir de su
+    AST: expresiones que solo difieren en espacios o paréntesis
+    redundantes producen la misma cadena.
+
+    Raises:
+        ValueError: si la expresión no es válida
+    """
+    return ast.unparse(analizar_expresion(func_str))
+
+
+def compilar_expresion(func_str):
+    """
+    Analiza, valida y compila una expresión a una función f(x, y).
+
+    El análisis y la compilación ocurren una sola vez; la función
+    resultante evalúa directamente el código compilado, con x e y como
+    variables locales, y funciona tanto con escalares como con arrays.
+    Antes de compilar, el árbol se optimiza: se pliegan las constantes
+    (pi/2 se calcula una vez), las potencias enteras pequeñas se reescriben
+    como productos (x**2 -> x*x) y las subexpresiones repetidas se calculan
+    una sola vez en temporales. Con arrays se usa además una versión que
+    encadena las ufuncs de NumPy con out=, reutilizando los temporales
+    propios en lugar de reservar un array nuevo por operación.
+
+    La función no guarda estado entre llamadas: x, y y los temporales
+    viven en el marco de cada llamada y el namespace global (funciones y
+    constantes) nunca se modifica después de compilar, por lo que es
+    reentrante y puede evaluarse simultáneamente desde varios hilos.
+
+    Args:
+        func_str: String con la expresión matemática
+
+    Returns:
+        Función f(x, y). Expone los atributos `expresion` (forma canónica
+        de la expresión), `arbol` (AST validado) y `codigo` (código
+        generado para arrays).
+    """
+    arbol = analizar_expresion(func_str)
+    asignaciones, cuerpo = optimizar_expresion(arbol)
+
+    # Versiones general y para arrays; cada una con su namespace propio,
+    # que solo se lee durante la evaluación
+    general = _codigo_general(asignaciones, cuerpo)
+    en_sitio = _codigo_en_sitio(asignaciones, cuerpo)
+    namespace = namespace_evaluacion()
+    exec(compile(general, '<f(x, y)>', 'exec'), namespace)
+    evaluar = namespace['_evaluar']
+    namespace = _namespace_en_sitio()
+    exec(compile(en_sitio, '<f(x, y)>', 'exec'), namespace)
+    evaluar_arrays = namespace['_evaluar_arrays']
+
+    def f(x, y):
+        try:
+            if type(x) is np.ndarray or type(y) is np.ndarray:
+                return evaluar_arrays(x, y)
+            return evaluar(x, y)
+        except Exception as e:
+            raise ValueError(f"Error al evaluar la función: {e}")
+
+    f.expresion = ast.unparse(arbol)
+    f.arbol = arbol
+    f.codigo = en_sitio
+    return f
+
+
+# Máximo de términos al expandir productos y potencias en descomponer_separable
+MAX_TERMINOS = 64
+
+
+def variables_en(nodo):
+    """Variables independientes que aparecen en el subárbol."""
+    return {n.id for n in ast.walk(nodo) if isinstance(n, ast.Name) and n.id in VARIABLES}
+
+
+def valor_constante(nodo):
+    """Evalúa un subárbol sin variables; None si no da un número finito."""
+    codigo = compile(ast.fix_missing_locations(ast.Expression(body=nodo)), '<constante>', 'eval')
+    try:
+        with np.errstate(all='ignore'):
+            valor = float(eval(codigo, namespace_evaluacion()))
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    return valor if np.isfinite(valor) else None
+
+
+def _producto(factores):
+    """Nodo con el producto de una secuencia no vacía de nodos."""
+    resultado = factores[0]
+    for factor in factores[1:]:
+        resultado = ast.BinOp(left=resultado, op=ast.Mult(), right=factor)
+    return resultado
+
+
+def _suma(sumandos):
+    """Nodo con la suma de una secuencia no vacía de nodos."""
+    resultado = sumandos[0]
+    for sumando in sumandos[1:]:
+        resultado = ast.BinOp(left=resultado, op=ast.Add(), right=sumando)
+    return resultado
+
+
+def _potencia(factores, exponente):
+    """Factores (tupla) con el producto de los factores elevado a exponente."""
+    if not factores:
+        return ()
+    return (ast.BinOp(left=_producto(factores), op=ast.Pow(), right=ast.Constant(exponente)),)
+
+
+def _multiplicar(terminos_a, terminos_b):
+    """Producto distributivo de dos sumas de términos separables."""
+    if len(terminos_a) * len(terminos_b) > MAX_TERMINOS:
+        return None
+    return [(ca * cb, fxa + fxb, fya + fyb)
+            for ca, fxa, fya in terminos_a for cb, fxb, fyb in terminos_b]
+
+
+def _terminos(nodo):
+    """
+    Descompone un nodo validado en una suma de términos separables
+    (coeficiente, factores que solo dependen de x, factores que solo
+    dependen de y), o devuelve None si no se reconoce como separable.
+    """
+    variables = variables_en(nodo)
+    if not variables:
+        valor = valor_constante(nodo)
+        return None if valor is None else [(valor, (), ())]
+    if variables == {'x'}:
+        return [(1.0, (nodo,), ())]
+    if variables == {'y'}:
+        return [(1.0, (), (nodo,))]
+
+    if isinstance(nodo, ast.UnaryOp):
+        terminos = _terminos(nodo.operand)
+        if terminos is None or isinstance(nodo.op, ast.UAdd):
+            return terminos
+        return [(-c, fx, fy) for c, fx, fy in terminos]
+
+    if isinstance(nodo, ast.BinOp):
+        if isinstance(nodo.op, ast.Pow):
+            exponente = valor_constante(nodo.right) if not variables_en(nodo.right) else None
+            base = _terminos(nodo.left)
+            if base is None or exponente is None or exponente != int(exponente):
+                return None
+            exponente = int(exponente)
+            if len(base) == 1:
+                # (c g(x) h(y))**n = c**n g(x)**n h(y)**n para n entero
+                c, fx, fy = base[0]
+                try:
+                    coeficiente = float(c) ** exponente
+                except (ZeroDivisionError, OverflowError):
+                    return None
+                return [(coeficiente, _potencia(fx, exponente), _potencia(fy, exponente))]
+            if not 1 <= exponente <= 4:
+                return None
+            resultado = base
+            for _ in range(exponente - 1):
+                resultado = _multiplicar(resultado, base)
+                if resultado is None:
+                    return None
+            return resultado
+
+        izquierda, derecha = _terminos(nodo.left), _terminos(nodo.right)
+        if izquierda is None or derecha is None:
+            return None
+        if isinstance(nodo.op, ast.Add):
+            return izquierda + derecha if len(izquierda) + len(derecha) <= MAX_TERMINOS else None
+        if isinstance(nodo.op, ast.Sub):
+            if len(izquierda) + len(derecha) > MAX_TERMINOS:
+                return None
+            return izquierda + [(-c, fx, fy) for c, fx, fy in derecha]
+        if isinstance(nodo.op, ast.Mult):
+            return _multiplicar(izquierda, derecha)
+        if isinstance(nodo.op, ast.Div) and len(derecha) == 1 and derecha[0][0] != 0:
+            # a / (c g(x) h(y)) = a * (1/c) * (1/g(x)) * (1/h(y))
+            c, fx, fy = derecha[0]
+            return _multiplicar(izquierda, [(1.0 / c, _potencia(fx, -1), _potencia(fy, -1))])
+        return None
+
+    if isinstance(nodo, ast.Call) and nodo.func.id == 'exp':
+        # exp(g(x) + h(y) + c) = e**c * exp(g(x)) * exp(h(y))
+        terminos = _terminos(nodo.args[0])
+        if terminos is None or any(fx and fy for _, fx, fy in terminos):
+            return None
+        constante = sum(c for c, fx, fy in terminos if not fx and not fy)
+        factores = {}
+        for variable, indice in (('x', 1), ('y', 2)):
+            sumandos = [ast.BinOp(left=ast.Constant(t[0]), op=ast.Mult(), right=_producto(t[indice]))
+                        for t in terminos if t[indice]]
+            factores[variable] = ((ast.Call(func=ast.Name(id='exp', ctx=ast.Load()),
+                                            args=[_suma(sumandos)], keywords=[]),)
+                                  if sumandos else ())
+        if not np.isfinite(np.exp(constante)):
+            return None
+        return [(float(np.exp(constante)), factores['x'], factores['y'])]
+
+    return None
+
+
+def descomponer_separable(func_str):
+    """
+    Reconoce expresiones separables: sumas de términos de la forma
+    c * g(x) * h(y), expandiendo productos, cocientes por un término,
+    potencias enteras y exponenciales de sumas (exp(g(x) + h(y)) =
+    exp(g(x)) * exp(h(y))).
+
+    Args:
+        func_str: String con la expresión matemática
+
+    Returns:
+        Lista de tuplas (c, factores_x, factores_y), donde factores_x y
+        factores_y son tuplas de nodos AST que solo dependen de x o de y
+        respectivamente (vacías si el término no depende de esa variable);
+        o None si la expresión no se reconoce como separable.
+
+    Raises:
+        ValueError: si la expresión no es válida
+    """
+    return _terminos(analizar_expresion(func_str).body)
+
+
+def _compilar_factor(factores, variable):
+    """Compila el producto de los factores a una función de una variable,
+    o devuelve None si no hay factores (el factor es 1)."""
+    if not factores:
+        return None
+    argumentos = ast.arguments(posonlyargs=[], args=[ast.arg(arg=variable)],
+                               kwonlyargs=[], kw_defaults=[], defaults=[])
+    funcion = ast.Expression(body=ast.Lambda(args=argumentos, body=_producto(factores)))
+    codigo = compile(ast.fix_missing_locations(funcion), f'<f({variable})>', 'eval')
+    return eval(codigo, namespace_evaluacion())
+
+
+@functools.lru_cache(maxsize=256)
+def compilar_separable(func_str):
+    """
+    Compila los términos de una expresión separable (ver
+    descomponer_separable) a funciones de una sola variable.
+
+    Args:
+        func_str: String con la expresión matemática
+
+    Returns:
+        Tupla de (c, g, h), con g(x) y h(y) funciones que aceptan arrays
+        (None si el término no depende de esa variable), o None si la
+        expresión no es separable
+    """
+    terminos = descomponer_separable(func_str)
+    if terminos is None:
+        return None
+    return tuple((c, _compilar_factor(fx, 'x'), _compilar_factor(fy, 'y'))
+                 for c, fx, fy in terminos)
+
+
+# Exponentes enteros que se reescriben como productos (x**2 -> x*x)
+_POTENCIAS_ENTERAS = (-1, 2, 3, 4)
+
+# Ufuncs de NumPy de cada operador, usadas por la versión en sitio
+_UFUNCS = {
+    ast.Add: 'add', ast.Sub: 'subtract', ast.Mult: 'multiply', ast.Div: 'true_divide',
+    ast.FloorDiv: 'floor_divide', ast.Mod: 'remainder', ast.Pow: 'power',
+}
+
+
+def _reescribir_potencia(base, exponente):
+    """x**2 -> x*x, x**3 -> x*x*x, x**4 -> (x*x)*(x*x), x**-1 -> 1.0/x
+    (las copias de la base se comparten después con _extraer_comunes)."""
+    if exponente == -1:
+        return ast.BinOp(left=ast.Constant(1.0), op=ast.Div(), right=base)
+    cuadrado = ast.BinOp(left=base, op=ast.Mult(), right=base)
+    if exponente == 2:
+        return cuadrado
+    if exponente == 3:
+        return ast.BinOp(left=cuadrado, op=ast.Mult(), right=base)
+    return ast.BinOp(left=cuadrado, op=ast.Mult(), right=cuadrado)
+
+
+def _optimizar(nodo):
+    """
+    Devuelve un árbol nuevo equivalente con las constantes plegadas (los
+    subárboles sin variables se reemplazan por su valor, como pi/2) y las
+    potencias enteras pequeñas reescritas como productos.
+    """
+    if not variables_en(nodo):
+        valor = valor_constante(nodo)
+        if valor is not None:
+            return ast.Constant(valor)
+        return nodo
+    if isinstance(nodo, ast.UnaryOp):
+        operando = _optimizar(nodo.operand)
+        if isinstance(nodo.op, ast.UAdd):
+            return operando
+        return ast.UnaryOp(op=nodo.op, operand=operando)
+    if isinstance(nodo, ast.Call):
+        return ast.Call(func=nodo.func, args=[_optimizar(nodo.args[0])], keywords=[])
+    if isinstance(nodo, ast.BinOp):
+        izquierda, derecha = _optimizar(nodo.left), _optimizar(nodo.right)
+        if (isinstance(nodo.op, ast.Pow) and isinstance(derecha, ast.Constant)
+                and derecha.value in _POTENCIAS_ENTERAS):
+            return _reescribir_potencia(izquierda, int(derecha.value))
+        return ast.BinOp(left=izquierda, op=nodo.op, right=derecha)
+    return nodo
+
+
+def optimizar_expresion(arbol):
+    """
+    Optimiza un AST validado (ver analizar_expresion): pliega constantes,
+    reescribe potencias enteras pequeñas como productos y extrae las
+    subexpresiones comunes.
+
+    Returns:
+        tuple: (asignaciones, cuerpo), con asignaciones una lista de
+        (nombre, nodo) de temporales en orden de cálculo y cuerpo el nodo
+        final de la expresión, que puede referirse a esos temporales
+    """
+    return _extraer_comunes(_optimizar(arbol.body))
+
+
+def _extraer_comunes(nodo):
+    """
+    Eliminación de subexpresiones comunes: las operaciones que aparecen más
+    de una vez se calculan una sola vez en variables temporales.
+
+    Returns:
+        tuple: (asignaciones, cuerpo), con asignaciones una lista de
+        (nombre, nodo) en orden de cálculo y cuerpo el nodo final, donde
+        las subexpresiones repetidas se reemplazan por su temporal
+    """
+    operaciones = (ast.BinOp, ast.UnaryOp, ast.Call)
+    apariciones = {}
+
+    def contar(sub):
+        # Los hijos de una subexpresión repetida se cuentan una sola vez,
+        # porque solo se calculan una vez
+        if not isinstance(sub, operaciones):
+            return
+        clave = ast.dump(sub)
+        apariciones[clave] = apariciones.get(clave, 0) + 1
+        if apariciones[clave] == 1:
+            for hijo in ast.iter_child_nodes(sub):
+                contar(hijo)
+
+    contar(nodo)
+
+    asignaciones = []
+    temporales = {}
+
+    def reemplazar(sub):
+        if not isinstance(sub, operaciones):
+            return sub
+        clave = ast.dump(sub)
+        if clave in temporales:
+            return ast.Name(id=temporales[clave], ctx=ast.Load())
+        if isinstance(sub, ast.BinOp):
+            nuevo = ast.BinOp(left=reemplazar(sub.left), op=sub.op, right=reemplazar(sub.right))
+        elif isinstance(sub, ast.UnaryOp):
+            nuevo = ast.UnaryOp(op=sub.op, operand=reemplazar(sub.operand))
+        else:
+            nuevo = ast.Call(func=sub.func, args=[reemplazar(sub.args[0])], keywords=[])
+        if apariciones[clave] < 2:
+            return nuevo
+        nombre = f'_t{len(asignaciones)}'
+        asignaciones.append((nombre, nuevo))
+        temporales[clave] = nombre
+        return ast.Name(id=nombre, ctx=ast.Load())
+
+    return asignaciones, reemplazar(nodo)
+
+
+def _codigo_general(asignaciones, cuerpo):
+    """Código de la versión general (escalares o arrays) con operadores de Python."""
+    lineas = ['def _evaluar(x, y):']
+    lineas += [f'    {nombre} = {ast.unparse(sub)}' for nombre, sub in asignaciones]
+    lineas.append(f'    return {ast.unparse(cuerpo)}')
+    return '\n'.join(lineas)
+
+
+def _codigo_en_sitio(asignaciones, cuerpo):
+    """
+    Código de la versión para arrays: cada operación es una llamada a la
+    ufunc con out= sobre un temporal propio ya reservado (cuando tiene la
+    forma del resultado), y los temporales se liberan apenas se consumen,
+    de modo que una expresión con n operaciones mantiene vivos pocos
+    arrays en lugar de n. Un temporal compartido (ver _extraer_comunes)
+    también se reutiliza en sitio en su último uso.
+    """
+    lineas = ['def _evaluar_arrays(x, y):',
+              '    x = _asarray(x, dtype=_float64)',
+              '    y = _asarray(y, dtype=_float64)']
+    usos = {nombre: 0 for nombre, _ in asignaciones}
+    for sub in [sub for _, sub in asignaciones] + [cuerpo]:
+        for hoja in ast.walk(sub):
+            if isinstance(hoja, ast.Name) and hoja.id in usos:
+                usos[hoja.id] += 1
+    contador = [0]
+
+    def nuevo():
+        contador[0] += 1
+        return f'_b{contador[0]}'
+
+    def emitir(nodo):
+        """Emite las líneas del nodo y devuelve (texto, es_temporal_propio)."""
+        if isinstance(nodo, ast.Constant):
+            return repr(nodo.value), False
+        if isinstance(nodo, ast.Name):
+            if nodo.id not in usos:
+                return nodo.id, False
+            usos[nodo.id] -= 1
+            return nodo.id, usos[nodo.id] == 0
+        if isinstance(nodo, (ast.UnaryOp, ast.Call)):
+            operando, propio = emitir(nodo.operand if isinstance(nodo, ast.UnaryOp)
+                                      else nodo.args[0])
+            ufunc = '_negative' if isinstance(nodo, ast.UnaryOp) else nodo.func.id
+            if propio:
+                lineas.append(f'    {operando} = {ufunc}({operando}, out=_libre({operando}))')
+                return operando, True
+            destino = nuevo()
+            lineas.append(f'    {destino} = {ufunc}({operando})')
+            return destino, True
+        izquierda, propio_izq = emitir(nodo.left)
+        derecha, propio_der = emitir(nodo.right)
+        ufunc = '_' + _UFUNCS[type(nodo.op)]
+        if propio_izq or propio_der:
+            destino, otro = (izquierda, derecha) if propio_izq else (derecha, izquierda)
+            lineas.append(f'    {destino} = {ufunc}({izquierda}, {derecha}, '
+                          f'out=_libre({destino}, {otro}))')
+            if propio_izq and propio_der and izquierda != derecha:
+                lineas.append(f'    del {otro}')
+            return destino, True
+        destino = nuevo()
+        lineas.append(f'    {destino} = {ufunc}({izquierda}, {derecha})')
+        return destino, True
+
+    for nombre, sub in asignaciones:
+        texto, propio = emitir(sub)
+        lineas.append(f'    {nombre} = {texto}')
+        if propio:
+            lineas.append(f'    del {texto}')
+    texto, _ = emitir(cuerpo)
+    lineas.append(f'    return {texto}')
+    return '\n'.join(lineas)
+
+
+def _libre(destino, otro=None):
+    """destino si puede recibir el resultado (out=) de la operación con otro
+    operando: un array con la forma del resultado; si no, None."""
+    if type(destino) is not np.ndarray:
+        return None
+    if otro is not None and np.shape(otro) != destino.shape:
+        if np.broadcast_shapes(destino.shape, np.shape(otro)) != destino.shape:
+            return None
+    return destino
+
+
+def _namespace_en_sitio():
+    """Namespace de la versión en sitio: funciones permitidas y ufuncs."""
+    namespace = namespace_evaluacion()
+    namespace.update({'_' + nombre: getattr(np, nombre) for nombre in _UFUNCS.values()})
+    namespace.update({'_negative': np.negative, '_asarray': np.asarray, '_float64': np.float64,
+                      '_libre': _libre})
+    return namespace
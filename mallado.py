@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Muestreo adaptativo de superficies z = f(x, y).
+
+En lugar de una malla uniforme, se parte de una retícula gruesa de celdas
+y se subdividen (en cuatro) solo las celdas donde la superficie se aparta
+de la interpolación lineal entre sus vértices, de modo que las zonas planas
+usan pocos puntos y los picos o bordes abruptos reciben más. El resultado
+es una malla de triángulos (vértices y caras) como la que usa mesh3d de
+Plotly o plot_trisurf de matplotlib.
+"""
+
+import math
+
+import numpy as np
+
+from cubatura import evaluate_on_nodes
+
+
+# Desplazamientos (en unidades de media celda) de los puntos que se
+# evalúan en cada celda: 4 esquinas, centro y puntos medios de los lados.
+# Los puntos medios y el centro son las esquinas de las 4 celdas hijas.
+_ESQUINAS = np.array([(0, 0), (2, 0), (0, 2), (2, 2)])
+_CENTRO = np.array([(1, 1)])
+_MEDIOS = np.array([(1, 0), (2, 1), (1, 2), (0, 1)])
+# Extremos de cada lado, en el mismo orden que _MEDIOS (índices en _ESQUINAS)
+_EXTREMOS = np.array([(0, 1), (1, 3), (2, 3), (0, 2)])
+
+
+class _Muestras:
+    """
+    Valores de la función en los nodos enteros de la retícula más fina,
+    evaluados a demanda y sin repetir puntos compartidos entre celdas.
+    """
+
+    def __init__(self, func, a, b, c, d, n):
+        self.func = func
+        self.a, self.c = a, c
+        self.hx, self.hy = (b - a) / n, (d - c) / n
+        self.ancho = n + 1
+        self.ids = np.empty(0, dtype=np.int64)
+        self.valores = np.empty(0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def evaluar(self, ix, iy):
+        """Valores en los nodos (ix, iy), evaluando solo los que faltan."""
+        ids = iy.astype(np.int64) * self.ancho + ix
+        nuevos = np.setdiff1d(ids, self.ids)
+        if len(nuevos):
+            x = self.a + (nuevos % self.ancho) * self.hx
+            y = self.c + (nuevos // self.ancho) * self.hy
+            valores = evaluate_on_nodes(self.func, x, y)
+            self.ids = np.concatenate([self.ids, nuevos])
+            self.valores = np.concatenate([self.valores, valores])
+            orden = np.argsort(self.ids)
+            self.ids, self.valores = self.ids[orden], self.valores[orden]
+        return self.valores[np.searchsorted(self.ids, ids)]
+
+    def puntos(self):
+        """Coordenadas x, y y valores z de todos los nodos evaluados."""
+        x = self.a + (self.ids % self.ancho) * self.hx
+        y = self.c + (self.ids // self.ancho) * self.hy
+        return x, y, self.valores
+
+
+def adaptive_mesh(func, a, b, c, d, max_points, tol=1e-3, base_cells=8, max_depth=7):
+    """
+    Muestrea la superficie de forma adaptativa y la triangula.
+
+    En cada celda se evalúan el centro y los puntos medios de los lados; el
+    indicador de error es la mayor diferencia entre esos valores y la
+    interpolación lineal entre los vértices (una medida de la curvatura
+    local). Las celdas cuyo indicador supera tol veces el rango de z se
+    dividen en cuatro, todas las de un mismo nivel a la vez y de forma
+    vectorizada, empezando por las de mayor indicador si no alcanzan los
+    puntos disponibles.
+
+    Args:
+        func: Función z = f(x, y) que acepta arrays
+        a, b, c, d: Límites del dominio
+        max_points: Máximo de puntos a evaluar (por ejemplo, los de la malla
+            uniforme con la que se compara). Se evalúan al menos los 9
+            puntos de una celda
+        tol: Tolerancia relativa al rango de z
+        base_cells: Celdas por eje de la retícula inicial; se reducen si sus
+            (2 * base_cells + 1)^2 puntos superan max_points
+        max_depth: Máximo de subdivisiones de una celda
+
+    Returns:
+        dict con los vértices 'x', 'y', 'z' (arrays 1-D) y 'faces', array
+        (n, 3) de índices de vértices por triángulo. Los triángulos con
+        algún vértice no finito se descartan.
+    """
+    from scipy.spatial import Delaunay
+
+    # La primera pasada evalúa esquinas, centros y puntos medios de todas
+    # las celdas iniciales: (2 * base_cells + 1)^2 puntos
+    base_cells = max(1, min(base_cells, (math.isqrt(max(max_points, 0)) - 1) // 2))
+    escala = 1 << max_depth
+    muestras = _Muestras(func, a, b, c, d, base_cells * escala)
+
+    # Celdas activas: esquina inferior izquierda en nodos de la retícula fina
+    iy0, ix0 = np.divmod(np.arange(base_cells**2), base_cells)
+    ix0, iy0 = ix0 * escala, iy0 * escala
+    medio = escala // 2
+
+    while medio >= 1 and len(ix0):
+        desplazamientos = np.concatenate([_ESQUINAS, _CENTRO, _MEDIOS]) * medio
+        ix = ix0[:, None] + desplazamientos[:, 0]
+        iy = iy0[:, None] + desplazamientos[:, 1]
+        Z = muestras.evaluar(ix.ravel(), iy.ravel()).reshape(ix.shape)
+
+        esquinas, centro, medios = Z[:, :4], Z[:, 4], Z[:, 5:]
+        indicador = np.maximum(
+            np.abs(centro - esquinas.mean(axis=1)),
+            np.abs(medios - esquinas[:, _EXTREMOS].mean(axis=2)).max(axis=1)
+        )
+
+        finitos = muestras.valores[np.isfinite(muestras.valores)]
+        rango = np.ptp(finitos) if len(finitos) else 0.0
+        refinar = np.flatnonzero(indicador > tol * max(rango, np.finfo(float).tiny))
+
+        # Cada celda dividida agrega a lo sumo 16 puntos nuevos en el nivel
+        # siguiente (4 centros y 12 puntos medios de sus hijas)
+        disponibles = (max_points - len(muestras)) // 16
+        if len(refinar) > disponibles:
+            refinar = refinar[np.argsort(indicador[refinar])[::-1][:max(disponibles, 0)]]
+
+        hijos = np.array([(0, 0), (1, 0), (0, 1), (1, 1)]) * medio
+        ix0 = (ix0[refinar, None] + hijos[:, 0]).ravel()
+        iy0 = (iy0[refinar, None] + hijos[:, 1]).ravel()
+        medio //= 2
+
+    x, y, z = muestras.puntos()
+    caras = Delaunay(np.column_stack([x, y])).simplices
+    caras = caras[np.all(np.isfinite(z[caras]), axis=1)]
+    return {'x': x, 'y': y, 'z': z, 'faces': caras}
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+Núcleo numérico de la calculadora: parsing de funciones, integración y
+evaluación de mallas. No depende de matplotlib ni de plotly, de modo que
+las aplicaciones web pueden importarlo sin cargar bibliotecas de gráficos.
+
+La integración y la evaluación de mallas anotan su tiempo y sus
+evaluaciones en el registro del request actual (ver tiempos.py).
+"""
+
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy import integrate
+
+from cubatura import adaptive_cubature, adaptive_quadrature, evaluate_on_nodes, gauss_legendre_2d
+from evaluadores import compile_function
+from expresiones import compilar_separable, normalizar_expresion
+from simbolico import symbolic_integral
+import tiempos
+
+
+def parse_function(func_str, backend='numpy'):
+    """
+    Convierte una cadena de texto en una función evaluable.
+    
+    Args:
+        func_str: String con la expresión matemática (ej: "x**2 + y**2")
+        backend: Motor de evaluación para arrays grandes: 'numpy' (por
+            defecto), 'numexpr', 'numba' o 'auto' (ver evaluadores.py)
+    
+    Returns:
+        Función que puede ser evaluada con valores x, y
+    
+    Raises:
+        ValueError: si la expresión tiene sintaxis inválida o usa nombres
+        u operaciones no permitidas, o si el motor no está disponible
+    
+    La expresión se analiza y valida una sola vez (ver expresiones.py) y
+    se compila a código de Python; cada llamada a f(x, y) solo ejecuta la
+    aritmética, sin volver a interpretar la cadena.
+    """
+    return compile_function(func_str, backend)
+
+
+def symbolic_volume(func, a, b, c, d):
+    """
+    Volumen en forma cerrada si la función es separable y sus factores
+    tienen primitiva conocida (ver simbolico.py).
+    
+    Args:
+        func: Función obtenida con parse_function (otras funciones no
+            tienen expresión y nunca usan la forma cerrada)
+        a, b, c, d: Límites del dominio
+    
+    Returns:
+        tuple: (volumen, error, evaluaciones), o None si no hay forma cerrada
+    """
+    expresion = getattr(func, 'expresion', None)
+    if expresion is None:
+        return None
+    with tiempos.stage('integration'):
+        cerrada = symbolic_integral(expresion, a, b, c, d)
+    if cerrada is not None:
+        tiempos.count('neval', cerrada[2])
+    return cerrada
+
+
+def separable_volume(func, a, b, c, d):
+    """
+    Volumen de una función separable, sum(c * g(x) * h(y)), como suma de
+    productos de integrales de una variable calculadas con cuadratura
+    adaptativa vectorizada (ver cubatura.adaptive_quadrature).
+    
+    Args:
+        func: Función obtenida con parse_function
+        a, b, c, d: Límites del dominio
+    
+    Returns:
+        tuple: (volumen, error, evaluaciones), o None si la función no es
+        separable, algún factor produce valores no finitos o alguna
+        integral no alcanza la tolerancia
+    """
+    with tiempos.stage('integration'):
+        reducida = _separable_volume(func, a, b, c, d)
+    if reducida is not None:
+        tiempos.count('neval', reducida[2])
+    return reducida
+
+
+def _separable_volume(func, a, b, c, d):
+    expresion = getattr(func, 'expresion', None)
+    terminos = compilar_separable(expresion) if expresion is not None else None
+    if terminos is None:
+        return None
+    
+    volume = error = 0.0
+    neval = 0
+    for coef, g, h in terminos:
+        integrales = []
+        for factor, inicio, fin in ((g, a, b), (h, c, d)):
+            if factor is None:
+                integrales.append((fin - inicio, 0.0))
+                continue
+            try:
+                valor, err, info = adaptive_quadrature(factor, inicio, fin, full_output=True)
+            except ValueError:
+                return None
+            if not info['converged']:
+                return None
+            integrales.append((valor, err))
+            neval += info['neval']
+        (ix, ex), (iy, ey) = integrales
+        volume += coef * ix * iy
+        error += abs(coef) * (abs(ix) * ey + abs(iy) * ex + ex * ey)
+    return float(volume), float(error), neval
+
+
+def calculate_volume(func, a, b, c, d, method='dblquad', full_output=False, symbolic=True,
+                     separable=True):
+    """
+    Calcula el volumen bajo la superficie z = f(x, y): en forma cerrada si
+    la función lo permite y, si no, con integración numérica doble.
+    
+    Args:
+        func: Función z = f(x, y)
+        a, b: Límites del dominio en x [a, b]
+        c, d: Límites del dominio en y [c, d]
+        method: Método de integración:
+            - 'dblquad': cuadratura adaptativa de scipy, punto por punto
+            - 'gauss': reglas producto de Gauss-Legendre evaluadas de forma
+              vectorizada sobre toda la malla de nodos (ver cubatura.py)
+            - 'adaptive': cubatura adaptativa vectorizada con subdivisión
+              de rectángulos (ver cubatura.py)
+            Los métodos vectorizados requieren que func acepte arrays de NumPy.
+        full_output: Si es True, devuelve además un diccionario con
+            información del integrador; siempre incluye 'neval', el número
+            de evaluaciones de la función (o de sus primitivas), y 'path',
+            'symbolic', 'separable' o 'numeric' según la vía usada
+        symbolic: Si es True (por defecto), primero se intenta la integral
+            en forma cerrada (ver symbolic_volume)
+        separable: Si es True (por defecto) y no hay forma cerrada, las
+            funciones separables se integran como productos de integrales
+            de una variable (ver separable_volume). Solo si ninguna de las
+            dos vías se aplica se usa `method`
+    
+    Returns:
+        Volumen calculado y error estimado (y la información adicional
+        si full_output es True)
+    """
+    if method not in ('dblquad', 'gauss', 'adaptive'):
+        raise ValueError(f"Método de integración desconocido: {method}")
+    
+    if symbolic:
+        cerrada = symbolic_volume(func, a, b, c, d)
+        if cerrada is not None:
+            volume, error, neval = cerrada
+            if full_output:
+                return volume, error, {'neval': neval, 'path': 'symbolic'}
+            return volume, error
+    
+    if separable:
+        reducida = separable_volume(func, a, b, c, d)
+        if reducida is not None:
+            volume, error, neval = reducida
+            if full_output:
+                return volume, error, {'neval': neval, 'path': 'separable'}
+            return volume, error
+    
+    with tiempos.stage('integration'):
+        if method == 'gauss':
+            volume, error, info = gauss_legendre_2d(func, a, b, c, d, full_output=True)
+        elif method == 'adaptive':
+            volume, error, info = adaptive_cubature(func, a, b, c, d, full_output=True)
+        else:
+            volume, error, info = _dblquad(func, a, b, c, d, full_output=True)
+    tiempos.count('neval', info['neval'])
+    if full_output:
+        info['path'] = 'numeric'
+        return volume, error, info
+    return volume, error
+
+
+def _dblquad(func, a, b, c, d, full_output=False):
+    """Integración con scipy.integrate.dblquad, contando las evaluaciones."""
+    # Usar scipy.integrate.dblquad para integración doble
+    # dblquad(func, a, b, gfun, hfun) integra: ∫ₐᵇ ∫_{gfun(x)}^{hfun(x)} func(y, x) dy dx
+    # Para límites constantes en y, usamos funciones lambda que retornan c y d
+    neval = 0
+    
+    def integrand(y, x):
+        nonlocal neval
+        neval += 1
+        return func(x, y)
+    
+    volume, error = integrate.dblquad(
+        integrand,
+        a, b,      # límites de x
+        lambda x: c,  # límite inferior de y (constante)
+        lambda x: d   # límite superior de y (constante)
+    )
+    
+    if full_output:
+        return volume, error, {'neval': neval}
+    return volume, error
+
+
+# Valores por bloque de filas en evaluate_grid: los temporales de cada
+# bloque (256 KB en float64) caben en la caché del procesador
+TILE_VALUES = 2**15
+
+
+def evaluate_grid(func, a, b, c, d, num_points, dtype=np.float64, out=None,
+                  tile_values=TILE_VALUES):
+    """
+    Evalúa la función sobre una malla uniforme de num_points x num_points.
+    
+    Los ejes se combinan por broadcasting (x como fila, y como columna),
+    sin construir las matrices X e Y completas, y la función se evalúa por
+    bloques de filas escribiendo directamente en el array de salida: la
+    memoria usada es la de Z más los temporales de un bloque.
+    
+    Args:
+        func: Función z = f(x, y)
+        a, b: Límites del dominio en x [a, b]
+        c, d: Límites del dominio en y [c, d]
+        num_points: Número de puntos por eje
+        dtype: Tipo de Z (float64 o float32); la función siempre se evalúa
+            en float64
+        out: Array (num_points, num_points) donde escribir Z, opcional
+        tile_values: Número aproximado de valores por bloque
+    
+    Returns:
+        tuple: (x, y, Z) con los ejes 1-D y los valores Z[j, i] = f(x[i], y[j])
+    """
+    x = np.linspace(a, b, num_points)
+    y = np.linspace(c, d, num_points)
+    if out is None:
+        out = np.empty((num_points, num_points), dtype=dtype)
+    elif out.shape != (num_points, num_points):
+        raise ValueError(f"out debe tener forma {(num_points, num_points)}, no {out.shape}")
+    
+    _evaluar_por_bloques(func, x, y, out, tile_values)
+    return x, y, out
+
+
+def _evaluar_por_bloques(func, x, y, out, tile_values=TILE_VALUES):
+    """Escribe out[j, i] = func(x[i], y[j]) por bloques de filas (out puede ser una vista)."""
+    filas = max(1, tile_values // len(x))
+    fila_x = x[None, :]
+    with tiempos.stage('grid'):
+        for j in range(0, len(y), filas):
+            out[j:j + filas] = func(fila_x, y[j:j + filas, None])
+    tiempos.count('points', out.size)
+
+
+# Puntos por eje del nivel 0 de la pirámide de mallas. Cada nivel duplica
+# los intervalos del anterior (17, 33, 65, 129, 257...), de modo que sus
+# nodos contienen a los del nivel previo
+PYRAMID_BASE_POINTS = 17
+
+
+def level_points(level):
+    """Número de puntos por eje de la malla del nivel `level` de la pirámide."""
+    return (PYRAMID_BASE_POINTS - 1) * 2**level + 1
+
+
+def max_level(max_points):
+    """Nivel más fino de la pirámide con a lo sumo max_points puntos por eje."""
+    level = 0
+    while level_points(level + 1) <= max_points:
+        level += 1
+    return level
+
+
+def refine_grid(func, x, y, Z, tile_values=TILE_VALUES):
+    """
+    Duplica la resolución de una malla uniforme (de n a 2n - 1 puntos por
+    eje) reutilizando los valores ya evaluados: la malla anterior ocupa los
+    nodos pares y la función solo se evalúa en los puntos nuevos (3/4 del
+    total).
+    
+    Args:
+        func: Función z = f(x, y)
+        x, y, Z: Malla a refinar (ver evaluate_grid)
+        tile_values: Número aproximado de valores por bloque
+    
+    Returns:
+        tuple: (x, y, Z) de la malla refinada, con el mismo dtype que Z
+    """
+    x2 = np.linspace(x[0], x[-1], 2 * len(x) - 1)
+    y2 = np.linspace(y[0], y[-1], 2 * len(y) - 1)
+    x2[::2], y2[::2] = x, y
+    
+    Z2 = np.empty((len(y2), len(x2)), dtype=Z.dtype)
+    Z2[::2, ::2] = Z
+    # Columnas nuevas de las filas existentes, y luego las filas nuevas
+    _evaluar_por_bloques(func, x2[1::2], y2[::2], Z2[::2, 1::2], tile_values)
+    _evaluar_por_bloques(func, x2, y2[1::2], Z2[1::2, :], tile_values)
+    return x2, y2, Z2
+
+
+def _pesos_simpson(n, h):
+    """
+    Pesos 1-D de orden 4 para n puntos equiespaciados con paso h: Simpson
+    compuesto, y si n es par el último intervalo se integra con el
+    polinomio cúbico que pasa por los cuatro últimos puntos.
+    """
+    pesos = np.zeros(n)
+    m = n if n % 2 == 1 else n - 1
+    pesos[:m:2] = 2 * h / 3
+    pesos[1:m:2] = 4 * h / 3
+    pesos[0] = pesos[m - 1] = h / 3
+    if m < n:
+        pesos[-4:] += h / 24 * np.array([1, -5, 19, 9])
+    return pesos
+
+
+def grid_volume(x, y, Z):
+    """
+    Estima el volumen a partir de valores ya evaluados sobre una malla
+    uniforme, con una regla de Simpson compuesta en ambas direcciones.
+    
+    El error se estima por extrapolación de Richardson entre la regla con
+    paso h y con paso 2h (un punto de cada dos, malla anidada). Si ambos
+    ejes tienen un número impar de puntos se aplica además el paso de
+    Romberg al volumen; si alguno es par, la estimación del error se hace
+    sobre el bloque de tamaño impar que deja fuera la última fila o
+    columna y se escala al área total.
+    
+    Args:
+        x, y: Ejes 1-D uniformes de la malla (al menos 5 puntos cada uno)
+        Z: Valores Z[j, i] = f(x[i], y[j])
+    
+    Returns:
+        Volumen estimado y error estimado
+    """
+    acumulador = GridVolumeAccumulator(x, y)
+    acumulador.add(0, Z)
+    return acumulador.result()
+
+
+class GridVolumeAccumulator:
+    """
+    Calcula grid_volume agregando la malla por bandas de filas, sin
+    necesidad de tenerla completa en memoria.
+    
+    Las tres reglas de grid_volume (paso h sobre toda la malla, y pasos h
+    y 2h sobre el bloque de tamaño impar) son formas bilineales wy @ Z @ wx,
+    que se acumulan fila por fila.
+    """
+    
+    def __init__(self, x, y):
+        """
+        Args:
+            x, y: Ejes 1-D uniformes de la malla (al menos 5 puntos cada uno)
+        """
+        hx, hy = x[1] - x[0], y[1] - y[0]
+        self.nx, self.ny = len(x), len(y)
+        self._nx_impar = self.nx if self.nx % 2 == 1 else self.nx - 1
+        self._ny_impar = self.ny if self.ny % 2 == 1 else self.ny - 1
+        
+        # Pesos (wy, wx) de cada regla sobre la malla completa, con ceros
+        # fuera de los nodos que usa
+        self._reglas = []
+        for paso, nx, ny in ((1, self.nx, self.ny),
+                             (1, self._nx_impar, self._ny_impar),
+                             (2, self._nx_impar, self._ny_impar)):
+            wx, wy = np.zeros(self.nx), np.zeros(self.ny)
+            wx[:nx:paso] = _pesos_simpson((nx - 1) // paso + 1, paso * hx)
+            wy[:ny:paso] = _pesos_simpson((ny - 1) // paso + 1, paso * hy)
+            self._reglas.append((wy, wx))
+        self._sumas = [0.0, 0.0, 0.0]
+        self.finite = True
+    
+    def add(self, fila, Z):
+        """
+        Agrega una banda de filas de la malla.
+        
+        Args:
+            fila: Índice de la primera fila de la banda
+            Z: Valores de las filas fila, fila + 1, ... (array 2-D)
+        """
+        if not np.all(np.isfinite(Z)):
+            self.finite = False
+            return
+        filas = slice(fila, fila + len(Z))
+        for k, (wy, wx) in enumerate(self._reglas):
+            self._sumas[k] += wy[filas] @ (Z @ wx)
+    
+    def result(self):
+        """
+        Returns:
+            Volumen estimado y error estimado (ver grid_volume); NaN si
+            alguna banda tenía valores no finitos
+        """
+        if not self.finite:
+            return float('nan'), float('nan')
+        volume, sub_h, sub_2h = self._sumas
+        correccion = (sub_h - sub_2h) / 15
+        
+        if self._nx_impar == self.nx and self._ny_impar == self.ny:
+            return float(volume + correccion), float(abs(correccion))
+        
+        escala = ((self.nx - 1) * (self.ny - 1)
+                  / ((self._nx_impar - 1) * (self._ny_impar - 1)))
+        return float(volume), float(abs(correccion) * escala)
+
+
+def volume_from_grid(func, x, y, Z, method='dblquad', epsabs=1.49e-8, epsrel=1.49e-8,
+                     fallback=None):
+    """
+    Obtiene el volumen a partir de una malla ya evaluada.
+    
+    Usa la integral en forma cerrada si existe (ver symbolic_volume); si
+    no, la estimación sobre la malla (ver grid_volume) si alcanza la
+    tolerancia y todos los valores son finitos; y si tampoco, recurre a
+    calculate_volume sobre el dominio de la malla.
+    
+    Args:
+        func: Función z = f(x, y), usada solo en el respaldo
+        x, y, Z: Malla evaluada (ver evaluate_grid)
+        method: Método de calculate_volume usado como respaldo
+        epsabs, epsrel: Tolerancias para aceptar la estimación sobre la malla
+        fallback: Función (a, b, c, d) -> (volumen, error[, método]) que
+            reemplaza a calculate_volume en el respaldo (por ejemplo, para
+            ejecutarlo en otro proceso)
+    
+    Returns:
+        tuple: (volumen, error, método usado: 'symbolic', 'grid',
+        'separable' o el de respaldo)
+    """
+    cerrada = symbolic_volume(func, x[0], x[-1], y[0], y[-1])
+    if cerrada is not None:
+        return cerrada[0], cerrada[1], 'symbolic'
+    
+    with tiempos.stage('integration'):
+        if np.all(np.isfinite(Z)):
+            volume, error = grid_volume(x, y, Z)
+            if error <= max(epsabs, epsrel * abs(volume)):
+                return volume, error, 'grid'
+    
+    return _respaldo(func, x[0], x[-1], y[0], y[-1], method, fallback)
+
+
+def _respaldo(func, a, b, c, d, method, fallback=None):
+    """
+    Volumen de respaldo cuando no alcanza la estimación sobre la malla:
+    fallback(a, b, c, d), que devuelve (volumen, error) o (volumen, error,
+    método), o calculate_volume sin la forma cerrada (ya descartada).
+    
+    Returns:
+        tuple: (volumen, error, método usado: 'separable' o `method`)
+    """
+    if fallback is not None:
+        volume, error, *via = fallback(a, b, c, d)
+        return volume, error, via[0] if via else method
+    volume, error, info = calculate_volume(func, a, b, c, d, method=method, symbolic=False,
+                                           full_output=True)
+    return volume, error, _via(info, method)
+
+
+def _via(info, method):
+    """Método a reportar según la vía usada por calculate_volume."""
+    return method if info['path'] == 'numeric' else info['path']
+
+
+def calculate_surface(func, a, b, c, d, num_points, method='dblquad',
+                      epsabs=1.49e-8, epsrel=1.49e-8):
+    """
+    Genera la malla del gráfico y el volumen evaluando la función una sola vez.
+    
+    El volumen se obtiene en forma cerrada si es posible y, si no, se
+    estima sobre la misma malla del gráfico (ver grid_volume). Solo si esa
+    estimación no alcanza la tolerancia, o si la malla contiene valores no
+    finitos, se recurre a calculate_volume.
+    
+    Args:
+        func: Función z = f(x, y) que acepta arrays
+        a, b: Límites del dominio en x [a, b]
+        c, d: Límites del dominio en y [c, d]
+        num_points: Número de puntos por eje de la malla
+        method: Método de calculate_volume usado como respaldo
+        epsabs, epsrel: Tolerancias para aceptar la estimación sobre la malla
+    
+    Returns:
+        dict con los ejes 'x' e 'y', la malla 'z', 'volume', 'error' y
+        'volume_method' ('symbolic', 'grid', 'separable' o el método de
+        respaldo usado)
+    """
+    x, y, Z = evaluate_grid(func, a, b, c, d, num_points)
+    volume, error, volume_method = volume_from_grid(func, x, y, Z, method=method,
+                                                    epsabs=epsabs, epsrel=epsrel)
+    return {'x': x, 'y': y, 'z': Z, 'volume': volume, 'error': error,
+            'volume_method': volume_method}
+
+
+# Valores por banda de filas en stream_surface (512 KB en float64)
+BAND_VALUES = 2**16
+
+
+def grid_bands(func, a, b, c, d, num_points, band_values=BAND_VALUES):
+    """
+    Evalúa la malla de evaluate_grid por bandas de filas consecutivas.
+    
+    Cada banda se evalúa con los ejes como arrays dispersos (x como fila
+    y el tramo de y como columna), sin construir X e Y completos.
+    
+    Args:
+        func: Función z = f(x, y) que acepta arrays
+        a, b, c, d: Límites del dominio
+        num_points: Número de puntos por eje
+        band_values: Número aproximado de valores por banda
+    
+    Yields:
+        tuple: (índice de la primera fila, valores de la banda)
+    """
+    x = np.linspace(a, b, num_points)
+    y = np.linspace(c, d, num_points)
+    filas = max(1, band_values // num_points)
+    for j in range(0, num_points, filas):
+        yield j, evaluate_on_nodes(func, x[None, :], y[j:j + filas, None])
+
+
+def stream_surface(func, a, b, c, d, num_points, volume=None, fallback=None,
+                   band_values=BAND_VALUES, method='dblquad',
+                   epsabs=1.49e-8, epsrel=1.49e-8):
+    """
+    Versión por bandas de calculate_surface: la malla se produce fila a
+    fila y el volumen se acumula sobre las bandas (ver
+    GridVolumeAccumulator), de modo que la memoria usada no crece con la
+    resolución.
+    
+    Args:
+        func: Función z = f(x, y) que acepta arrays
+        a, b, c, d: Límites del dominio
+        num_points: Número de puntos por eje
+        volume: Tupla (volumen, error, método) ya conocida; si se indica,
+            no se acumula el volumen
+        fallback: Función (a, b, c, d) -> (volumen, error[, método]) usada
+            cuando la estimación sobre la malla no alcanza la tolerancia o hay valores
+            no finitos (por defecto, calculate_volume con `method`)
+        band_values: Número aproximado de valores por banda
+        method: Método de calculate_volume usado como respaldo
+        epsabs, epsrel: Tolerancias para aceptar la estimación sobre la malla
+    
+    Yields:
+        dicts en este orden:
+        - {'type': 'grid', 'x', 'y'}: ejes 1-D de la malla
+        - {'type': 'band', 'row', 'z'}: filas row, row + 1, ... de la malla
+        - {'type': 'volume', 'volume', 'error', 'volume_method'}
+    """
+    x = np.linspace(a, b, num_points)
+    y = np.linspace(c, d, num_points)
+    yield {'type': 'grid', 'x': x, 'y': y}
+    
+    if volume is None:
+        cerrada = symbolic_volume(func, a, b, c, d)
+        if cerrada is not None:
+            volume = (cerrada[0], cerrada[1], 'symbolic')
+    
+    acumulador = GridVolumeAccumulator(x, y) if volume is None else None
+    for fila, Z in grid_bands(func, a, b, c, d, num_points, band_values):
+        if acumulador is not None:
+            acumulador.add(fila, Z)
+        yield {'type': 'band', 'row': fila, 'z': Z}
+    
+    if volume is None:
+        estimacion, error = acumulador.result()
+        if acumulador.finite and error <= max(epsabs, epsrel * abs(estimacion)):
+            volume = (estimacion, error, 'grid')
+        else:
+            volume = _respaldo(func, a, b, c, d, method, fallback)
+    
+    yield {'type': 'volume', 'volume': volume[0], 'error': volume[1],
+           'volume_method': volume[2]}
+
+
+@functools.lru_cache(maxsize=256)
+def _funcion_compilada(func_str):
+    """
+    parse_function con caché por proceso, para los trabajos que reciben la
+    expresión como cadena: cada proceso compila cada expresión una sola vez.
+    """
+    return parse_function(func_str)
+
+
+def compute_surface_job(func_str, a, b, c, d, num_points, with_volume=True):
+    """
+    Trabajo autocontenido para ejecutar en otro proceso (ver ejecutor.py):
+    recibe la expresión como cadena y devuelve solo datos serializables.
+    
+    Args:
+        func_str: String con la expresión matemática
+        a, b, c, d: Límites del dominio
+        num_points: Número de puntos por eje de la malla
+        with_volume: Si es False, solo se evalúa la malla
+    
+    Returns:
+        dict como el de calculate_surface (sin volumen si with_volume es False)
+    """
+    func = _funcion_compilada(func_str)
+    if with_volume:
+        return calculate_surface(func, a, b, c, d, num_points)
+    x, y, Z = evaluate_grid(func, a, b, c, d, num_points)
+    return {'x': x, 'y': y, 'z': Z}
+
+
+def compute_volumes_job(func_str, dominios, method='dblquad'):
+    """
+    Trabajo autocontenido (ver ejecutor.py) que calcula el volumen bajo una
+    misma función sobre varios dominios, compilándola una sola vez. Los
+    errores de cada dominio no afectan a los demás.
+    
+    Args:
+        func_str: String con la expresión matemática
+        dominios: Lista de tuplas (a, b, c, d)
+        method: Método de calculate_volume
+    
+    Returns:
+        Lista con, para cada dominio, la tupla (volumen, error, método
+        usado: 'symbolic', 'separable' o `method`) o el mensaje de error
+        (str)
+    """
+    func = _funcion_compilada(func_str)
+    resultados = []
+    for a, b, c, d in dominios:
+        try:
+            if not np.isfinite(func((a + b) / 2, (c + d) / 2)):
+                raise ValueError("La función produce valores no finitos en el dominio")
+            volume, error, info = calculate_volume(func, a, b, c, d, method=method,
+                                                   full_output=True)
+            if not np.isfinite(volume):
+                raise ValueError("La función produce valores no finitos en el dominio")
+            resultados.append((float(volume), float(error), _via(info, method)))
+        except Exception as e:
+            resultados.append(f"Error al calcular el volumen: {e}")
+    return resultados
+
+
+def validate_job(job):
+    """
+    Valida un trabajo de calculate_batch.
+    
+    Args:
+        job: dict con 'function', 'a', 'b', 'c' y 'd'
+    
+    Returns:
+        tuple: (forma canónica de la expresión, (a, b, c, d))
+    
+    Raises:
+        ValueError: con el motivo por el que el trabajo no es válido
+    """
+    if not isinstance(job, dict):
+        raise ValueError("Cada trabajo debe ser un objeto")
+    for campo in ('function', 'a', 'b', 'c', 'd'):
+        if campo not in job:
+            raise ValueError(f"Falta el campo requerido: {campo}")
+    
+    func_str = job['function']
+    if not isinstance(func_str, str) or not func_str.strip():
+        raise ValueError("La función no puede estar vacía")
+    try:
+        a, b, c, d = (float(job[campo]) for campo in ('a', 'b', 'c', 'd'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Error en los parámetros numéricos: {e}")
+    if a >= b:
+        raise ValueError("Debe cumplirse a < b")
+    if c >= d:
+        raise ValueError("Debe cumplirse c < d")
+    
+    try:
+        expresion = normalizar_expresion(func_str)
+    except ValueError as e:
+        raise ValueError(f"Error al parsear la función: {e}")
+    return expresion, (a, b, c, d)
+
+
+def calculate_batch(jobs, method='dblquad', executor=None, max_workers=None):
+    """
+    Calcula el volumen de varias combinaciones de función y dominio.
+    
+    Los trabajos idénticos (misma expresión en su forma canónica y mismo
+    dominio) se calculan una sola vez. Con varios procesos, cada uno es un
+    trabajo distinto del executor, con su propio tiempo máximo: un dominio
+    lento no hace fallar a los demás. Cada expresión se analiza y compila
+    una sola vez por proceso (ver _funcion_compilada).
+    
+    Args:
+        jobs: Lista de dicts con 'function', 'a', 'b', 'c' y 'd'
+        method: Método de calculate_volume
+        executor: Objeto con submit(funcion, *args) que devuelve un Future
+            (concurrent.futures.ProcessPoolExecutor, ejecutor.CalculationPool).
+            Si es None se crea un ProcessPoolExecutor para el lote
+        max_workers: Procesos entre los que repartir el trabajo (por
+            defecto, los núcleos disponibles). Sin executor y con
+            max_workers=1, o si hay una sola tarea, se calcula en el
+            proceso actual
+    
+    Yields:
+        Un dict por trabajo, en el orden en que terminan:
+        {'index', 'success': True, 'volume', 'error', 'volume_method'} o
+        {'index', 'success': False, 'message'}. Un trabajo inválido o que
+        falla no afecta a los demás.
+    """
+    # expresión -> {dominio: [índices de los trabajos]}
+    grupos = {}
+    for indice, job in enumerate(jobs):
+        try:
+            expresion, dominio = validate_job(job)
+        except ValueError as e:
+            yield {'index': indice, 'success': False, 'message': str(e)}
+            continue
+        grupos.setdefault(expresion, {}).setdefault(dominio, []).append(indice)
+    
+    if not grupos:
+        return
+    
+    workers = max_workers or os.cpu_count() or 1
+    tareas = [(expresion, [dominio]) for expresion, dominios in grupos.items()
+              for dominio in dominios]
+    
+    def resultados(expresion, dominios, valores):
+        for dominio, valor in zip(dominios, valores):
+            for indice in grupos[expresion][dominio]:
+                if isinstance(valor, str):
+                    yield {'index': indice, 'success': False, 'message': valor}
+                else:
+                    yield {'index': indice, 'success': True, 'volume': valor[0],
+                           'error': valor[1], 'volume_method': valor[2]}
+    
+    if executor is None and (workers == 1 or len(tareas) == 1):
+        for expresion, dominios in grupos.items():
+            dominios = list(dominios)
+            yield from resultados(expresion, dominios,
+                                  compute_volumes_job(expresion, dominios, method))
+        return
+    
+    propio = executor is None
+    if propio:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tareas)))
+    try:
+        futuros = {executor.submit(compute_volumes_job, expresion, dominios, method):
+                   (expresion, dominios) for expresion, dominios in tareas}
+        for futuro in as_completed(futuros):
+            expresion, dominios = futuros[futuro]
+            try:
+                valores = futuro.result()
+            except Exception as e:
+                # El trabajo falló (tiempo excedido, pool lleno...)
+                valores = [str(e) or type(e).__name__] * len(dominios)
+            yield from resultados(expresion, dominios, valores)
+    finally:
+        if propio:
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Serialización compacta de mallas para las respuestas de las aplicaciones web.
+En lugar de enviar X, Y y Z como listas anidadas (X e Y son redundantes),
+se envían los ejes 1-D y Z como un buffer float32 codificado en base64.
+"""
+
+import base64
+import json
+
+import numpy as np
+
+
+def encode_array(array, dtype='<f4'):
+    """
+    Codifica un array como buffer binario en base64.
+
+    Args:
+        array: Array de NumPy
+        dtype: Tipo de dato del buffer (por defecto float32 little-endian,
+            el orden de bytes que usan los Float32Array del navegador)
+
+    Returns:
+        dict con 'dtype', 'shape' y 'data' (bytes en base64, orden C)
+    """
+    datos = np.ascontiguousarray(array, dtype=dtype)
+    return {
+        'dtype': np.dtype(dtype).name,
+        'shape': list(datos.shape),
+        'data': base64.b64encode(datos.tobytes()).decode('ascii'),
+    }
+
+
+def decode_array(payload):
+    """Operación inversa de encode_array."""
+    datos = base64.b64decode(payload['data'])
+    dtype = np.dtype(payload['dtype']).newbyteorder('<')
+    return np.frombuffer(datos, dtype=dtype).reshape(payload['shape'])
+
+
+def encode_grid(x, y, Z):
+    """
+    Representación compacta de una malla: ejes 1-D como listas y Z como
+    buffer float32 en base64, con Z[j, i] = f(x[i], y[j]).
+
+    Returns:
+        dict con 'x', 'y' y 'z' (ver encode_array)
+    """
+    return {
+        'x': np.asarray(x).tolist(),
+        'y': np.asarray(y).tolist(),
+        'z': encode_array(Z),
+    }
+
+
+def encode_mesh(x, y, z, faces):
+    """
+    Representación compacta de una malla de triángulos (ver
+    mallado.adaptive_mesh): coordenadas de los vértices en float32 y caras
+    como índices int32, todo con encode_array.
+
+    Returns:
+        dict con 'x', 'y', 'z' y 'faces' (array n x 3)
+    """
+    return {
+        'x': encode_array(x),
+        'y': encode_array(y),
+        'z': encode_array(z),
+        'faces': encode_array(faces, dtype='<i4'),
+    }
+
+
+def encode_stream_record(registro):
+    """
+    Serializa un registro de nucleo.stream_surface como una línea NDJSON:
+    los ejes como listas y cada banda de z con encode_array.
+
+    Returns:
+        str terminado en salto de línea
+    """
+    registro = dict(registro)
+    if registro.get('type') == 'grid':
+        registro['x'] = np.asarray(registro['x']).tolist()
+        registro['y'] = np.asarray(registro['y']).tolist()
+    elif registro.get('type') == 'band':
+        registro['z'] = encode_array(registro['z'])
+    return json.dumps(registro) + '\n'
@@ -19,7 +19,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     /**
      * Función principal que obtiene los datos del formulario,
-     * hace la petición al servidor y renderiza el gráfico
+     * hace la petición al servidor y renderiza el gráfico.
+     * La malla llega por bandas de filas (format 'ndjson') y el gráfico
+     * se actualiza a medida que llegan; el volumen llega al final.
      */
     async function calculateAndPlot() {
         // Ocultar mensajes previos
@@ -36,7 +38,8 @@ document.addEventListener('DOMContentLoaded', function() {
             b: parseFloat(document.getElementById('b').value),
             c: parseFloat(document.getElementById('c').value),
             d: parseFloat(document.getElementById('d').value),
-            resolution: parseInt(document.getElementById('resolution').value)
+            resolution: parseInt(document.getElementById('resolution').value),
+            format: 'ndjson'
         };
         
         try {
@@ -49,17 +52,40 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify(formData)
             });
             
-            const data = await response.json();
-            
-            if (!response.ok || !data.success) {
+            // Los errores de validación llegan como un JSON normal
+            if (!response.ok) {
+                const data = await response.json();
                 throw new Error(data.message || 'Error al procesar la solicitud');
             }
             
-            // Mostrar resultados
-            displayResults(data);
+            const grid = {x: [], y: [], z: []};
+            let pendingFrame = null;
+            const render = () => {
+                pendingFrame = null;
+                createPlot(grid, formData.function);
+            };
+            
+            await readNdjson(response, record => {
+                if (record.type === 'grid') {
+                    grid.x = record.x;
+                    grid.y = record.y;
+                } else if (record.type === 'band') {
+                    // Agregar las filas y redibujar como mucho una vez por cuadro
+                    grid.z.push(...decodeRows(record.z));
+                    if (pendingFrame === null) {
+                        pendingFrame = requestAnimationFrame(render);
+                    }
+                } else if (record.type === 'volume') {
+                    displayResults(record);
+                } else if (record.type === 'error') {
+                    throw new Error(record.message);
+                }
+            });
             
-            // Crear gráfico 3D con Plotly
-            createPlot(data, formData.function);
+            if (pendingFrame !== null) {
+                cancelAnimationFrame(pendingFrame);
+            }
+            render();
             
         } catch (error) {
             showError(error.message);
@@ -70,6 +96,54 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    /**
+     * Lee una respuesta NDJSON a medida que llega y llama a onRecord con
+     * cada línea ya parseada.
+     */
+    async function readNdjson(response, onRecord) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, {stream: true});
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (line.trim()) {
+                    onRecord(JSON.parse(line));
+                }
+            }
+        }
+        if (buffer.trim()) {
+            onRecord(JSON.parse(buffer));
+        }
+    }
+    
+    /**
+     * Decodifica un bloque de z enviado en base64 (float32 little-endian)
+     * en un array de filas Float32Array que Plotly acepta directamente.
+     */
+    function decodeRows(payload) {
+        const binary = atob(payload.data);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        
+        const values = new Float32Array(bytes.buffer);
+        const [rows, cols] = payload.shape;
+        const z = new Array(rows);
+        for (let j = 0; j < rows; j++) {
+            z[j] = values.subarray(j * cols, (j + 1) * cols);
+        }
+        return z;
+    }
+    
     /**
      * Muestra los resultados del cálculo (volumen y error)
      */
@@ -80,14 +154,15 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     /**
-     * Crea y renderiza el gráfico 3D usando Plotly
+     * Crea o actualiza el gráfico 3D usando Plotly. Mientras la malla
+     * llega por bandas, data.z tiene solo las primeras filas.
      */
     function createPlot(data, functionStr) {
         // Crear datos para el surface plot
         const plotData = [{
             type: 'surface',
             x: data.x,
-            y: data.y,
+            y: data.y.slice(0, data.z.length),
             z: data.z,
             colorscale: 'Viridis',
             showscale: true,
@@ -159,8 +234,8 @@ document.addEventListener('DOMContentLoaded', function() {
             modeBarButtonsToRemove: ['lasso2d', 'select2d']
         };
         
-        // Renderizar el gráfico
-        Plotly.newPlot(plotContainer, plotData, layout, config);
+        // Renderizar el gráfico (react reutiliza el gráfico existente)
+        Plotly.react(plotContainer, plotData, layout, config);
     }
     
     /**
@@ -171,7 +246,7 @@ document.addEventListener('DOMContentLoaded', function() {
         errorDiv.style.display = 'block';
         
         // Limpiar el gráfico si existe
-        plotContainer.innerHTML = '';
+        Plotly.purge(plotContainer);
     }
     
     /**
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Caché de teselas para acercar y desplazar la vista sobre una superficie.
+
+El plano se divide en una retícula fija de teselas de ancho potencia de 2:
+la tesela (i, j) del nivel (kx, ky) cubre [i*2^kx, (i+1)*2^kx] x
+[j*2^ky, (j+1)*2^ky]. Para cada tesela se guardan, por expresión, los
+valores de la función en una malla de TILE_POINTS x TILE_POINTS nodos y su
+integral. Dos dominios que se solapan comparten las teselas comunes, y solo
+se calculan las que faltan; el volumen es la suma de las integrales de las
+teselas completas más las de los trozos de teselas que corta el borde
+(que también se guardan, por si se repite el mismo dominio).
+
+Al alejar la vista, una tesela se compone de sus cuatro hijas guardadas
+(valores e integral). Al acercarla, una tesela hija toma de su madre
+guardada uno de cada dos nodos por eje y solo evalúa los intermedios; su
+integral, en cambio, se calcula de nuevo, porque repartir la de la madre
+entre sus cuartos no da la precisión de TILE_METHOD.
+"""
+
+import math
+
+import numpy as np
+
+from cache import LRUCache
+from nucleo import compute_volumes_job
+
+
+# Nodos por eje de cada tesela (16 intervalos): las teselas vecinas
+# comparten los nodos del borde
+TILE_POINTS = 17
+
+# Número mínimo de teselas por eje que cubren el dominio pedido; el nivel
+# se elige para que haya entre TILES_PER_AXIS y 2 * TILES_PER_AXIS
+TILES_PER_AXIS = 4
+
+# Método de integración de cada tesela (vectorizado, ver cubatura.py)
+TILE_METHOD = 'adaptive'
+
+# Niveles de la retícula: el ancho 2^k de las teselas debe ser un float
+# normal, y los índices de las teselas enteros exactos en un float
+MAX_TILE_LEVEL = 1000
+MAX_TILE_INDEX = 2**50
+
+# Tamaño aproximado de una entrada: valores, integral y error
+_BYTES_TESELA = TILE_POINTS * TILE_POINTS * 8 + 256
+
+# Tamaño aproximado de la entrada de un trozo de borde (integral y error)
+_BYTES_BORDE = 256
+
+_NO_FINITOS = "La función produce valores no finitos (infinito o NaN) en el dominio"
+
+
+def tile_level(span):
+    """
+    Nivel k tal que un intervalo de longitud span contiene entre
+    TILES_PER_AXIS y 2 * TILES_PER_AXIS teselas de ancho 2^k.
+
+    Raises:
+        ValueError: si span no es finito y positivo o el nivel queda fuera
+            de la retícula
+    """
+    if not (math.isfinite(span) and span > 0):
+        raise ValueError("El dominio es demasiado grande para la retícula de teselas")
+    nivel = math.floor(math.log2(span / TILES_PER_AXIS))
+    if abs(nivel) > MAX_TILE_LEVEL:
+        raise ValueError("El dominio está fuera del rango de la retícula de teselas")
+    return nivel
+
+
+def _indices(desde, hasta, ancho):
+    """Índices de la primera tesela y siguiente a la última que cubren [desde, hasta]."""
+    i0, i1 = math.floor(desde / ancho), math.ceil(hasta / ancho)
+    if max(abs(i0), abs(i1)) > MAX_TILE_INDEX:
+        raise ValueError("El dominio está fuera del rango de la retícula de teselas")
+    return i0, i1
+
+
+def _integrar(func, rectangulos, pool):
+    """
+    Integrales (con TILE_METHOD) de func sobre los rectángulos (a, b, c, d),
+    en un solo trabajo del pool si lo hay.
+
+    Returns:
+        list de (integral, error)
+    """
+    if not rectangulos:
+        return []
+    if pool is None:
+        resultados = compute_volumes_job(func.expresion, rectangulos, TILE_METHOD)
+    else:
+        resultados = pool.run(compute_volumes_job, func.expresion, rectangulos, TILE_METHOD)
+    for resultado in resultados:
+        if isinstance(resultado, str):
+            raise ValueError(resultado)
+    return [(integral, error) for integral, error, _ in resultados]
+
+
+class TileCache:
+    """
+    Teselas evaluadas por expresión, con expulsión LRU y presupuesto de
+    memoria en bytes. Es segura entre hilos (dos hilos pueden calcular la
+    misma tesela a la vez; el resultado es el mismo).
+    """
+
+    def __init__(self, max_bytes=16 * 2**20):
+        self.tiles = LRUCache(max_bytes)
+
+    def _tesela(self, func, kx, ky, i, j, contadores):
+        """
+        Devuelve la entrada [valores, integral, error] de una tesela,
+        evaluando los valores si faltan (la integral puede ser None). Si
+        faltan los valores pero están las cuatro teselas hijas del nivel
+        inferior, se componen a partir de ellas (y la integral es la suma
+        de las suyas); si no, pero está la tesela madre del nivel superior,
+        se refinan sus valores (sin integral).
+        """
+        clave = (func.expresion, kx, ky, i, j)
+        entrada = self.tiles.get(clave)
+        wx, wy = 2.0 ** kx, 2.0 ** ky
+
+        if entrada is None:
+            entrada = self._desde_hijas(func, kx, ky, i, j)
+            if entrada is not None:
+                contadores['composed'] += 1
+            else:
+                x = i * wx + np.linspace(0, wx, TILE_POINTS)
+                y = j * wy + np.linspace(0, wy, TILE_POINTS)
+                Z = self._desde_madre(func, kx, ky, i, j, x, y)
+                if Z is not None:
+                    contadores['refined'] += 1
+                else:
+                    Z = np.empty((TILE_POINTS, TILE_POINTS))
+                    Z[:] = func(x[None, :], y[:, None])
+                    contadores['computed'] += 1
+                Z.flags.writeable = False
+                entrada = [Z, None, None]
+            self.tiles.put(clave, entrada, _BYTES_TESELA)
+        else:
+            contadores['cached'] += 1
+        return entrada
+
+    def _desde_hijas(self, func, kx, ky, i, j):
+        """Compone una tesela a partir de sus cuatro hijas si están guardadas."""
+        hijas = [[self.tiles.get((func.expresion, kx - 1, ky - 1, 2 * i + di, 2 * j + dj))
+                  for di in (0, 1)] for dj in (0, 1)]
+        if any(h is None for fila in hijas for h in fila):
+            return None
+
+        m = TILE_POINTS - 1
+        Z = np.empty((2 * m + 1, 2 * m + 1))
+        for dj in (0, 1):
+            for di in (0, 1):
+                Z[dj * m:(dj + 1) * m + 1, di * m:(di + 1) * m + 1] = hijas[dj][di][0]
+        Z = Z[::2, ::2].copy()
+        Z.flags.writeable = False
+
+        integrales = [h[1] for fila in hijas for h in fila]
+        if any(v is None for v in integrales):
+            return [Z, None, None]
+        return [Z, sum(integrales), sum(h[2] for fila in hijas for h in fila)]
+
+    def _desde_madre(self, func, kx, ky, i, j, x, y):
+        """
+        Valores de una tesela en los nodos x, y a partir de su madre si está
+        guardada: los nodos pares por eje son nodos de la madre y solo se
+        evalúan los demás. Devuelve None si la madre no está.
+        """
+        madre = self.tiles.get((func.expresion, kx + 1, ky + 1, i // 2, j // 2))
+        if madre is None:
+            return None
+
+        m = TILE_POINTS - 1
+        h = m // 2
+        di, dj = (i % 2) * h, (j % 2) * h
+        Z = np.empty((TILE_POINTS, TILE_POINTS))
+        Z[::2, ::2] = madre[0][dj:dj + h + 1, di:di + h + 1]
+        faltan = np.ones((TILE_POINTS, TILE_POINTS), dtype=bool)
+        faltan[::2, ::2] = False
+        filas, columnas = np.nonzero(faltan)
+        Z[filas, columnas] = func(x[columnas], y[filas])
+        return Z
+
+    def surface(self, func, a, b, c, d, pool=None):
+        """
+        Malla y volumen de [a, b] x [c, d] a partir de las teselas.
+
+        La malla devuelta son los nodos de la retícula dentro del dominio
+        (con un paso de 1/16 del ancho de tesela, de modo que puede quedar
+        a menos de un paso de los bordes). Los valores de las teselas se
+        evalúan en el hilo actual; las integrales que faltan (teselas
+        completas y trozos de borde) se calculan juntas en un solo trabajo
+        del pool, con su tiempo máximo.
+
+        Args:
+            func: Función obtenida con parse_function
+            a, b, c, d: Límites del dominio
+            pool: ejecutor.CalculationPool opcional para las integraciones
+
+        Returns:
+            dict con los ejes 'x' e 'y', la malla 'z', 'volume', 'error',
+            'volume_method' ('tiles') y 'tiles': cantidad de teselas
+            'total', 'cached', 'computed', 'composed' (a partir de sus
+            hijas) y 'refined' (a partir de su madre), y de trozos de borde
+            'partial' y 'partial_cached' (los que ya estaban guardados)
+
+        Raises:
+            ValueError: si el dominio está fuera del rango de la retícula o
+                la función produce valores no finitos en el dominio
+            PoolFullError, JobTimeoutError: del pool (ver ejecutor.py)
+        """
+        kx, ky = tile_level(b - a), tile_level(d - c)
+        wx, wy = 2.0 ** kx, 2.0 ** ky
+        i0, i1 = _indices(a, b, wx)
+        j0, j1 = _indices(c, d, wy)
+
+        m = TILE_POINTS - 1
+        x = np.arange(i0 * m, i1 * m + 1) * (wx / m)
+        y = np.arange(j0 * m, j1 * m + 1) * (wy / m)
+        Z = np.empty((len(y), len(x)))
+
+        contadores = {'total': 0, 'cached': 0, 'computed': 0, 'composed': 0, 'refined': 0,
+                      'partial': 0, 'partial_cached': 0}
+        completas, sin_integral, bordes = [], [], []
+        for j in range(j0, j1):
+            for i in range(i0, i1):
+                entrada = self._tesela(func, kx, ky, i, j, contadores)
+                contadores['total'] += 1
+                Z[(j - j0) * m:(j - j0 + 1) * m + 1, (i - i0) * m:(i - i0 + 1) * m + 1] = entrada[0]
+
+                if a <= i * wx and (i + 1) * wx <= b and c <= j * wy and (j + 1) * wy <= d:
+                    completas.append(entrada)
+                    if entrada[1] is None:
+                        if not np.isfinite(entrada[0]).all():
+                            raise ValueError(_NO_FINITOS)
+                        sin_integral.append((entrada, (i * wx, (i + 1) * wx,
+                                                       j * wy, (j + 1) * wy)))
+                else:
+                    # Trozo de la tesela dentro del dominio
+                    trozo = (max(a, i * wx), min(b, (i + 1) * wx),
+                             max(c, j * wy), min(d, (j + 1) * wy))
+                    guardado = self.tiles.get((func.expresion, 'borde') + trozo)
+                    if guardado is not None:
+                        completas.append(guardado)
+                        contadores['partial_cached'] += 1
+                    else:
+                        bordes.append(trozo)
+                    contadores['partial'] += 1
+
+        integrales = _integrar(func, [r for _, r in sin_integral] + bordes, pool)
+        for (entrada, _), (integral, error_tesela) in zip(sin_integral, integrales):
+            entrada[1], entrada[2] = integral, error_tesela
+        integrales_bordes = integrales[len(sin_integral):]
+        partes = [(e[1], e[2]) for e in completas] + integrales_bordes
+        volume = sum(integral for integral, _ in partes)
+        error = sum(error_tesela for _, error_tesela in partes)
+
+        columnas = (x >= a) & (x <= b)
+        filas = (y >= c) & (y <= d)
+        Z = Z[np.ix_(filas, columnas)]
+        if not (np.isfinite(Z).all() and math.isfinite(volume)):
+            # Nodos dentro del dominio que la integración de los trozos de
+            # borde no evaluó (las teselas completas ya se comprobaron), o
+            # un volumen que desborda
+            raise ValueError(_NO_FINITOS)
+        for trozo, (integral, error_trozo) in zip(bordes, integrales_bordes):
+            self.tiles.put((func.expresion, 'borde') + trozo, [None, integral, error_trozo],
+                           _BYTES_BORDE)
+        return {'x': x[columnas], 'y': y[filas], 'z': Z,
+                'volume': float(volume), 'error': float(error), 'volume_method': 'tiles',
+                'tiles': contadores}
+
+    def clear(self):
+        self.tiles.clear()
+
+    def stats(self):
+        return self.tiles.stats()
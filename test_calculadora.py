@@ -11,7 +11,8 @@ import os
 # Agregar el directorio actual al path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from calculadora_3d import parse_function, calculate_volume
+from calculadora_3d import (parse_function, calculate_volume, calculate_surface, calculate_batch,
+                            stream_surface, evaluate_grid, refine_grid, level_points)
 
 
 def test_parse_function():
@@ -34,6 +35,153 @@ def test_parse_function():
     print("✓ Parser de funciones funciona correctamente\n")
 
 
+def test_expresiones_invalidas():
+    """Prueba que el parser rechace expresiones fuera del lenguaje permitido."""
+    print("Test 1b: Rechazando expresiones no permitidas...")
+    
+    invalidas = [
+        "__import__('os').system('ls')",  # llamada a builtin
+        "x.__class__",                    # acceso a atributos
+        "open('archivo')",                # función no permitida
+        "x + z",                          # variable desconocida
+        "sin(x, y)",                      # número de argumentos
+        "x ** ",                          # sintaxis inválida
+        "[x for x in y]",                 # comprensiones
+    ]
+    for expr in invalidas:
+        try:
+            parse_function(expr)
+        except ValueError:
+            continue
+        raise AssertionError(f"Debería rechazar la expresión: {expr}")
+    
+    # La expresión se compila una vez y funciona con escalares y arrays
+    f = parse_function("exp(-(x**2 + y**2)) * pi")
+    valores = f(np.array([0.0, 1.0]), np.array([0.0, 0.0]))
+    assert np.allclose(valores, [np.pi, np.pi * np.exp(-1)]), "Error con arrays"
+    assert f.expresion == "exp(-(x ** 2 + y ** 2)) * pi", "Error en la forma canónica"
+    
+    print("✓ Expresiones no permitidas rechazadas correctamente\n")
+
+
+def test_concurrencia():
+    """Evalúa una misma función desde muchos hilos y verifica cada resultado."""
+    print("Test 1c: Evaluación concurrente desde varios hilos...")
+    from concurrent.futures import ThreadPoolExecutor
+    
+    f = parse_function("x**2 + 3*y + sin(x*y)")
+    
+    def trabajo(semilla):
+        rng = np.random.default_rng(semilla)
+        for _ in range(2000):
+            x, y = rng.uniform(-5, 5, size=2)
+            # x**2 se compila como x*x (ver expresiones.py)
+            esperado = x*x + 3*y + np.sin(x*y)
+            if f(x, y) != esperado:
+                return False
+        # También con arrays, como en la generación de la malla
+        X = rng.uniform(-5, 5, size=(50, 50))
+        Y = rng.uniform(-5, 5, size=(50, 50))
+        return bool(np.array_equal(f(X, Y), X*X + 3*Y + np.sin(X*Y)))
+    
+    with ThreadPoolExecutor(max_workers=16) as ejecutor:
+        resultados = list(ejecutor.map(trabajo, range(64)))
+    assert all(resultados), "Resultados incorrectos con evaluación concurrente"
+    
+    # Integraciones simultáneas de la misma función parseada
+    g = parse_function("x + y")
+    with ThreadPoolExecutor(max_workers=8) as ejecutor:
+        volumenes = list(ejecutor.map(lambda k: calculate_volume(g, 0, k, 0, 1)[0], range(1, 9)))
+    for k, vol in zip(range(1, 9), volumenes):
+        esperado = k**2 / 2 + k / 2
+        assert abs(vol - esperado) < 1e-6, f"Error: esperado {esperado}, obtenido {vol}"
+    
+    print("✓ Funciones reentrantes y seguras entre hilos\n")
+
+
+def test_optimizacion_expresiones():
+    """Prueba el plegado de constantes, las subexpresiones comunes y la
+    evaluación en sitio de las funciones compiladas."""
+    print("Test 1d: Optimización de expresiones...")
+    import tracemalloc
+    
+    espacio = {nombre: getattr(np, nombre) for nombre in ('sin', 'cos', 'tan', 'exp', 'log', 'sqrt')}
+    espacio.update(abs=np.abs, pi=np.pi, e=np.e)
+    expresiones = [
+        "exp(-(x**2+y**2)) * sqrt(x**2+y**2) + pi/2",
+        "(x + y)**4 - 1/x + x**-1",
+        "sin(x*y)**2 + cos(x*y)**2 - 2**3 * (x - y)**3",
+        "-abs(x - y) / (1 + (x - y)**2) + e**2",
+        "x % 2 + y // 3 + log(2*pi) * x**5",
+        "3",
+        "x",
+    ]
+    x = np.linspace(0.5, 2, 40)
+    y = np.linspace(-1, 1, 30)
+    X, Y = np.meshgrid(x, y)
+    for expr in expresiones:
+        f = parse_function(expr)
+        with np.errstate(all='ignore'):
+            esperado = eval(expr, {'__builtins__': {}}, {**espacio, 'x': X, 'y': Y})
+        for Z in (f(X, Y), f(x[None, :], y[:, None])):
+            assert np.allclose(Z, esperado, rtol=1e-13, atol=1e-13), f"Error en {expr}"
+        assert np.isclose(f(0.7, -0.3), eval(expr, {'__builtins__': {}},
+                                              {**espacio, 'x': 0.7, 'y': -0.3}), rtol=1e-13)
+    
+    # Arrays enteros se evalúan en float
+    assert np.allclose(parse_function("x / 2 + y**2")(np.arange(3), np.arange(3)), [0, 1.5, 5])
+    
+    # pi/2 se calcula al compilar, x**2 + y**2 una sola vez y sin potencias
+    f = parse_function(expresiones[0])
+    assert repr(np.pi / 2) in f.codigo and 'pi' not in f.codigo.replace(repr(np.pi / 2), '')
+    assert f.codigo.count('_add(') == 2 and '_power' not in f.codigo, f.codigo
+    
+    # En sitio: además del resultado, solo un temporal del tamaño de la malla
+    X, Y = np.meshgrid(np.linspace(-1, 1, 500), np.linspace(-1, 1, 500))
+    tracemalloc.start()
+    f(X, Y)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert pico < 2.2 * X.nbytes, f"Demasiados temporales: {pico / X.nbytes:.1f} mallas"
+    
+    print(f"✓ Expresiones optimizadas ({pico / X.nbytes:.1f} mallas en memoria)\n")
+
+
+def test_motores_evaluacion():
+    """Prueba la selección del motor de evaluación y que todos coincidan."""
+    print("Test 1e: Motores de evaluación...")
+    from calculadora_3d import available_backends
+    
+    disponibles = available_backends()
+    assert 'numpy' in disponibles
+    assert parse_function("x + y").backend == 'numpy'
+    assert parse_function("x + y", backend='auto').backend == disponibles[0]
+    for motor in ('numexpr', 'numba'):
+        if motor not in disponibles:
+            try:
+                parse_function("x + y", backend=motor)
+                raise AssertionError(f"Debería rechazar {motor} si no está instalado")
+            except ValueError:
+                pass
+    try:
+        parse_function("x + y", backend='fortran')
+        raise AssertionError("Debería rechazar un motor desconocido")
+    except ValueError:
+        pass
+    
+    x = np.linspace(-2, 2, 300)[None, :]
+    y = np.linspace(-1, 3, 200)[:, None]
+    for expr in ("exp(-(x**2+y**2)) * sqrt(x**2+y**2) + pi/2",
+                 "sin(x) * cos(y) - abs(x*y) / (1 + x**2)", "x % 0.7 + y // 2"):
+        referencia = parse_function(expr)(x, y)
+        for motor in disponibles:
+            f = parse_function(expr, backend=motor)
+            assert np.allclose(f(x, y), referencia, rtol=1e-12, atol=1e-12), f"{motor}: {expr}"
+            assert f(0.5, 0.25) == parse_function(expr)(0.5, 0.25)
+    
+    print(f"✓ Motores disponibles: {', '.join(disponibles)}\n")
+
+
 def test_volume_calculation():
     """Prueba el cálculo de volúmenes con casos conocidos."""
     print("Test 2: Calculando volúmenes...")
@@ -70,6 +218,488 @@ def test_volume_calculation():
     print("\n✓ Cálculo de volúmenes funciona correctamente\n")
 
 
+def test_volume_methods():
+    """Compara los métodos de integración con volúmenes conocidos."""
+    print("Test 2b: Métodos de integración...")
+    
+    casos = [
+        ("1", (0, 1, 0, 1), 1.0),
+        ("x + y", (0, 1, 0, 1), 1.0),
+        ("x**2 + y**2", (-1, 1, -1, 1), 8.0 / 3.0),
+        ("sin(x) * cos(y)", (0, np.pi, 0, np.pi / 2), 2.0),
+        ("exp(-(x**2 + y**2))", (-2, 2, -2, 2), np.pi * 0.9953222650189527**2),
+    ]
+    for method in ('gauss', 'adaptive'):
+        for expr, dominio, esperado in casos:
+            f = parse_function(expr)
+            vol, err = calculate_volume(f, *dominio, method=method, symbolic=False,
+                                        separable=False)
+            assert abs(vol - esperado) < 1e-6, f"Error en {expr}: esperado {esperado}, obtenido {vol}"
+            assert err < 1e-6, f"Error estimado demasiado grande en {expr}: {err}"
+            print(f"  {method}, {expr}: Volumen = {vol:.6f} (esperado: {esperado:.6f}) ✓")
+    
+    # Función con un pico pronunciado: ∫∫ exp(-100(x²+y²)) sobre [-1,1]² ≈ π/100
+    f = parse_function("exp(-100*(x**2 + y**2))")
+    vol, err, info = calculate_volume(f, -1, 1, -1, 1, method='adaptive', full_output=True,
+                                      separable=False)
+    assert abs(vol - np.pi / 100) < 1e-8, f"Error: esperado {np.pi / 100}, obtenido {vol}"
+    assert info['converged'] and info['subdivisions'] > 0, f"Información inesperada: {info}"
+    _, _, info_dblquad = calculate_volume(f, -1, 1, -1, 1, full_output=True, separable=False)
+    print(f"  adaptive, pico: {info['neval']} evaluaciones, {info['subdivisions']} subdivisiones "
+          f"(dblquad: {info_dblquad['neval']} evaluaciones) ✓")
+    
+    try:
+        calculate_volume(parse_function("x"), 0, 1, 0, 1, method='simpson3d')
+        raise AssertionError("Debería rechazar un método desconocido")
+    except ValueError:
+        pass
+    
+    print("\n✓ Métodos de integración funcionan correctamente\n")
+
+
+def test_surface_pipeline():
+    """Prueba el cálculo combinado de malla y volumen."""
+    print("Test 2c: Malla y volumen con una sola evaluación...")
+    
+    llamadas = []
+    f = parse_function("x**3 * y + x**2")
+    
+    def contada(x, y):
+        # Puntos evaluados (los ejes llegan como fila y columna)
+        llamadas.append(np.broadcast(x, y).size)
+        return f(x, y)
+    
+    # Polinomio cúbico: la estimación sobre la malla es exacta y no hace
+    # falta integración adaptativa
+    for n in (50, 51):
+        superficie = calculate_surface(contada, 0, 1, 0, 2, n)
+        esperado = 0.5 + 2.0 / 3.0
+        assert superficie['volume_method'] == 'grid', "Debería usar la malla"
+        assert abs(superficie['volume'] - esperado) < 1e-10, \
+            f"Error: esperado {esperado}, obtenido {superficie['volume']}"
+        assert superficie['z'].shape == (n, n), "Forma de la malla incorrecta"
+    assert llamadas == [50 * 50, 51 * 51], f"La función debería evaluarse una vez: {llamadas}"
+    
+    # Gaussiana con malla gruesa: se recurre a la integración adaptativa,
+    # como producto de integrales de una variable por ser separable
+    g = parse_function("exp(-(x**2 + y**2))")
+    superficie = calculate_surface(g, -2, 2, -2, 2, 20)
+    assert superficie['volume_method'] == 'separable', "Debería recurrir a la vía separable"
+    assert abs(superficie['volume'] - 3.1122703197) < 1e-8, "Error en el volumen de respaldo"
+    g = parse_function("exp(-(x**2 + x*y + y**2))")
+    superficie = calculate_surface(g, -2, 2, -2, 2, 20)
+    assert superficie['volume_method'] == 'dblquad', "Debería recurrir a dblquad"
+    
+    # Funciones constantes devuelven una malla completa
+    superficie = calculate_surface(parse_function("2"), 0, 1, 0, 1, 10)
+    assert superficie['z'].shape == (10, 10) and abs(superficie['volume'] - 2.0) < 1e-12
+    
+    print("✓ Malla y volumen se calculan correctamente\n")
+
+
+def test_result_cache():
+    """Prueba la caché LRU de volúmenes y mallas."""
+    print("Test 2d: Caché de resultados...")
+    from cache import ResultCache
+    
+    cache = ResultCache(grid_bytes=9000)  # caben unas dos mallas de ~20x20
+    f = parse_function("x**2 + y**2")
+    
+    primera = cache.surface(f, -1, 1, -1, 1, 20)
+    assert primera['cached'] == [], "La primera llamada no debería usar la caché"
+    
+    # Misma expresión con otro formato: la clave es la forma canónica
+    g = parse_function("  (x ** 2)+y**2 ")
+    segunda = cache.surface(g, -1, 1, -1, 1, 20)
+    assert sorted(segunda['cached']) == ['grid', 'volume'], f"Debería acertar: {segunda['cached']}"
+    assert segunda['volume'] == primera['volume']
+    
+    # Cambiar la resolución reutiliza el volumen
+    tercera = cache.surface(f, -1, 1, -1, 1, 21)
+    assert tercera['cached'] == ['volume'], f"Debería reutilizar el volumen: {tercera['cached']}"
+    assert tercera['z'].shape == (21, 21)
+    
+    # Con el presupuesto lleno se expulsa la malla usada hace más tiempo
+    cache.surface(f, -1, 1, -1, 1, 22)
+    cache.surface(f, -1, 1, -1, 1, 23)
+    stats = cache.stats()
+    assert stats['grids']['evictions'] >= 1, f"Debería haber expulsiones: {stats}"
+    assert stats['grids']['bytes'] <= stats['grids']['max_bytes']
+    assert stats['volumes']['hits'] == 4 and stats['volumes']['misses'] == 1, stats
+    assert cache.surface(f, -1, 1, -1, 1, 20)['cached'] == ['volume'], "La malla 20x20 fue expulsada"
+    
+    # Llamadas simultáneas idénticas comparten un solo cálculo
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    evaluaciones = []
+    
+    def lenta(x, y):
+        evaluaciones.append(threading.get_ident())
+        threading.Event().wait(0.2)
+        return x * y + 7.0
+    lenta.expresion = "x * y + 7"
+    
+    cache = ResultCache()
+    with ThreadPoolExecutor(max_workers=6) as ejecutor:
+        resultados = list(ejecutor.map(lambda _: cache.surface(lenta, 0, 1, 0, 1, 20), range(6)))
+    assert len(evaluaciones) == 1, f"La malla se evaluó {len(evaluaciones)} veces"
+    assert all(r is resultados[0] for r in resultados)
+    vuelos = cache.stats()['single_flight']
+    assert vuelos['calls'] == 6 and vuelos['coalesced'] == 5 and vuelos['in_flight'] == 0, vuelos
+    
+    # ...y también comparten las excepciones, sin dejar el cálculo en curso
+    def falla(x, y):
+        threading.Event().wait(0.2)
+        raise ValueError("falla")
+    falla.expresion = "x - y"
+    with ThreadPoolExecutor(max_workers=3) as ejecutor:
+        futuros = [ejecutor.submit(cache.surface, falla, 0, 1, 0, 1, 20) for _ in range(3)]
+    assert all(isinstance(futuro.exception(), ValueError) for futuro in futuros)
+    assert cache.stats()['single_flight']['in_flight'] == 0
+    
+    # Quien espera un cálculo en curso deja de hacerlo si se cancela su
+    # request o se cumple el tiempo máximo, sin esperar a quien calcula
+    import time
+    from cache import SingleFlight
+    from ejecutor import JobCancelledError, JobTimeoutError, cancellable
+    vuelos = SingleFlight()
+    lider = threading.Thread(target=vuelos.run, args=('clave', threading.Event().wait, 1.0))
+    lider.start()
+    threading.Event().wait(0.05)
+    for error in (JobTimeoutError, JobCancelledError):
+        cancelado = threading.Event()
+        threading.Timer(0.1, cancelado.set).start()
+        inicio = time.perf_counter()
+        try:
+            if error is JobTimeoutError:
+                vuelos.run('clave', threading.Event().wait, 1.0, timeout=0.1)
+            else:
+                with cancellable(cancelado):
+                    vuelos.run('clave', threading.Event().wait, 1.0)
+            assert False, f"Debería lanzar {error.__name__}"
+        except error:
+            pass
+        assert time.perf_counter() - inicio < 0.5, f"{error.__name__} llegó tarde"
+    lider.join()
+    assert vuelos.stats()['in_flight'] == 0
+    
+    print("✓ Caché de resultados funciona correctamente\n")
+
+
+def test_almacen_disco():
+    """Prueba el almacén en disco compartido entre procesos y su precalentamiento."""
+    print("Test 2m: Almacén en disco...")
+    import tempfile
+    from almacen import DiskStore, presets, warm_up
+    from cache import ResultCache
+    
+    f = parse_function("x**2 + sin(y)")
+    with tempfile.TemporaryDirectory() as directorio:
+        # Una malla 20x20 ocupa 3520 bytes y una 22x22, 4224: caben dos
+        primera = ResultCache(store=DiskStore(directorio, max_bytes=9000))
+        calculada = primera.surface(f, -1, 1, -1, 1, 20)
+        
+        # Otro proceso (otro DiskStore sobre el mismo directorio) la lee del disco,
+        # mapeada en memoria y sin copiarla
+        segunda = ResultCache(store=DiskStore(directorio, max_bytes=9000))
+        leida = segunda.surface(parse_function("x**2+sin( y )"), -1.0, 1.0, -1.0, 1.0, 20)
+        assert sorted(leida['cached']) == ['grid', 'volume'], leida['cached']
+        assert np.array_equal(leida['z'], calculada['z']) and leida['volume'] == calculada['volume']
+        assert leida['volume_method'] == calculada['volume_method']
+        assert isinstance(leida['z'].base, np.memmap) and not leida['z'].flags.writeable
+        
+        # Expulsión por tamaño: se borra la malla usada hace más tiempo
+        primera.surface(f, -1, 1, -1, 1, 21)
+        primera.surface(f, -1, 1, -1, 1, 22)
+        stats = primera.store.stats()
+        assert stats['grids'] == 2 and stats['bytes'] <= 9000 and stats['evictions'] == 1, stats
+        assert len(os.listdir(os.path.join(directorio, 'grids'))) == 2 * 2
+        tercera = ResultCache(store=DiskStore(directorio))
+        assert tercera.surface(f, -1, 1, -1, 1, 20)['cached'] == ['volume']
+    
+    # Precalentamiento con los ejemplos de la interfaz web y de ejemplos.py
+    ejemplos = presets()
+    assert ("sin(x) * cos(y)", (0.0, 6.28, 0.0, 3.14)) in ejemplos
+    assert ("sin(x) * cos(y)", (0.0, 2 * np.pi, 0.0, 2 * np.pi)) in ejemplos
+    assert len(ejemplos) == len(set(ejemplos)) == 5, ejemplos
+    with tempfile.TemporaryDirectory() as directorio:
+        resultados = warm_up(DiskStore(directorio), resolutions=(20,), levels=range(2))
+        assert len(resultados) == 5
+        cache = ResultCache(store=DiskStore(directorio))
+        for func_str, (a, b, c, d), volume, _ in resultados:
+            superficie = cache.level(parse_function(func_str), a, b, c, d, 1)
+            assert superficie['cached'] == ['grid', 'volume'] and superficie['volume'] == volume
+        assert cache.stats()['disk']['misses'] == 0
+    
+    print("✓ Almacén en disco funciona correctamente\n")
+
+
+def test_batch():
+    """Prueba el cálculo por lotes con expresiones repetidas y errores aislados."""
+    print("Test 2e: Cálculo por lotes...")
+    
+    jobs = [
+        {'function': 'x**2 + y**2', 'a': -1, 'b': 1, 'c': -1, 'd': 1},
+        {'function': 'x * y', 'a': 0, 'b': 2, 'c': 0, 'd': 3},
+        {'function': '(x ** 2)+y**2', 'a': -1, 'b': 1, 'c': -1, 'd': 1},  # repetido
+        {'function': 'x**2 + y**2', 'a': 0, 'b': 1, 'c': 0, 'd': 1},
+        {'function': 'x +', 'a': 0, 'b': 1, 'c': 0, 'd': 1},
+        {'function': 'x', 'a': 1, 'b': 0, 'c': 0, 'd': 1},
+        {'function': 'log(x)', 'a': -2, 'b': -1, 'c': 0, 'd': 1},
+        {'function': 'x', 'a': 0, 'b': 1},
+    ]
+    esperados = {0: 8 / 3, 1: 9.0, 2: 8 / 3, 3: 2 / 3}
+    
+    for max_workers in (1, 2):
+        resultados = {r['index']: r for r in calculate_batch(jobs, max_workers=max_workers)}
+        assert sorted(resultados) == list(range(len(jobs))), "Falta el resultado de algún trabajo"
+        for indice, volumen in esperados.items():
+            assert resultados[indice]['success'], resultados[indice]
+            assert abs(resultados[indice]['volume'] - volumen) < 1e-8, resultados[indice]
+        for indice in (4, 5, 6, 7):
+            assert not resultados[indice]['success'], f"El trabajo {indice} debería fallar"
+        assert 'Sintaxis' in resultados[4]['message']
+        assert 'a < b' in resultados[5]['message']
+        assert 'no finitos' in resultados[6]['message']
+        assert 'Falta el campo' in resultados[7]['message']
+
+    # Un dominio lento que excede el tiempo máximo no hace fallar a los demás,
+    # aunque haya más dominios de la misma expresión que procesos
+    from ejecutor import CalculationPool
+    lento = 'abs(sin(1/(x*y+1e-6)))'
+    dominios = [(1, 2, 1, 2), (-1, 1, -1, 1), (2, 3, 2, 3), (1, 3, 1, 2), (2, 4, 1, 2)]
+    jobs = [{'function': lento, 'a': a, 'b': b, 'c': c, 'd': d} for a, b, c, d in dominios]
+    # El dominio lento tarda unos 5 s; los demás, milisegundos. El arranque de
+    # los procesos no cuenta para el tiempo máximo (ver ejecutor.py)
+    pool = CalculationPool(processes=2, timeout=2.5)
+    try:
+        resultados = {r['index']: r for r in calculate_batch(jobs, executor=pool, max_workers=2)}
+    finally:
+        pool.close()
+    assert not resultados[1]['success'] and 'tiempo máximo' in resultados[1]['message']
+    for indice in (0, 2, 3, 4):
+        assert resultados[indice]['success'], resultados[indice]
+
+    print("✓ Cálculo por lotes funciona correctamente\n")
+
+
+def test_evaluate_grid():
+    """Prueba la evaluación por bloques sin meshgrid: mismos valores, menos memoria."""
+    print("Test 2f: Evaluación de la malla por bloques...")
+    import tracemalloc
+    
+    f = parse_function("sin(x) * exp(-y**2) + x*y")
+    X, Y = np.meshgrid(np.linspace(0, 3, 200), np.linspace(-2, 2, 200))
+    x, y, Z = evaluate_grid(f, 0, 3, -2, 2, 200, tile_values=1000)
+    assert np.array_equal(Z, f(X, Y)), "Los valores no coinciden con meshgrid"
+    _, _, Z32 = evaluate_grid(f, 0, 3, -2, 2, 200, dtype=np.float32)
+    assert Z32.dtype == np.float32 and np.array_equal(Z32, Z.astype(np.float32))
+    assert np.all(evaluate_grid(parse_function("2"), 0, 1, 0, 1, 10)[2] == 2)
+    
+    def pico(calculo):
+        tracemalloc.start()
+        calculo()
+        _, maximo = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return maximo
+    
+    n = 2000
+    nbytes = n * n * 8
+    
+    def con_meshgrid():
+        X, Y = np.meshgrid(np.linspace(0, 3, n), np.linspace(-2, 2, n))
+        return f(X, Y)
+    
+    anterior = pico(con_meshgrid)
+    float64 = pico(lambda: evaluate_grid(f, 0, 3, -2, 2, n))
+    float32 = pico(lambda: evaluate_grid(f, 0, 3, -2, 2, n, dtype=np.float32))
+    salida = np.empty((n, n))
+    reutilizada = pico(lambda: evaluate_grid(f, 0, 3, -2, 2, n, out=salida))
+    
+    assert anterior > 3 * nbytes, f"meshgrid debería usar X, Y, Z y temporales: {anterior}"
+    assert float64 < 1.1 * nbytes, f"float64: {float64 / 2**20:.1f} MB"
+    assert float32 < 0.6 * nbytes, f"float32: {float32 / 2**20:.1f} MB"
+    assert reutilizada < 2**20, f"Con out no debería reservar la malla: {reutilizada / 2**20:.1f} MB"
+    
+    print(f"  {n}x{n}: meshgrid {anterior / 2**20:.0f} MB, float64 {float64 / 2**20:.0f} MB, "
+          f"float32 {float32 / 2**20:.0f} MB, out {reutilizada / 2**20:.1f} MB")
+    print("✓ Evaluación por bloques funciona correctamente\n")
+
+
+def test_piramide():
+    """Prueba la pirámide de resoluciones: refinado anidado y reutilización de puntos."""
+    print("Test 2g: Pirámide de resoluciones...")
+    from cache import ResultCache
+    
+    puntos = []
+    # Polinomio cúbico: el volumen sale de la propia malla, sin respaldo
+    f = parse_function("x**3 * y + x**2 - y")
+    
+    def contada(x, y):
+        puntos.append(np.broadcast(x, y).size)
+        return f(x, y)
+    contada.expresion = f.expresion
+    
+    assert [level_points(k) for k in range(4)] == [17, 33, 65, 129]
+    
+    # Refinar equivale a evaluar directamente, evaluando solo los puntos nuevos
+    malla = evaluate_grid(f, 0, 3, -2, 2, 17)
+    for nivel in (1, 2):
+        malla = refine_grid(contada, *malla, tile_values=100)
+        n = level_points(nivel)
+        directa = evaluate_grid(f, 0, 3, -2, 2, n)
+        assert np.allclose(malla[0], directa[0], rtol=0, atol=1e-15)
+        assert np.allclose(malla[2], directa[2], rtol=1e-13, atol=1e-13), "El refinado no coincide"
+    assert sum(puntos) == (33**2 - 17**2) + (65**2 - 33**2), "Se reevaluaron puntos existentes"
+    
+    # La caché guarda cada nivel y refina a partir del más fino disponible
+    cache = ResultCache()
+    puntos.clear()
+    resultado = cache.level(contada, 0, 3, -2, 2, 1)
+    assert resultado['z'].shape == (33, 33) and resultado['cached'] == []
+    assert sum(puntos) == 33**2
+    puntos.clear()
+    resultado = cache.level(contada, 0, 3, -2, 2, 3)
+    assert resultado['z'].shape == (129, 129) and resultado['cached'] == ['volume']
+    assert sum(puntos) == 129**2 - 33**2, f"Debería partir del nivel 1: {sum(puntos)}"
+    assert cache.level(contada, 0, 3, -2, 2, 2)['cached'] == ['grid', 'volume']
+    # Los niveles son mallas normales: la misma resolución sale de la caché
+    assert sorted(cache.surface(f, 0, 3, -2, 2, 65)['cached']) == ['grid', 'volume']
+    
+    print("✓ Pirámide de resoluciones funciona correctamente\n")
+
+
+def test_teselas():
+    """Prueba la caché de teselas: reutilización al desplazar, bordes y composición."""
+    print("Test 2h: Caché de teselas...")
+    from teselas import TileCache
+    
+    f = parse_function("sin(x) * cos(y) + x*y")
+    cache = TileCache()
+    
+    primera = cache.surface(f, 0, 3, -1, 1)
+    assert primera['tiles']['computed'] == primera['tiles']['total'] == 24
+    assert abs(primera['volume'] - calculate_volume(f, 0, 3, -1, 1)[0]) < 1e-10
+    X, Y = np.meshgrid(primera['x'], primera['y'])
+    assert np.allclose(primera['z'], f(X, Y), rtol=0, atol=1e-14), "La malla no coincide"
+    
+    # Desplazar la vista solo calcula las teselas nuevas
+    desplazada = cache.surface(f, 0.5, 3.5, -1, 1)
+    assert desplazada['tiles']['computed'] == 4 and desplazada['tiles']['cached'] == 20
+    assert abs(desplazada['volume'] - calculate_volume(f, 0.5, 3.5, -1, 1)[0]) < 1e-10
+    
+    # Bordes que cortan teselas: se integran solo los trozos dentro del dominio
+    recortada = cache.surface(f, 0.3, 3.2, -0.9, 0.75)
+    assert recortada['tiles']['partial'] > 0
+    assert abs(recortada['volume'] - calculate_volume(f, 0.3, 3.2, -0.9, 0.75)[0]) < 1e-10
+    assert recortada['x'][0] >= 0.3 and recortada['x'][-1] <= 3.2
+    
+    # Alejar la vista compone las teselas a partir de las cuatro hijas
+    alejada = cache.surface(f, 0, 6, -2, 2)
+    assert alejada['tiles']['composed'] == 6, alejada['tiles']
+    assert abs(alejada['volume'] - calculate_volume(f, 0, 6, -2, 2)[0]) < 1e-10
+    
+    # Acercar la vista refina los valores de la tesela madre (sin integral)
+    acercada = cache.surface(f, 4, 6, -2, 0)
+    assert acercada['tiles']['refined'] == acercada['tiles']['total'] == 16, acercada['tiles']
+    X, Y = np.meshgrid(acercada['x'], acercada['y'])
+    assert np.allclose(acercada['z'], f(X, Y), rtol=0, atol=1e-14), "La malla refinada no coincide"
+    assert abs(acercada['volume'] - calculate_volume(f, 4, 6, -2, 0)[0]) < 1e-10
+    
+    # Repetir un dominio con bordes reutiliza los trozos guardados
+    repetida = cache.surface(f, 0.3, 3.2, -0.9, 0.75)
+    assert repetida['tiles']['partial_cached'] == repetida['tiles']['partial'] > 0
+    assert repetida['volume'] == recortada['volume']
+    
+    # Valores no finitos fuera del dominio (en teselas de borde) no importan
+    g = parse_function("log(x) + y")
+    assert abs(cache.surface(g, 0.1, 2, 0, 1)['volume'] - calculate_volume(g, 0.1, 2, 0, 1)[0]) < 1e-10
+    for a, b in ((-1, 2), (-1e308, 1e308)):
+        try:
+            cache.surface(g, a, b, 0, 1)
+            assert False, f"Debería rechazar [{a}, {b}]"
+        except ValueError:
+            pass
+    
+    print("✓ Caché de teselas funciona correctamente\n")
+
+
+def test_malla_adaptativa():
+    """Prueba el muestreo adaptativo: menos puntos para la misma fidelidad."""
+    print("Test 2i: Muestreo adaptativo...")
+    from scipy.interpolate import LinearNDInterpolator
+    from calculadora_3d import adaptive_mesh
+    
+    f = parse_function("exp(-50*(x**2 + y**2))")
+    X, Y = np.meshgrid(np.linspace(-2, 2, 401), np.linspace(-2, 2, 401))
+    
+    def error_interpolacion(x, y, z):
+        """Máxima diferencia entre la superficie lineal a trozos y f."""
+        return np.max(np.abs(LinearNDInterpolator(np.column_stack([x, y]), z)(X, Y) - f(X, Y)))
+    
+    uniforme = np.linspace(-2, 2, 200)
+    U, V = np.meshgrid(uniforme, uniforme)
+    error_uniforme = error_interpolacion(U.ravel(), V.ravel(), f(U, V).ravel())
+    
+    malla = adaptive_mesh(f, -2, 2, -2, 2, max_points=50 * 50)
+    n = len(malla['z'])
+    assert n <= 50 * 50, f"Superó el máximo de puntos: {n}"
+    assert np.array_equal(malla['z'], f(malla['x'], malla['y'])), "Valores incorrectos en los vértices"
+    assert malla['faces'].shape[1] == 3 and malla['faces'].max() < n
+    error_adaptativo = error_interpolacion(malla['x'], malla['y'], malla['z'])
+    assert error_adaptativo < error_uniforme, \
+        f"Con {n} puntos el error ({error_adaptativo:.2g}) debería ser menor que con 200x200 ({error_uniforme:.2g})"
+    
+    # Las zonas planas no se refinan: los puntos se concentran en el pico
+    cerca = np.hypot(malla['x'], malla['y']) < 0.5
+    assert cerca.mean() > 0.5, "Los puntos deberían concentrarse cerca del pico"
+    
+    # Con pocos puntos disponibles la retícula inicial se achica
+    for maximo in (9, 50, 100, 289):
+        n = len(adaptive_mesh(f, -2, 2, -2, 2, max_points=maximo)['z'])
+        assert n <= maximo, f"Superó el máximo de {maximo} puntos: {n}"
+    
+    print(f"  {n} puntos adaptativos: error {error_adaptativo:.1e}; "
+          f"200x200 uniforme: error {error_uniforme:.1e}")
+    print("✓ Muestreo adaptativo funciona correctamente\n")
+
+
+def test_stream_surface():
+    """Prueba la malla por bandas: mismos valores y volumen, memoria acotada."""
+    print("Test 2j: Malla por bandas...")
+    import tracemalloc
+    
+    f = parse_function("sin(x) * exp(-y**2) + x*y")
+    completa = calculate_surface(f, 0, 3, -2, 2, 120)
+    registros = list(stream_surface(f, 0, 3, -2, 2, 120, band_values=1000))
+    assert [r['type'] for r in (registros[0], registros[-1])] == ['grid', 'volume']
+    bandas = [r for r in registros if r['type'] == 'band']
+    assert len(bandas) == 15, f"Se esperaban bandas de 8 filas: {len(bandas)}"
+    assert [b['row'] for b in bandas] == list(range(0, 120, 8))
+    Z = np.vstack([b['z'] for b in bandas])
+    assert np.allclose(Z, completa['z'], rtol=0, atol=1e-14), "Las bandas no coinciden con la malla"
+    final = registros[-1]
+    assert final['volume_method'] == completa['volume_method'] == 'grid'
+    assert abs(final['volume'] - completa['volume']) < 1e-12
+    
+    # Con valores no finitos se recurre al respaldo
+    g = parse_function("sqrt(x)")
+    final = list(stream_surface(g, -0.5, 1, 0, 1, 30, fallback=lambda a, b, c, d: (1.0, 0.0)))[-1]
+    assert final['volume_method'] == 'dblquad' and final['volume'] == 1.0
+    
+    # La memoria máxima no depende de la resolución (la malla completa
+    # de 2000x2000 ocuparía 32 MB)
+    tracemalloc.start()
+    for registro in stream_surface(f, 0, 3, -2, 2, 2000):
+        pass
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert pico < 4 * 2**20, f"Memoria máxima demasiado alta: {pico / 2**20:.1f} MB"
+    assert registro['volume_method'] == 'grid'
+    
+    print(f"✓ Malla por bandas funciona correctamente (pico {pico / 2**20:.1f} MB a 2000x2000)\n")
+
+
 def test_special_functions():
     """Prueba funciones especiales (trigonométricas, exponenciales)."""
     print("Test 3: Funciones especiales...")
@@ -90,6 +720,87 @@ def test_special_functions():
     print("\n✓ Funciones especiales funcionan correctamente\n")
 
 
+def test_volumen_simbolico():
+    """Prueba la integración en forma cerrada de funciones separables."""
+    print("Test 2k: Volumen en forma cerrada...")
+    
+    casos = [
+        ("x**2 + y**2", (-1, 1, -1, 1)),
+        ("(x + y)**3 - 2*x*y", (0, 1, -1, 2)),
+        ("sin(x) * cos(y)", (0, np.pi, 0, np.pi / 2)),
+        ("exp(-x - 2*y) / 3", (0, 1, 0, 1)),
+        ("(sin(2*x) + x**2) * (cos(y) - 1)", (0, 1.5, 0, 2)),
+        ("-x**3 * y / 4 - 2", (0, 1, 1, 2)),
+    ]
+    for expr, dominio in casos:
+        f = parse_function(expr)
+        vol, err, info = calculate_volume(f, *dominio, full_output=True)
+        referencia, _ = calculate_volume(f, *dominio, symbolic=False)
+        assert info['path'] == 'symbolic', f"{expr} debería integrarse en forma cerrada"
+        assert abs(vol - referencia) < 1e-9, f"Error en {expr}: {vol} != {referencia}"
+        assert err < 1e-12 and info['neval'] < 100, f"Información inesperada en {expr}: {info}"
+        print(f"  {expr}: Volumen = {vol:.10f}, {info['neval']} evaluaciones ✓")
+    
+    # Sin forma cerrada (no separable o sin primitiva elemental): numérico
+    for expr in ("sin(x * y)", "exp(-(x**2 + y**2))", "sqrt(x) * y", "x * exp(x)"):
+        _, _, info = calculate_volume(parse_function(expr), 0, 1, 0, 1, full_output=True)
+        assert info['path'] != 'symbolic', f"{expr} no tiene forma cerrada"
+    
+    # Funciones sin expresión (no creadas con parse_function): numérico
+    _, _, info = calculate_volume(lambda x, y: x * y, 0, 1, 0, 1, full_output=True)
+    assert info['path'] == 'numeric'
+    
+    # La malla reporta la vía simbólica
+    superficie = calculate_surface(parse_function("x**2 * y"), 0, 2, 0, 3, 20)
+    assert superficie['volume_method'] == 'symbolic' and abs(superficie['volume'] - 12.0) < 1e-12
+    
+    print("\n✓ Volumen en forma cerrada funciona correctamente\n")
+
+
+def test_volumen_separable():
+    """Compara la vía separable (integrales de una variable) con dblquad."""
+    print("Test 2l: Volumen de funciones separables contra dblquad...")
+    
+    casos = [
+        ("exp(-(x**2 + y**2))", (-2, 2, -2, 2)),
+        ("sin(x) * exp(-y**2)", (0, 3, -1, 2)),
+        ("sqrt(x) * cos(y)", (0, 4, 0, np.pi)),
+        ("log(1 + x) * y**2", (0, 2, -1, 1)),
+        ("x * exp(x) + sin(y) * y", (0, 1, 0, 2)),
+        ("1 / ((1 + x**2) * (1 + y**2))", (-3, 3, -3, 3)),
+        ("exp(x + y) / (1 + x)", (0, 1, 0, 1)),
+        ("(x**2 + y**2) * exp(-x**2 - y**2)", (-2, 2, -2, 2)),
+        ("sin(3*x) * cos(2*y) + x * y", (0, np.pi, 0, np.pi / 2)),
+        ("exp(-100*(x**2 + y**2))", (-1, 1, -1, 1)),
+    ]
+    for expr, dominio in casos:
+        f = parse_function(expr)
+        vol, err, info = calculate_volume(f, *dominio, full_output=True, symbolic=False)
+        referencia, err_ref, info_ref = calculate_volume(f, *dominio, full_output=True,
+                                                         symbolic=False, separable=False)
+        assert info['path'] == 'separable', f"{expr} debería reconocerse como separable"
+        tolerancia = max(1e-8, 1e-8 * abs(referencia)) + err_ref
+        assert abs(vol - referencia) <= tolerancia, f"Error en {expr}: {vol} != {referencia}"
+        assert err <= tolerancia and info['neval'] < info_ref['neval'], \
+            f"Información inesperada en {expr}: {info} (dblquad: {info_ref})"
+        print(f"  {expr}: {info['neval']} evaluaciones (dblquad: {info_ref['neval']}) ✓")
+    
+    # No separables: se integran en dos dimensiones
+    for expr in ("sin(x * y)", "exp(-(x**2 + x*y + y**2))", "sqrt(x + y)", "x**y"):
+        _, _, info = calculate_volume(parse_function(expr), 0.5, 1, 0.5, 1, full_output=True)
+        assert info['path'] == 'numeric', f"{expr} no es separable"
+    
+    # Valores no finitos en un factor: se recurre a la integración doble
+    import warnings
+    with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+        warnings.simplefilter('ignore')
+        _, _, info = calculate_volume(parse_function("log(x) * y"), -1, 1, 0, 1,
+                                      full_output=True)
+    assert info['path'] == 'numeric'
+    
+    print("\n✓ Volumen de funciones separables coincide con dblquad\n")
+
+
 def run_all_tests():
     """Ejecuta todas las pruebas."""
     print("=" * 60)
@@ -99,7 +810,23 @@ def run_all_tests():
     
     try:
         test_parse_function()
+        test_expresiones_invalidas()
+        test_concurrencia()
+        test_optimizacion_expresiones()
+        test_motores_evaluacion()
         test_volume_calculation()
+        test_volume_methods()
+        test_volumen_simbolico()
+        test_volumen_separable()
+        test_surface_pipeline()
+        test_result_cache()
+        test_almacen_disco()
+        test_batch()
+        test_evaluate_grid()
+        test_piramide()
+        test_teselas()
+        test_malla_adaptativa()
+        test_stream_surface()
         test_special_functions()
         
         print("=" * 60)
@@ -0,0 +1,690 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las aplicaciones web (app.py y webapp/app.py) usando el
+cliente de pruebas de Flask, sin levantar un servidor.
+"""
+
+import sys
+import os
+import asyncio
+import json
+import math
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as modulo_app
+from app import app
+from ejecutor import (CalculationPool, JobCancelledError, JobTimeoutError, PoolFullError,
+                      cancellable)
+from serializacion import decode_array
+
+
+def test_formato_base64():
+    """La malla en base64 coincide con la versión en listas anidadas."""
+    print("Test 1: Formato binario de la malla...")
+    cliente = app.test_client()
+    datos = {'function': 'sin(x) * cos(y)', 'a': 0, 'b': 3, 'c': -1, 'd': 1, 'resolution': 40}
+
+    respuesta = cliente.post('/calculate', json=datos)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    listas = respuesta.get_json()
+    assert listas['format'] == 'json'
+
+    respuesta = cliente.post('/calculate', json={**datos, 'format': 'base64'})
+    assert respuesta.status_code == 200, respuesta.get_json()
+    binario = respuesta.get_json()
+    assert binario['format'] == 'base64'
+    assert binario['volume'] == listas['volume']
+
+    # Ejes 1-D en lugar de X e Y completos
+    assert binario['x'] == listas['x'][0], "El eje x no coincide"
+    assert binario['y'] == [fila[0] for fila in listas['y']], "El eje y no coincide"
+
+    Z = decode_array(binario['z'])
+    assert Z.dtype == np.float32 and Z.shape == (40, 40)
+    assert np.allclose(Z, listas['z'], atol=1e-6), "Los valores de z no coinciden"
+
+    # Formato desconocido
+    respuesta = cliente.post('/calculate', json={**datos, 'format': 'xml'})
+    assert respuesta.status_code == 400
+
+    print("✓ Formato binario funciona correctamente\n")
+
+
+def test_webapp_datos():
+    """webapp devuelve solo datos por defecto y el HTML como opción."""
+    print("Test 2: Respuesta de datos de webapp/app.py...")
+    from webapp.app import app as webapp
+    cliente = webapp.test_client()
+    datos = {'function': 'x**2 - y**2', 'a': -2, 'b': 2, 'c': -2, 'd': 2, 'num_points': 30}
+
+    respuesta = cliente.post('/calculate', data=datos)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    resultado = respuesta.get_json()
+    assert 'plot_html' not in resultado, "Por defecto no debería renderizar HTML"
+    Z = decode_array(resultado['grid']['z'])
+    X, Y = np.meshgrid(resultado['grid']['x'], resultado['grid']['y'])
+    assert np.allclose(Z, X**2 - Y**2, atol=1e-5), "La malla no coincide"
+
+    # Valores no finitos como null en la codificación json
+    respuesta = cliente.post('/calculate', data={**datos, 'function': 'sqrt(x)', 'a': -1,
+                                                 'encoding': 'json'})
+    assert respuesta.status_code == 200, respuesta.get_json()
+    z = respuesta.get_json()['grid']['z']
+    assert z[0][0] is None and z[0][-1] is not None
+
+    # El HTML sigue disponible como opción
+    respuesta = cliente.post('/calculate', data={**datos, 'output': 'html'})
+    assert respuesta.status_code == 200
+    assert '<div' in respuesta.get_json()['plot_html']
+
+    print("✓ Respuesta de datos funciona correctamente\n")
+
+
+def test_pool_calculo():
+    """El pool termina trabajos lentos, rechaza los que no caben y recicla procesos."""
+    print("Test 3: Pool de procesos de cálculo...")
+
+    pool = CalculationPool(processes=1, max_queue=0, timeout=10, max_jobs_per_worker=2)
+    try:
+        # Un trabajo que excede el tiempo máximo se termina y el pool sigue funcionando
+        inicio = time.perf_counter()
+        try:
+            pool.run(time.sleep, 30, timeout=0.5)
+            assert False, "Debería haber excedido el tiempo máximo"
+        except JobTimeoutError:
+            pass
+        assert time.perf_counter() - inicio < 5, "El trabajo no se terminó a tiempo"
+        assert pool.run(math.sqrt, 16) == 4.0
+
+        # Las excepciones del trabajo se relanzan en el llamador
+        try:
+            pool.run(math.sqrt, -1)
+            assert False, "Debería relanzar el ValueError"
+        except ValueError:
+            pass
+
+        # Reciclado: tras max_jobs_per_worker trabajos cambia el proceso
+        pids = [pool.run(os.getpid) for _ in range(4)]
+        assert pids[0] == pids[1] and pids[2] == pids[3] and pids[1] != pids[2], pids
+
+        # El arranque de un proceso nuevo (importar numpy y scipy) no cuenta
+        # para el tiempo máximo del trabajo
+        frio = CalculationPool(processes=1, timeout=0.3)
+        try:
+            assert frio.run(math.sqrt, 25) == 5.0
+        finally:
+            frio.close()
+
+        # Un trabajo cancelado se termina con su proceso
+        evento = threading.Event()
+        threading.Timer(0.3, evento.set).start()
+        inicio = time.perf_counter()
+        try:
+            with cancellable(evento):
+                pool.run(time.sleep, 30)
+            assert False, "Debería haberse cancelado"
+        except JobCancelledError:
+            pass
+        assert time.perf_counter() - inicio < 5, "El trabajo no se canceló a tiempo"
+        assert pool.run(math.sqrt, 16) == 4.0
+
+        # Con el único lugar ocupado, los demás trabajos se rechazan de inmediato
+        ocupado = threading.Thread(target=pool.run, args=(time.sleep, 1))
+        ocupado.start()
+        time.sleep(0.2)
+        try:
+            pool.run(math.sqrt, 4)
+            assert False, "Debería rechazar el trabajo"
+        except PoolFullError:
+            pass
+
+        # ...y el endpoint responde 503
+        original = modulo_app.calculation_pool
+        modulo_app.calculation_pool = pool
+        try:
+            respuesta = app.test_client().post('/calculate', json={
+                'function': 'x * y + 1', 'a': 0, 'b': 1, 'c': 0, 'd': 1, 'resolution': 20})
+        finally:
+            modulo_app.calculation_pool = original
+        assert respuesta.status_code == 503, respuesta.get_json()
+        assert respuesta.headers.get('Retry-After')
+        ocupado.join()
+    finally:
+        pool.close()
+
+    print("✓ Pool de procesos funciona correctamente\n")
+
+
+def test_calculo_por_lotes():
+    """/calculate/batch devuelve un resultado NDJSON por trabajo en ambas aplicaciones."""
+    print("Test 4: Cálculo por lotes...")
+    from webapp.app import app as webapp
+
+    jobs = [
+        {'function': 'x * y', 'a': 0, 'b': 2, 'c': 0, 'd': 3},
+        {'function': 'x*y', 'a': 0, 'b': 2, 'c': 0, 'd': 3},
+        {'function': 'import os', 'a': 0, 'b': 1, 'c': 0, 'd': 1},
+        {'function': 'exp(x)', 'a': 0, 'b': 1, 'c': 0, 'd': 1},
+    ]
+    for aplicacion in (app, webapp):
+        cliente = aplicacion.test_client()
+        respuesta = cliente.post('/calculate/batch', json={'jobs': jobs})
+        assert respuesta.status_code == 200
+        assert respuesta.mimetype == 'application/x-ndjson'
+        lineas = leer_ndjson(respuesta)
+        resultados = {r['index']: r for r in lineas}
+        assert len(lineas) == len(jobs) and sorted(resultados) == [0, 1, 2, 3]
+        assert abs(resultados[0]['volume'] - 9) < 1e-8 and resultados[1]['volume'] == resultados[0]['volume']
+        assert abs(resultados[3]['volume'] - (np.e - 1)) < 1e-8
+        assert not resultados[2]['success'] and 'parsear' in resultados[2]['message']
+
+        # Un segundo lote idéntico sale de la caché
+        respuesta = cliente.post('/calculate/batch', json={'jobs': jobs[:1]})
+        assert leer_ndjson(respuesta)[0]['cached'] is True
+
+        # Request mal formado
+        respuesta = cliente.post('/calculate/batch', json={'jobs': 'x'})
+        assert respuesta.status_code == 400
+
+    print("✓ Cálculo por lotes funciona correctamente\n")
+
+
+def test_niveles():
+    """El parámetro level devuelve la malla del nivel pedido de la pirámide."""
+    print("Test 6: Niveles de la pirámide...")
+    from webapp.app import app as webapp
+
+    datos = {'function': 'x**2 - y**2', 'a': -2, 'b': 2, 'c': -2, 'd': 2}
+    cliente = app.test_client()
+    for nivel, puntos in ((0, 17), (3, 129)):
+        respuesta = cliente.post('/calculate', json={**datos, 'level': nivel, 'format': 'base64'})
+        assert respuesta.status_code == 200, respuesta.get_json()
+        resultado = respuesta.get_json()
+        assert resultado['level'] == nivel and resultado['max_level'] == 3
+        assert len(resultado['x']) == puntos and decode_array(resultado['z']).shape == (puntos, puntos)
+    assert cliente.post('/calculate', json={**datos, 'level': 4}).status_code == 400
+    assert cliente.post('/calculate', json={**datos, 'level': 1, 'format': 'ndjson'}).status_code == 400
+
+    cliente = webapp.test_client()
+    respuesta = cliente.post('/calculate', data={**datos, 'level': 2})
+    assert respuesta.status_code == 200, respuesta.get_json()
+    assert len(respuesta.get_json()['grid']['x']) == 65
+    assert cliente.post('/calculate', data={**datos, 'level': 'x'}).status_code == 400
+
+    print("✓ Niveles de la pirámide funcionan correctamente\n")
+
+
+def test_teselas_web():
+    """/calculate/tiles reutiliza las teselas al desplazar la vista en ambas aplicaciones."""
+    print("Test 7: Teselas...")
+    from webapp.app import app as webapp
+
+    for aplicacion in (app, webapp):
+        cliente = aplicacion.test_client()
+        datos = {'function': 'exp(-(x**2 + y**2))', 'a': -2, 'b': 2, 'c': -2, 'd': 2}
+        primera = cliente.post('/calculate/tiles', json=datos).get_json()
+        segunda = cliente.post('/calculate/tiles', json={**datos, 'a': -1, 'b': 3}).get_json()
+        assert abs(primera['volume'] - 3.1122703197) < 1e-8, primera
+        assert segunda['tiles']['cached'] > 0 and segunda['tiles']['computed'] < primera['tiles']['total']
+        z = segunda['z'] if aplicacion is app else segunda['grid']['z']
+        assert decode_array(z).ndim == 2
+        assert cliente.post('/calculate/tiles', json={**datos, 'a': 3}).status_code == 400
+
+        # Valores no finitos en el dominio y dominios fuera de la retícula: 400
+        for invalido in ({'function': 'sqrt(x) + y', 'a': -1, 'b': 4, 'c': 0, 'd': 1},
+                         {**datos, 'a': -1e308, 'b': 1e308},
+                         {**datos, 'a': 0, 'b': 1e-310}):
+            respuesta = cliente.post('/calculate/tiles', json=invalido)
+            assert respuesta.status_code == 400, (invalido, respuesta.get_json())
+
+    # Con el pool, las integrales se calculan ahí y respetan su tiempo máximo
+    import webapp.app as modulo_webapp
+    lenta = {'function': 'abs(sin(1/(x*y+1e-6)))', 'a': -1, 'b': 1, 'c': -1, 'd': 1}
+    for pool, esperado in ((CalculationPool(processes=1, timeout=30), 200),
+                           (CalculationPool(processes=1, timeout=0.02), 504)):
+        for modulo in (modulo_app, modulo_webapp):
+            original = modulo.calculation_pool
+            modulo.calculation_pool = pool
+            modulo.tile_cache.clear()
+            try:
+                respuesta = modulo.app.test_client().post('/calculate/tiles', json=lenta)
+            finally:
+                modulo.calculation_pool = original
+            assert respuesta.status_code == esperado, respuesta.get_json()
+            if esperado == 200:
+                assert abs(respuesta.get_json()['volume'] - 2.6704) < 1e-3
+        pool.close()
+
+    print("✓ Teselas funcionan correctamente\n")
+
+
+def test_malla_adaptativa_web():
+    """format='mesh' / output='mesh' devuelven una malla de triángulos adaptativa."""
+    print("Test 8: Malla adaptativa...")
+    from webapp.app import app as webapp
+
+    datos = {'function': 'exp(-50*(x**2 + y**2))', 'a': -2, 'b': 2, 'c': -2, 'd': 2}
+    respuestas = (
+        app.test_client().post('/calculate', json={**datos, 'resolution': 60, 'format': 'mesh'}),
+        webapp.test_client().post('/calculate', data={**datos, 'num_points': 60, 'output': 'mesh'}),
+    )
+    for respuesta in respuestas:
+        assert respuesta.status_code == 200, respuesta.get_json()
+        resultado = respuesta.get_json()
+        x, z = decode_array(resultado['mesh']['x']), decode_array(resultado['mesh']['z'])
+        caras = decode_array(resultado['mesh']['faces'])
+        assert caras.dtype == np.int32 and caras.shape[1] == 3 and caras.max() < len(x)
+        assert len(x) == len(z) <= 60 * 60
+        assert abs(resultado['volume'] - np.pi / 50) < 1e-8
+
+    print("✓ Malla adaptativa funciona correctamente\n")
+
+
+def leer_ndjson(respuesta):
+    """Registros de una respuesta NDJSON."""
+    return [json.loads(linea) for linea in respuesta.data.decode().splitlines()]
+
+
+def test_malla_por_bandas():
+    """format='ndjson' / output='stream' envían la malla por bandas y el volumen al final."""
+    print("Test 5: Malla por bandas...")
+    from webapp.app import app as webapp
+
+    datos = {'function': 'sin(x) * cos(y)', 'a': 0, 'b': 3, 'c': -1, 'd': 1}
+    completa = app.test_client().post('/calculate', json={**datos, 'resolution': 40,
+                                                          'format': 'base64'}).get_json()
+
+    for cliente, extra in ((app.test_client(), {'resolution': 40, 'format': 'ndjson'}),
+                           (webapp.test_client(), {'num_points': 40, 'output': 'stream'})):
+        respuesta = cliente.post('/calculate', json={**datos, **extra})
+        assert respuesta.status_code == 200 and respuesta.mimetype == 'application/x-ndjson'
+        registros = leer_ndjson(respuesta)
+        assert registros[0]['type'] == 'grid' and registros[-1]['type'] == 'volume'
+        assert registros[0]['x'] == completa['x']
+        Z = np.vstack([decode_array(r['z']) for r in registros if r['type'] == 'band'])
+        assert np.array_equal(Z, decode_array(completa['z'])), "Las bandas no coinciden"
+        assert abs(registros[-1]['volume'] - completa['volume']) < 1e-12
+
+    # La resolución alta solo se admite por bandas
+    cliente = app.test_client()
+    respuesta = cliente.post('/calculate', json={**datos, 'resolution': 600})
+    assert respuesta.status_code == 400
+    respuesta = cliente.post('/calculate', json={**datos, 'resolution': 600, 'format': 'ndjson'})
+    bandas = [r for r in leer_ndjson(respuesta) if r['type'] == 'band']
+    assert sum(r['z']['shape'][0] for r in bandas) == 600 and len(bandas) > 1
+
+    # Valores no finitos a mitad del stream: registro de error en app.py
+    respuesta = cliente.post('/calculate', json={'function': 'sqrt(y)', 'a': 0, 'b': 1, 'c': -1,
+                                                 'd': 2, 'resolution': 30, 'format': 'ndjson'})
+    final = leer_ndjson(respuesta)[-1]
+    assert final['type'] == 'error' and not final['success']
+
+    print("✓ Malla por bandas funciona correctamente\n")
+
+
+async def llamar_asgi(datos, desconectar=None, metodo='POST', ruta='/calculate'):
+    """
+    Llama a asgi.app con receive/send simulados.
+    
+    Args:
+        datos: Cuerpo JSON del request
+        desconectar: Segundos tras los que el cliente se desconecta (None
+            para no desconectarse)
+    
+    Returns:
+        tuple: (código de estado o None si no hubo respuesta, encabezados, cuerpo)
+    """
+    import asgi
+
+    mensajes = [{'type': 'http.request', 'body': json.dumps(datos).encode()}]
+    enviados = []
+
+    async def receive():
+        if mensajes:
+            return mensajes.pop(0)
+        if desconectar is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(desconectar)
+        return {'type': 'http.disconnect'}
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    await asgi.app({'type': 'http', 'method': metodo, 'path': ruta, 'headers': []},
+                   receive, send)
+    if not enviados:
+        return None, {}, b''
+    encabezados = {k.decode(): v.decode() for k, v in enviados[0]['headers']}
+    return enviados[0]['status'], encabezados, b''.join(m.get('body', b'') for m in enviados[1:])
+
+
+def test_asgi():
+    """asgi.py responde como app.py, comparte los cálculos en curso y cancela al desconectarse."""
+    print("Test 10: Punto de entrada ASGI...")
+    import asgi
+
+    # Mismo contrato que app.py, incluidos los errores
+    cliente = app.test_client()
+    datos = {'function': 'sin(x) * cos(y)', 'a': 0, 'b': 3, 'c': -1, 'd': 1, 'resolution': 30}
+    for caso in (datos, {**datos, 'format': 'base64'}, {**datos, 'format': 'mesh'},
+                 {**datos, 'level': 1, 'resolution': None}, {**datos, 'a': 5},
+                 {**datos, 'format': 'xml'}, {**datos, 'function': 'import os'},
+                 {'function': 'x'}, {**datos, 'resolution': 'x'}):
+        esperada = cliente.post('/calculate', json=caso)
+        status, encabezados, cuerpo = asyncio.run(llamar_asgi(caso))
+        assert status == esperada.status_code, (caso, status, cuerpo)
+        assert encabezados['content-type'] == 'application/json'
+        assert json.loads(cuerpo) == esperada.get_json(), caso
+
+    status, encabezados, cuerpo = asyncio.run(llamar_asgi({**datos, 'format': 'ndjson'}))
+    assert status == 200 and encabezados['content-type'] == 'application/x-ndjson'
+    esperada = cliente.post('/calculate', json={**datos, 'format': 'ndjson'})
+    assert cuerpo == esperada.data
+    assert asyncio.run(llamar_asgi(None, metodo='GET', ruta='/x'))[0] == 404
+    assert 'in_flight' in json.loads(asyncio.run(llamar_asgi(None, metodo='GET',
+                                                             ruta='/cache/stats'))[2])
+
+    # Requests idénticos concurrentes: un solo cálculo
+    original = asgi._calcular_json
+    llamadas = []
+
+    def lento(params, *args):
+        llamadas.append(params['func'].expresion)
+        time.sleep(0.3)
+        return original(params, *args)
+
+    async def concurrentes(casos, desconectar=None):
+        return await asyncio.gather(*(llamar_asgi(caso, d) for caso, d in zip(casos, desconectar)))
+
+    asgi._calcular_json = lento
+    try:
+        antes = asgi.in_flight.stats()
+        casos = [{**datos, 'function': 'x*y + 2'}] * 3 + [{**datos, 'function': 'x * y+2'},
+                                                           {**datos, 'function': 'x*y + 3'}]
+        respuestas = asyncio.run(concurrentes(casos, [None] * 5))
+        assert all(r[0] == 200 for r in respuestas)
+        assert len({r[2] for r in respuestas[:4]}) == 1 and respuestas[4][2] != respuestas[0][2]
+        assert sorted(llamadas) == ['x * y + 2', 'x * y + 3'], llamadas
+        stats = asgi.in_flight.stats()
+        assert stats['coalesced'] - antes['coalesced'] == 3 and stats['in_flight'] == 0
+
+        # Si un cliente se desconecta, los demás siguen esperando el cálculo...
+        llamadas.clear()
+        caso = {**datos, 'function': 'x*y + 4'}
+        respuestas = asyncio.run(concurrentes([caso, caso], [0.1, None]))
+        assert respuestas[0][0] is None and respuestas[1][0] == 200
+        assert len(llamadas) == 1 and asgi.in_flight.stats()['cancelled'] == stats['cancelled']
+
+        # ...y si se desconectan todos se deja de esperar, pero un cálculo
+        # que ya empezó en el hilo (sin pool) no se cuenta como cancelado
+        respuestas = asyncio.run(concurrentes([{**datos, 'function': 'x*y + 5'}] * 2, [0.1, 0.1]))
+        assert all(r[0] is None for r in respuestas)
+        assert asgi.in_flight.stats()['cancelled'] == stats['cancelled']
+    finally:
+        asgi._calcular_json = original
+
+    # Con el pool de procesos, el trabajo en curso se termina al desconectarse todos
+    pool = CalculationPool(processes=1, timeout=30)
+    original = modulo_app.calculation_pool
+    modulo_app.calculation_pool = pool
+    caso = {**datos, 'function': 'abs(sin(1/(x*y+1e-6)))', 'a': -1, 'b': 1}
+    antes = asgi.in_flight.stats()['cancelled']
+
+    async def desconectados():
+        respuestas = await concurrentes([caso, caso], [0.3, 0.3])
+        # El cálculo termina (y se cuenta) en cuanto el pool nota la cancelación
+        for _ in range(100):
+            if asgi.in_flight.stats()['cancelled'] > antes:
+                break
+            await asyncio.sleep(0.05)
+        return respuestas
+
+    try:
+        inicio = time.perf_counter()
+        respuestas = asyncio.run(desconectados())
+        assert all(r[0] is None for r in respuestas)
+        assert asgi.in_flight.stats()['cancelled'] == antes + 1
+        assert time.perf_counter() - inicio < 3, "El trabajo del pool no se terminó"
+        assert pool.run(math.sqrt, 9) == 3.0
+    finally:
+        modulo_app.calculation_pool = original
+        pool.close()
+
+    # Con format='ndjson' se deja de evaluar tras la desconexión
+    original = modulo_app.stream_surface_ndjson
+    bandas = []
+
+    def por_bandas(func, a, b, c, d, resolution):
+        for i in range(100):
+            time.sleep(0.02)
+            bandas.append(i)
+            yield json.dumps({'type': 'band', 'index': i}) + '\n'
+
+    modulo_app.stream_surface_ndjson = por_bandas
+    try:
+        status, _, cuerpo = asyncio.run(llamar_asgi({**datos, 'format': 'ndjson'},
+                                                    desconectar=0.5))
+    finally:
+        modulo_app.stream_surface_ndjson = original
+    assert status == 200 and 0 < len(cuerpo.decode().splitlines()) <= len(bandas) < 100
+
+    print("✓ Punto de entrada ASGI funciona correctamente\n")
+
+
+def test_calculos_compartidos():
+    """Requests /calculate idénticos y simultáneos comparten un solo cálculo en ambas aplicaciones."""
+    print("Test 11: Cálculos compartidos...")
+    import webapp.app as modulo_webapp
+
+    datos = {'function': 'x*y + 8', 'a': 0, 'b': 1, 'c': 0, 'd': 1}
+    for modulo, extra in ((modulo_app, {'resolution': 30}), (modulo_webapp, {'num_points': 30})):
+        cache = modulo.result_cache
+        original = cache._surface
+        llamadas = []
+
+        def lenta(*args):
+            llamadas.append(args)
+            time.sleep(0.3)
+            return original(*args)
+
+        cache._surface = lenta
+        try:
+            antes = cache.stats()['single_flight']
+            respuestas = []
+            hilos = [threading.Thread(target=lambda: respuestas.append(
+                modulo.app.test_client().post('/calculate', json={**datos, **extra})))
+                for _ in range(4)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        finally:
+            del cache._surface
+        assert [r.status_code for r in respuestas] == [200] * 4
+        assert len(llamadas) == 1, f"{len(llamadas)} cálculos en {modulo.__name__}"
+        stats = modulo.app.test_client().get('/cache/stats').get_json()['single_flight']
+        assert stats['coalesced'] - antes['coalesced'] == 3 and 0 < stats['coalescing_ratio'] <= 1
+
+    print("✓ Cálculos compartidos funcionan correctamente\n")
+
+
+def test_tiempos_por_etapa():
+    """Server-Timing, debug_timings (también con el pool de procesos) y perfiles de requests lentos."""
+    print("Test 12: Tiempos por etapa...")
+    import tempfile
+    import tiempos
+    import webapp.app as modulo_webapp
+
+    # Sin solución simbólica ni separable: integración numérica con neval
+    datos = {'function': 'exp(-(x**2 + y**2)) * cos(x*y)', 'a': -1, 'b': 1, 'c': -1, 'd': 1,
+             'debug_timings': True}
+    pool = CalculationPool(processes=1, timeout=30)
+    try:
+        casos = [(modulo_app, {'resolution': 30}, None), (modulo_app, {'resolution': 30}, pool),
+                 (modulo_webapp, {'num_points': 30}, None)]
+        for modulo, extra, pool_caso in casos:
+            original = modulo.calculation_pool
+            modulo.calculation_pool = pool_caso
+            modulo.result_cache.clear()
+            try:
+                respuesta = modulo.app.test_client().post('/calculate', json={**datos, **extra})
+            finally:
+                modulo.calculation_pool = original
+            assert respuesta.status_code == 200, respuesta.get_json()
+
+            metricas = [m.split(';')[0] for m in respuesta.headers['Server-Timing'].split(', ')]
+            for nombre in ('parse', 'probe', 'grid', 'integration', 'serialization', 'json',
+                           'neval', 'points', 'total'):
+                assert nombre in metricas, f"{nombre} no está en {metricas}"
+            assert ('pool' in metricas) == (pool_caso is not None), metricas
+
+            debug = respuesta.get_json()['debug_timings']
+            assert debug['counts']['neval'] > 0 and debug['counts']['points'] == 30 * 30
+            assert all(ms >= 0 for ms in debug['stages_ms'].values())
+            assert sum(debug['stages_ms'].values()) <= debug['total_ms'] + 1e-3
+
+        # Sin debug_timings la respuesta no cambia, pero el encabezado sigue
+        respuesta = app.test_client().post('/calculate', json={**datos, 'resolution': 30,
+                                                              'debug_timings': False})
+        assert 'debug_timings' not in respuesta.get_json()
+        assert 'total;dur=' in respuesta.headers['Server-Timing']
+    finally:
+        pool.close()
+
+    # asgi.py: los mismos tiempos, también en los requests que comparten el
+    # cálculo; los que no piden debug_timings no comparten su respuesta
+    import asgi
+    modulo_app.result_cache.clear()
+    casos = [{**datos, 'resolution': 30}] * 2 + [{**datos, 'resolution': 30,
+                                                  'debug_timings': False}]
+
+    async def concurrentes():
+        return await asyncio.gather(*(llamar_asgi(caso) for caso in casos))
+
+    original = asgi._calcular_json
+
+    def lento(*args):
+        time.sleep(0.3)
+        return original(*args)
+
+    asgi._calcular_json = lento
+    try:
+        antes = asgi.in_flight.stats()['coalesced']
+        respuestas = asyncio.run(concurrentes())
+    finally:
+        asgi._calcular_json = original
+    assert asgi.in_flight.stats()['coalesced'] - antes == 1
+    for (status, encabezados, cuerpo), caso in zip(respuestas, casos):
+        assert status == 200
+        metricas = [m.split(';')[0] for m in encabezados['server-timing'].split(', ')]
+        assert 'parse' in metricas and 'total' in metricas, metricas
+        resultado = json.loads(cuerpo)
+        assert ('debug_timings' in resultado) == caso['debug_timings'], resultado.keys()
+        if caso['debug_timings']:
+            # El cálculo compartido (el tercero sale de la caché de resultados)
+            for nombre in ('probe', 'grid', 'integration', 'json', 'neval', 'points'):
+                assert nombre in metricas, f"{nombre} no está en {metricas}"
+            debug = resultado['debug_timings']
+            assert debug['counts']['neval'] > 0 and debug['counts']['points'] == 30 * 30
+            assert 'parse' in debug['stages_ms'] and 'json' not in debug['stages_ms']
+    status, encabezados, _ = asyncio.run(llamar_asgi({**datos, 'function': 'import os'}))
+    assert status == 400 and 'total;dur=' in encabezados['server-timing']
+
+    # Perfiles de los requests que superan el umbral
+    with tempfile.TemporaryDirectory() as directorio:
+        tiempos.profiler = tiempos.RequestProfiler(threshold_ms=0, directory=directorio)
+        try:
+            respuesta = app.test_client().post('/calculate', json={**datos, 'resolution': 30})
+        finally:
+            perfilador, tiempos.profiler = tiempos.profiler, None
+        assert respuesta.status_code == 200
+        archivos = os.listdir(directorio)
+        assert perfilador.dumped == 1 and len(archivos) == 1, archivos
+        assert archivos[0].endswith('-POST_calculate.prof'), archivos
+
+    print("✓ Tiempos por etapa funcionan correctamente\n")
+
+
+# Bibliotecas de gráficos que los workers web no deben cargar al arrancar
+MODULOS_PESADOS = ('matplotlib', 'mpl_toolkits', 'plotly')
+
+
+def medir_importacion(modulo):
+    """
+    Importa el módulo en un intérprete nuevo con `python -X importtime`.
+    
+    Returns:
+        dict {módulo importado: tiempo acumulado en microsegundos}
+    """
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+    tiempos = {}
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        tiempos[nombre.strip()] = int(acumulado)
+    return tiempos
+
+
+def test_tiempo_importacion():
+    """Los puntos de entrada web no importan matplotlib ni plotly."""
+    print("Test 9: Tiempo de importación de los puntos de entrada web...")
+    
+    for modulo in ('app', 'webapp.app'):
+        tiempos = medir_importacion(modulo)
+        pesados = sorted(m for m in tiempos if m.split('.')[0] in MODULOS_PESADOS)
+        assert not pesados, f"{modulo} importa bibliotecas de gráficos: {pesados[:5]}"
+        print(f"  {modulo}: {tiempos[modulo] / 1000:.0f} ms ({len(tiempos)} módulos) ✓")
+    
+    print("✓ Importación sin bibliotecas de gráficos\n")
+
+
+def run_all_tests():
+    """Ejecuta todas las pruebas."""
+    print("=" * 60)
+    print("PRUEBAS DE LAS APLICACIONES WEB")
+    print("=" * 60)
+    print()
+
+    try:
+        test_formato_base64()
+        test_webapp_datos()
+        test_pool_calculo()
+        test_calculo_por_lotes()
+        test_malla_por_bandas()
+        test_niveles()
+        test_teselas_web()
+        test_malla_adaptativa_web()
+        test_tiempo_importacion()
+        test_asgi()
+        test_calculos_compartidos()
+        test_tiempos_por_etapa()
+
+        print("=" * 60)
+        print("TODAS LAS PRUEBAS PASARON EXITOSAMENTE ✓")
+        print("=" * 60)
+        return 0
+
+    except AssertionError as e:
+        print(f"\n✗ PRUEBA FALLIDA: {e}")
+        return 1
+    except Exception as e:
+        print(f"\n✗ ERROR INESPERADO: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Tiempos por etapa de los requests y perfiles de los requests lentos.
+
+Mientras un request se atiende dentro de recording(), las funciones del
+núcleo anotan el tiempo de sus etapas (stage) y cuántas evaluaciones hacen
+(count): las etapas 'parse', 'probe', 'grid', 'integration', 'pool'
+(espera del pool de procesos), 'serialization' y 'json', y los contadores
+'neval' (evaluaciones de los integradores) y 'points' (puntos de las
+mallas). Las etapas anidadas no se cuentan dos veces: el tiempo de cada
+una excluye el de las que contiene. Fuera de recording() stage y count no
+hacen nada.
+
+Los trabajos que se ejecutan en el pool de procesos (ver ejecutor.py)
+devuelven sus tiempos junto con el resultado y se suman a los del request.
+
+El perfilado es opcional (ver profiler_from_env): cada request se ejecuta
+con cProfile y, si tarda más que el umbral, el perfil se guarda en un
+archivo .prof para verlo con `python -m pstats` o snakeviz.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import functools
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+
+_registro = contextvars.ContextVar('calculadora_tiempos', default=None)
+_NULO = contextlib.nullcontext()
+
+
+class StageTimings:
+    """Tiempos exclusivos por etapa y contadores de un request."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.inicio = time.perf_counter()
+        self._pila = []
+
+    def _acumular(self, ahora):
+        if self._pila:
+            nombre, desde = self._pila[-1]
+            self.stages[nombre] = self.stages.get(nombre, 0.0) + ahora - desde
+
+    @contextlib.contextmanager
+    def stage(self, nombre):
+        """Mide una etapa; el tiempo de la etapa que la contiene se pausa."""
+        ahora = time.perf_counter()
+        self._acumular(ahora)
+        self._pila.append([nombre, ahora])
+        try:
+            yield
+        finally:
+            ahora = time.perf_counter()
+            self._acumular(ahora)
+            self._pila.pop()
+            if self._pila:
+                self._pila[-1][1] = ahora
+
+    def count(self, nombre, n=1):
+        self.counts[nombre] = self.counts.get(nombre, 0) + n
+
+    def export(self):
+        """Etapas (en segundos) y contadores, serializables para enviarlos
+        desde otro proceso (ver absorb)."""
+        return {'stages': dict(self.stages), 'counts': dict(self.counts)}
+
+    def absorb(self, datos):
+        """Suma los tiempos y contadores exportados por otro proceso. Su
+        tiempo se descuenta de la etapa en curso, que lo estuvo esperando."""
+        for nombre, segundos in datos['stages'].items():
+            self.stages[nombre] = self.stages.get(nombre, 0.0) + segundos
+        for nombre, n in datos['counts'].items():
+            self.count(nombre, n)
+        if self._pila:
+            self._pila[-1][1] += sum(datos['stages'].values())
+
+    def as_dict(self):
+        """Tiempos en milisegundos, contadores y tiempo total hasta ahora."""
+        return {
+            'stages_ms': {nombre: round(s * 1000, 3) for nombre, s in self.stages.items()},
+            'counts': dict(self.counts),
+            'total_ms': round((time.perf_counter() - self.inicio) * 1000, 3),
+        }
+
+    def header(self):
+        """Valor del encabezado Server-Timing: una métrica por etapa con su
+        duración, una por contador y el total."""
+        metricas = [f'{nombre};dur={s * 1000:.3f}' for nombre, s in self.stages.items()]
+        metricas += [f'{nombre};desc="{n}"' for nombre, n in self.counts.items()]
+        metricas.append(f'total;dur={(time.perf_counter() - self.inicio) * 1000:.3f}')
+        return ', '.join(metricas)
+
+
+def stage(nombre):
+    """Context manager que mide la etapa en el request actual, si lo hay."""
+    registro = _registro.get()
+    return _NULO if registro is None else registro.stage(nombre)
+
+
+def count(nombre, n=1):
+    """Suma n al contador del request actual, si lo hay."""
+    registro = _registro.get()
+    if registro is not None:
+        registro.count(nombre, n)
+
+
+def current():
+    """StageTimings del request actual, o None."""
+    return _registro.get()
+
+
+def absorb(datos):
+    """Suma al request actual los tiempos exportados por otro proceso."""
+    registro = _registro.get()
+    if registro is not None and datos:
+        registro.absorb(datos)
+
+
+@contextlib.contextmanager
+def recording():
+    """Registra los tiempos de lo que se ejecuta dentro del bloque (en este
+    hilo o tarea) en un StageTimings nuevo."""
+    registro = StageTimings()
+    token = _registro.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro.reset(token)
+
+
+class RequestProfiler:
+    """
+    Perfila requests con cProfile y guarda en `directory` los que tardan
+    al menos `threshold_ms`. Solo se perfila una fracción `sample` de los
+    requests, y uno a la vez: cProfile mide un solo hilo y los requests
+    simultáneos se atienden sin perfilar.
+    """
+
+    def __init__(self, threshold_ms, directory, sample=1.0):
+        self.threshold_ms = threshold_ms
+        self.directory = directory
+        self.sample = sample
+        self.dumped = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def profile(self, nombre):
+        if random.random() >= self.sample or not self._lock.acquire(blocking=False):
+            yield
+            return
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        try:
+            perfil.enable()
+            try:
+                yield
+            finally:
+                perfil.disable()
+            ms = (time.perf_counter() - inicio) * 1000
+            if ms >= self.threshold_ms:
+                self._guardar(perfil, nombre, ms)
+        finally:
+            self._lock.release()
+
+    def _guardar(self, perfil, nombre, ms):
+        os.makedirs(self.directory, exist_ok=True)
+        archivo = '{}-{:.0f}ms-{}.prof'.format(time.strftime('%Y%m%d-%H%M%S'), ms,
+                                               re.sub(r'\W+', '_', nombre).strip('_'))
+        perfil.dump_stats(os.path.join(self.directory, archivo))
+        self.dumped += 1
+
+
+def profiler_from_env():
+    """
+    Crea el perfilador de las aplicaciones web según variables de entorno:
+
+    - CALCULADORA_PROFILE_MS: umbral en milisegundos a partir del cual se
+      guarda el perfil de un request (sin definir, no se perfila)
+    - CALCULADORA_PROFILE_DIR: directorio de los perfiles (por defecto,
+      calculadora-perfiles en el directorio temporal)
+    - CALCULADORA_PROFILE_SAMPLE: fracción de requests perfilados (por
+      defecto 1)
+
+    Returns:
+        RequestProfiler, o None si el perfilado está desactivado
+    """
+    umbral = os.environ.get('CALCULADORA_PROFILE_MS')
+    if not umbral:
+        return None
+    return RequestProfiler(
+        threshold_ms=float(umbral),
+        directory=os.environ.get('CALCULADORA_PROFILE_DIR',
+                                 os.path.join(tempfile.gettempdir(), 'calculadora-perfiles')),
+        sample=float(os.environ.get('CALCULADORA_PROFILE_SAMPLE', 1.0)),
+    )
+
+
+profiler = profiler_from_env()
+
+
+def timed_view(vista):
+    """
+    Decorador de vistas de Flask: registra los tiempos del request, los
+    agrega a la respuesta en el encabezado Server-Timing y, si el
+    perfilado está activo, perfila el request.
+    """
+    @functools.wraps(vista)
+    def envuelta(*args, **kwargs):
+        from flask import make_response, request
+
+        perfilado = _NULO if profiler is None else profiler.profile(
+            f'{request.method} {request.path}')
+        with recording() as registro, perfilado:
+            respuesta = make_response(vista(*args, **kwargs))
+        respuesta.headers['Server-Timing'] = registro.header()
+        return respuesta
+    return envuelta
@@ -5,19 +5,91 @@ Permite a los usuarios introducir funciones z = f(x,y) y obtener
 visualizaciones interactivas con Plotly.
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import numpy as np
-import plotly.graph_objects as go
-import plotly.io as pio
+import json
 import sys
 import os
 
-# Agregar el directorio padre al path para importar calculadora_3d
+# Agregar el directorio padre al path para importar el núcleo numérico
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from calculadora_3d import parse_function, calculate_volume
+from nucleo import level_points, max_level, parse_function, validate_job
+from cache import ResultCache
+from almacen import store_from_env
+from ejecutor import JobTimeoutError, PoolFullError, pool_from_env
+from serializacion import encode_grid, encode_mesh, encode_stream_record
+from mallado import adaptive_mesh
+from teselas import TileCache
+import tiempos
 
 app = Flask(__name__)
 
+# Resolución máxima con output='stream' (la malla se envía por bandas y
+# no se guarda completa en memoria)
+MAX_STREAM_POINTS = 1000
+
+# Nivel más fino de la pirámide de resoluciones (parámetro level)
+MAX_LEVEL = max_level(200)
+
+# Máximo de trabajos por request en /calculate/batch
+MAX_BATCH_JOBS = 100
+
+# Caché de resultados (presupuesto de memoria para mallas en MB), con el
+# almacén en disco compartido entre procesos si está configurado (ver
+# almacen.store_from_env)
+CACHE_MB = int(os.environ.get('CALCULADORA_CACHE_MB', 64))
+result_cache = ResultCache(grid_bytes=CACHE_MB * 2**20, store=store_from_env())
+
+# Caché de teselas para /calculate/tiles (presupuesto en MB)
+TILE_CACHE_MB = int(os.environ.get('CALCULADORA_TILE_CACHE_MB', 16))
+tile_cache = TileCache(max_bytes=TILE_CACHE_MB * 2**20)
+
+# Pool de procesos para los cálculos (ver ejecutor.pool_from_env)
+calculation_pool = pool_from_env()
+
+
+def render_plot_html(x, y, Z, func_str):
+    """
+    Genera el div HTML de un gráfico Plotly de la superficie en el servidor.
+    Solo se usa con output='html'; plotly se importa aquí para que los
+    workers que sirven datos no paguen su costo de importación.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    
+    # Crear figura Plotly
+    fig = go.Figure(data=[go.Surface(
+        x=x,
+        y=y,
+        z=Z,
+        colorscale='Viridis',
+        showscale=True,
+        hovertemplate='x: %{x:.3f}<br>y: %{y:.3f}<br>z: %{z:.3f}<extra></extra>'
+    )])
+    
+    # Configurar layout
+    fig.update_layout(
+        title={
+            'text': f'Superficie z = {func_str}',
+            'x': 0.5,
+            'xanchor': 'center'
+        },
+        scene=dict(
+            xaxis_title='X',
+            yaxis_title='Y',
+            zaxis_title='Z',
+            camera=dict(
+                eye=dict(x=1.5, y=1.5, z=1.3)
+            )
+        ),
+        autosize=True,
+        margin=dict(l=0, r=0, t=40, b=0),
+        height=600
+    )
+    
+    # Convertir a HTML div (sin incluir Plotly.js ya que se carga desde CDN)
+    return pio.to_html(fig, include_plotlyjs=False, full_html=False)
+
 
 @app.route('/')
 def index():
@@ -26,6 +98,7 @@ def index():
 
 
 @app.route('/calculate', methods=['POST'])
+@tiempos.timed_view
 def calculate():
     """
     Endpoint para calcular volumen y generar gráfico 3D.
@@ -36,13 +109,43 @@ def calculate():
     - a, b: Límites del dominio en x [a, b]
     - c, d: Límites del dominio en y [c, d]
     - num_points: Resolución de la malla (opcional, default 50)
+    - level: Nivel de la pirámide de resoluciones (opcional, reemplaza a
+      num_points), de 0 (17 puntos) a MAX_LEVEL; cada nivel duplica la
+      resolución del anterior reutilizando sus puntos ya evaluados
+    - output: 'data' (default) para recibir solo la malla, 'html' para
+      recibir el gráfico Plotly ya renderizado (compatibilidad),
+      'stream' para recibir la malla por bandas, o 'mesh' para recibir
+      una malla de triángulos con muestreo adaptativo
+    - encoding: 'base64' (default) o 'json', formato de la malla con
+      output='data'
+    - debug_timings (opcional): si es verdadero, la respuesta incluye los
+      tiempos por etapa (todas salvo 'json') y los contadores de
+      evaluaciones; el encabezado Server-Timing los incluye siempre
     
     Retorna JSON con:
     - volume: Volumen calculado
     - error: Error estimado
-    - plot_html: HTML div del gráfico Plotly
+    - volume_method: 'symbolic' (forma cerrada), 'grid', 'separable'
+      (integrales de una variable) o el método de integración de respaldo
+    - level, max_level: nivel devuelto y nivel más fino (si se pidió level)
+    - grid: con output='data', ejes 'x' e 'y' (listas 1-D) y 'z'; en
+      base64 z es un objeto {dtype, shape, data} con valores float32
+      (ver serializacion.py), en json es una lista de filas con null
+      para los valores no finitos
+    - plot_html: con output='html', HTML div del gráfico Plotly
+    - mesh: con output='mesh', vértices x, y, z (float32) y caras
+      (índices int32 n x 3) en base64 para un gráfico mesh3d, con a lo
+      sumo num_points x num_points puntos evaluados (ver mallado.py)
     O en caso de error:
     - error: Mensaje de error
+    
+    Con output='stream' (resolución hasta MAX_STREAM_POINTS) la respuesta
+    es un stream NDJSON que se escribe a medida que se evalúa la malla:
+    {type: 'grid', x, y}, luego {type: 'band', row, z} con las filas en
+    base64 (NaN para los valores no finitos) y al final
+    {type: 'volume', volume, error, volume_method, function, domain}, o
+    {type: 'error', error}
+    si el cálculo falla a mitad.
     """
     try:
         # Obtener datos del request (form-encoded o JSON)
@@ -73,89 +176,136 @@ def calculate():
         if c >= d:
             return jsonify({'error': 'Debe cumplirse c < d'}), 400
         
-        # Obtener resolución (limitada a 20-200)
+        # Formato de la respuesta
+        output = data.get('output', 'data')
+        encoding = data.get('encoding', 'base64')
+        if output not in ('data', 'html', 'stream', 'mesh'):
+            return jsonify({'error': f'Valor de output no soportado: {output}'}), 400
+        if encoding not in ('base64', 'json'):
+            return jsonify({'error': f'Valor de encoding no soportado: {encoding}'}), 400
+        
+        # Obtener resolución (limitada a 20-200, o 20-MAX_STREAM_POINTS por bandas)
+        max_points = MAX_STREAM_POINTS if output == 'stream' else 200
         try:
             num_points = int(data.get('num_points', 50))
-            num_points = max(20, min(200, num_points))
+            num_points = max(20, min(max_points, num_points))
         except (ValueError, TypeError):
             num_points = 50
         
+        # Nivel de la pirámide, que determina la resolución
+        level = data.get('level')
+        if level in ('', None):
+            level = None
+        else:
+            try:
+                level = int(level)
+            except (ValueError, TypeError):
+                return jsonify({'error': 'El nivel debe ser un número entero'}), 400
+            if output == 'stream':
+                return jsonify({'error': 'El parámetro level no se admite con output=stream'}), 400
+            if not 0 <= level <= MAX_LEVEL:
+                return jsonify({'error': f'El nivel debe estar entre 0 y {MAX_LEVEL}'}), 400
+            num_points = level_points(level)
+        
         # Parsear función usando la función existente
         try:
-            func = parse_function(func_str)
+            with tiempos.stage('parse'):
+                func = parse_function(func_str)
         except Exception as e:
             return jsonify({'error': f'Error al parsear la función: {str(e)}'}), 400
         
         # Validar función con un punto de prueba
         try:
-            test_val = func((a + b) / 2, (c + d) / 2)
+            with tiempos.stage('probe'):
+                test_val = func((a + b) / 2, (c + d) / 2)
             if not np.isfinite(test_val):
                 return jsonify({'error': 'La función produce valores no finitos en el dominio'}), 400
         except Exception as e:
             return jsonify({'error': f'Error al evaluar la función: {str(e)}'}), 400
         
-        # Calcular volumen usando la función existente
+        if output == 'stream':
+            return Response(stream_surface_ndjson(func, func_str, a, b, c, d, num_points),
+                            mimetype='application/x-ndjson')
+        
+        if output == 'mesh':
+            try:
+                with tiempos.stage('grid'):
+                    malla = adaptive_mesh(func, a, b, c, d, max_points=num_points**2)
+                tiempos.count('points', len(malla['z']))
+                volume, error, volume_method = result_cache.volume(func, a, b, c, d,
+                                                                   pool=calculation_pool)
+            except PoolFullError:
+                return jsonify({'error': 'El servidor está ocupado, intente de nuevo en unos segundos'}), \
+                    503, {'Retry-After': '5'}
+            except JobTimeoutError as e:
+                return jsonify({'error': str(e)}), 504
+            except Exception as e:
+                return jsonify({'error': f'Error al calcular el volumen: {str(e)}'}), 500
+            
+            with tiempos.stage('serialization'):
+                mesh = encode_mesh(malla['x'], malla['y'], malla['z'], malla['faces'])
+            return _respuesta({
+                'volume': float(volume),
+                'error': float(error),
+                'volume_method': volume_method,
+                'mesh': mesh,
+                'function': func_str,
+                'domain': {'a': a, 'b': b, 'c': c, 'd': d}
+            }, data)
+        
+        # Generar la malla y calcular el volumen evaluando la función una
+        # sola vez (con integración adaptativa solo como respaldo), o
+        # reutilizarlos desde la caché
         try:
-            volume, error = calculate_volume(func, a, b, c, d)
+            if level is not None:
+                superficie = result_cache.level(func, a, b, c, d, level,
+                                                pool=calculation_pool)
+            else:
+                superficie = result_cache.surface(func, a, b, c, d, num_points,
+                                                  pool=calculation_pool)
+        except PoolFullError:
+            return jsonify({'error': 'El servidor está ocupado, intente de nuevo en unos segundos'}), \
+                503, {'Retry-After': '5'}
+        except JobTimeoutError as e:
+            return jsonify({'error': str(e)}), 504
         except Exception as e:
             return jsonify({'error': f'Error al calcular el volumen: {str(e)}'}), 500
         
-        # Generar superficie 3D con Plotly
+        volume, error = superficie['volume'], superficie['error']
+        
+        # Preparar los datos del gráfico
         try:
-            # Crear meshgrid
-            x = np.linspace(a, b, num_points)
-            y = np.linspace(c, d, num_points)
-            X, Y = np.meshgrid(x, y)
-            
-            # Evaluar función
-            Z = func(X, Y)
+            Z = superficie['z']
             
             # Verificar valores finitos
             if not np.all(np.isfinite(Z)):
                 # Reemplazar valores no finitos con NaN para visualización
                 Z = np.where(np.isfinite(Z), Z, np.nan)
             
-            # Crear figura Plotly
-            fig = go.Figure(data=[go.Surface(
-                x=X,
-                y=Y,
-                z=Z,
-                colorscale='Viridis',
-                showscale=True,
-                hovertemplate='x: %{x:.3f}<br>y: %{y:.3f}<br>z: %{z:.3f}<extra></extra>'
-            )])
-            
-            # Configurar layout
-            fig.update_layout(
-                title={
-                    'text': f'Superficie z = {func_str}',
-                    'x': 0.5,
-                    'xanchor': 'center'
-                },
-                scene=dict(
-                    xaxis_title='X',
-                    yaxis_title='Y',
-                    zaxis_title='Z',
-                    camera=dict(
-                        eye=dict(x=1.5, y=1.5, z=1.3)
-                    )
-                ),
-                autosize=True,
-                margin=dict(l=0, r=0, t=40, b=0),
-                height=600
-            )
-            
-            # Convertir a HTML div (sin incluir Plotly.js ya que se carga desde CDN)
-            plot_html = pio.to_html(fig, include_plotlyjs=False, full_html=False)
+            with tiempos.stage('serialization'):
+                if output == 'html':
+                    plot_data = {'plot_html': render_plot_html(superficie['x'], superficie['y'], Z,
+                                                               func_str)}
+                elif encoding == 'base64':
+                    plot_data = {'grid': encode_grid(superficie['x'], superficie['y'], Z)}
+                else:
+                    plot_data = {'grid': {
+                        'x': superficie['x'].tolist(),
+                        'y': superficie['y'].tolist(),
+                        # JSON no admite NaN: los valores no finitos se envían como null
+                        'z': np.where(np.isfinite(Z), Z, None).tolist()
+                    }}
             
         except Exception as e:
             return jsonify({'error': f'Error al generar el gráfico: {str(e)}'}), 500
         
         # Retornar resultados
-        return jsonify({
+        return _respuesta({
             'volume': float(volume),
             'error': float(error),
-            'plot_html': plot_html,
+            'volume_method': superficie['volume_method'],
+            **({'level': level, 'max_level': MAX_LEVEL} if level is not None else {}),
+            **plot_data,
             'function': func_str,
             'domain': {
                 'a': a,
@@ -163,12 +313,136 @@ def calculate():
                 'c': c,
                 'd': d
             }
-        })
+        }, data)
         
     except Exception as e:
         # Error genérico no capturado
         return jsonify({'error': f'Error inesperado: {str(e)}'}), 500
 
 
+def _respuesta(resultado, data):
+    """Respuesta JSON de /calculate, con los tiempos por etapa si se pidió debug_timings."""
+    if str(data.get('debug_timings', '')).lower() in ('1', 'true', 'yes', 'on'):
+        resultado['debug_timings'] = tiempos.current().as_dict()
+    with tiempos.stage('json'):
+        return jsonify(resultado)
+
+
+def stream_surface_ndjson(func, func_str, a, b, c, d, num_points):
+    """Líneas NDJSON de /calculate con output='stream'."""
+    try:
+        for registro in result_cache.stream_surface(func, a, b, c, d, num_points,
+                                                    pool=calculation_pool):
+            if registro['type'] == 'band' and not np.all(np.isfinite(registro['z'])):
+                # Reemplazar valores no finitos con NaN para visualización
+                registro['z'] = np.where(np.isfinite(registro['z']), registro['z'], np.nan)
+            if registro['type'] == 'volume':
+                registro.update(function=func_str, domain={'a': a, 'b': b, 'c': c, 'd': d})
+            yield encode_stream_record(registro)
+    except Exception as e:
+        yield encode_stream_record({'type': 'error',
+                                    'error': f'Error al calcular el volumen: {str(e)}'})
+
+
+@app.route('/calculate/tiles', methods=['POST'])
+def calculate_tiles():
+    """
+    Endpoint para acercar o desplazar la vista sobre una superficie: la
+    malla y el volumen se obtienen de la caché de teselas (ver teselas.py)
+    y solo se calculan las teselas que faltan.
+    Acepta datos en formato form-encoded o JSON.
+    
+    Parámetros esperados:
+    - function: Expresión matemática z = f(x,y)
+    - a, b, c, d: Límites del dominio
+    
+    Retorna JSON con volume, error, volume_method ('tiles'), grid (ejes 1-D
+    de los nodos de la retícula dentro del dominio y z en base64), tiles (teselas 'total', 'cached',
+    'computed', 'composed', 'refined' y trozos de borde 'partial', 'partial_cached'),
+    function y domain.
+    O en caso de error:
+    - error: Mensaje de error
+    """
+    try:
+        data = request.get_json(silent=True) if request.is_json else request.form.to_dict()
+        try:
+            expresion, (a, b, c, d) = validate_job(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        func = parse_function(expresion)
+        try:
+            test_val = func((a + b) / 2, (c + d) / 2)
+            if not np.isfinite(test_val):
+                return jsonify({'error': 'La función produce valores no finitos en el dominio'}), 400
+        except Exception as e:
+            return jsonify({'error': f'Error al evaluar la función: {str(e)}'}), 400
+        
+        try:
+            superficie = tile_cache.surface(func, a, b, c, d, pool=calculation_pool)
+        except ValueError as e:
+            # Valores no finitos o dominio fuera de la retícula de teselas
+            return jsonify({'error': str(e)}), 400
+        except PoolFullError:
+            return jsonify({'error': 'El servidor está ocupado, intente de nuevo en unos segundos'}), \
+                503, {'Retry-After': '5'}
+        except JobTimeoutError as e:
+            return jsonify({'error': str(e)}), 504
+        except Exception as e:
+            return jsonify({'error': f'Error al calcular el volumen: {str(e)}'}), 500
+        
+        return jsonify({
+            'volume': superficie['volume'],
+            'error': superficie['error'],
+            'volume_method': superficie['volume_method'],
+            'grid': encode_grid(superficie['x'], superficie['y'], superficie['z']),
+            'tiles': superficie['tiles'],
+            'function': data['function'],
+            'domain': {'a': a, 'b': b, 'c': c, 'd': d}
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Error inesperado: {str(e)}'}), 500
+
+
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_batch():
+    """
+    Endpoint para calcular el volumen de varias combinaciones de función y
+    dominio en un solo request (sin gráficos).
+    
+    Parámetros esperados (JSON):
+    - jobs: Lista de objetos con function, a, b, c, d
+    
+    Retorna un stream NDJSON, una línea por trabajo en el orden en que
+    terminan, con index (posición en la lista), success y volume, error,
+    volume_method y cached, o message si ese trabajo falló.
+    """
+    data = request.get_json(silent=True)
+    jobs = data.get('jobs') if isinstance(data, dict) else None
+    if not isinstance(jobs, list):
+        return jsonify({'error': 'Se espera un objeto JSON con la lista de trabajos en "jobs"'}), 400
+    if len(jobs) > MAX_BATCH_JOBS:
+        return jsonify({'error': f'El máximo de trabajos por request es {MAX_BATCH_JOBS}'}), 400
+    
+    if calculation_pool is not None:
+        resultados = result_cache.volume_batch(jobs, executor=calculation_pool,
+                                               max_workers=calculation_pool.processes)
+    else:
+        resultados = result_cache.volume_batch(jobs, max_workers=1)
+    
+    def generar():
+        for resultado in resultados:
+            yield json.dumps(resultado) + '\n'
+    
+    return Response(generar(), mimetype='application/x-ndjson')
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Contadores de la caché de resultados y de los cálculos compartidos."""
+    return jsonify({**result_cache.stats(), 'tiles': tile_cache.stats()})
+
+
 if __name__ == '__main__':
     app.run(debug=True)